@@ -1,51 +1,119 @@
+import numpy as np
 from agents.base_agent import BaseAgent
+from tools.detections import Detections
 from utils.memory import SharedMemory
+from config import AGGREGATOR_MAX_FRAME_GAP, AGGREGATOR_REQUIRED_FRAMES
+
+def build_lookup_table(names, anomaly_mapping, anomaly_types):
+    """Class id -> index into anomaly_types (-1 = not an anomaly) for one model's names."""
+    anomaly_index = {anomaly: i for i, anomaly in enumerate(anomaly_types)}
+    table = np.full(max(names, default=-1) + 1, -1, dtype=np.int32)
+    for class_id, class_name in names.items():
+        anomaly = anomaly_mapping.get(class_name)
+        if anomaly is not None:
+            table[class_id] = anomaly_index[anomaly]
+    return table
+
+def anomaly_ids(class_ids, table):
+    """Anomaly index of every class id (-1 = not an anomaly) in one lookup."""
+    known = (class_ids >= 0) & (class_ids < len(table))
+    ids = np.full(len(class_ids), -1, dtype=np.int32)
+    ids[known] = table[class_ids[known]]
+    return ids
 
 class ConfidenceAggregatorAgent(BaseAgent):
-    def __init__(self):
+    stage = "aggregation"
+
+    # Mapping standard YOLO classes to our target anomalies for DEMO purposes
+    # In a real system, we would train a custom model.
+    ANOMALY_MAPPING = {
+        "person": "theft", # Simulating theft detection
+        "car": "accident", # Simulating accident
+        "fire hydrant": "fire", # Simulating fire
+        "bottle": "smoke", # Simulating smoke
+        "knife": "weapon",
+        "scissors": "weapon"
+    }
+
+    def __init__(self, camera_id=None, evidence=None, max_frame_gap=AGGREGATOR_MAX_FRAME_GAP):
         super().__init__("ConfidenceAggregatorAgent")
         self.memory = SharedMemory()
+        self.camera_id = camera_id # None = the default camera
+        self.evidence = evidence # EvidenceRecorder; None = caller already wrote snapshot_path
         self.consecutive_detections = {} # {class_name: count}
-        self.required_consecutive_frames = 3
+        self.required_consecutive_frames = AGGREGATOR_REQUIRED_FRAMES
+        # Frames dropped in between (e.g. live load shedding) mean the detections are no longer consecutive
+        self.max_frame_gap = max_frame_gap
+        self.last_frame_count = None
 
-    def run(self, detections, frame_count, snapshot_path):
-        current_classes = set()
-        
-        # Check for relevant anomalies
-        # Mapping standard YOLO classes to our target anomalies for DEMO purposes
-        # In a real system, we would train a custom model.
-        anomaly_mapping = {
-            "person": "theft", # Simulating theft detection
-            "car": "accident", # Simulating accident
-            "fire hydrant": "fire", # Simulating fire
-            "bottle": "smoke", # Simulating smoke
-            "knife": "weapon",
-            "scissors": "weapon"
-        }
+        self.anomaly_mapping = dict(self.ANOMALY_MAPPING)
+        self.anomaly_types = sorted(set(self.anomaly_mapping.values()))
+        self._lookup_tables = {} # {id(names): (names, class_id -> anomaly index array)}
+
+    def _lookup_table(self, names):
+        """Class id -> index into anomaly_types (-1 = not an anomaly), built once per model."""
+        cached = self._lookup_tables.get(id(names))
+        if cached is not None and cached[0] is names:
+            return cached[1]
+        table = build_lookup_table(names, self.anomaly_mapping, self.anomaly_types)
+        self._lookup_tables[id(names)] = (names, table)
+        return table
+
+    def run(self, detections, frame_count, snapshot_path=None):
+        if not isinstance(detections, Detections):
+            detections = Detections.from_dicts(detections)
 
         detected_anomalies = []
+        current_classes = set()
 
-        for det in detections:
-            cls_name = det["class"]
-            confidence = det["confidence"]
-            
-            # Map to target anomaly if applicable
-            anomaly_type = anomaly_mapping.get(cls_name)
-            
-            if anomaly_type:
+        if (self.max_frame_gap and self.last_frame_count is not None
+                and frame_count - self.last_frame_count > self.max_frame_gap):
+            if any(self.consecutive_detections.values()):
+                self.log(f"Frame gap {self.last_frame_count} -> {frame_count}; consecutive counts reset",
+                         sample_key="frame_gap")
+            self.consecutive_detections = {}
+        self.last_frame_count = frame_count
+
+        if len(detections):
+            # Map every detection to its anomaly in one lookup
+            ids = anomaly_ids(detections.class_ids, self._lookup_table(detections.names))
+            positions = np.flatnonzero(ids >= 0)
+        else:
+            positions = np.zeros(0, dtype=np.intp)
+
+        if len(positions):
+            # Candidate evidence: only frames with a potential anomaly are written
+            if self.evidence is not None and snapshot_path is None:
+                snapshot_path = self.evidence.save_snapshot(frame_count)
+
+            # Each matching detection counts once, as before; the incident is confirmed by the
+            # first detection (in detection order) that reaches the required count
+            hit_ids = ids[positions]
+            crossing = None # (detection position, anomaly_type)
+            for anomaly_id in np.unique(hit_ids):
+                anomaly_type = self.anomaly_types[anomaly_id]
+                hits = positions[hit_ids == anomaly_id]
+                previous = self.consecutive_detections.get(anomaly_type, 0)
+                self.consecutive_detections[anomaly_type] = previous + len(hits)
                 current_classes.add(anomaly_type)
-                
-                # Update consecutive count
-                self.consecutive_detections[anomaly_type] = self.consecutive_detections.get(anomaly_type, 0) + 1
-                
-                self.log(f"Potential {anomaly_type} detected (Count: {self.consecutive_detections[anomaly_type]})")
+
+                self.log(f"Potential {anomaly_type} detected (Count: {self.consecutive_detections[anomaly_type]})",
+                         sample_key=("potential", anomaly_type))
 
                 if self.consecutive_detections[anomaly_type] >= self.required_consecutive_frames:
-                    # Confirm incident
-                    if not self.memory.session_state["incident_confirmed"]:
-                        self.log(f"CONFIRMED INCIDENT: {anomaly_type}")
-                        incident_record = self.memory.confirm_incident(anomaly_type, confidence, snapshot_path)
-                        detected_anomalies.append(incident_record)
+                    position = hits[max(1, self.required_consecutive_frames - previous) - 1]
+                    if crossing is None or position < crossing[0]:
+                        crossing = (position, anomaly_type)
+
+            if crossing is not None and not self.memory.get_session(self.camera_id)["incident_confirmed"]:
+                # Confirm incident
+                position, anomaly_type = crossing
+                confidence = float(detections.confidences[position])
+                self.log(f"CONFIRMED INCIDENT: {anomaly_type}")
+                incident_record = self.memory.confirm_incident(anomaly_type, confidence, snapshot_path, self.camera_id)
+                if self.evidence is not None:
+                    self.evidence.record_incident(incident_record, frame_count)
+                detected_anomalies.append(incident_record)
             
         # Reset counts for classes not found in this frame
         for cls in list(self.consecutive_detections.keys()):
@@ -1,16 +1,72 @@
+import functools
+import inspect
+import time
 from abc import ABC, abstractmethod
-from utils.logger import setup_logger
+from utils.logger import setup_logger, LogSampler
+from utils.metrics import Metrics
+from config import METRICS_ENABLED
+
+def _timed_run(run, stage):
+    """Wrap an agent's run() so every call (or every yielded item, for generators) is timed."""
+    histogram = Metrics().histogram("stage_seconds", stage=stage)
+
+    if inspect.isgeneratorfunction(run):
+        @functools.wraps(run)
+        def timed_generator(self, *args, **kwargs):
+            items = run(self, *args, **kwargs)
+            try:
+                while True:
+                    # Only the time spent producing an item counts, not the consumer's
+                    start = time.perf_counter()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    histogram.observe(time.perf_counter() - start)
+                    yield item
+            finally:
+                items.close()
+        return timed_generator
+
+    @functools.wraps(run)
+    def timed(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return run(self, *args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return timed
 
 class BaseAgent(ABC):
+    stage = None # Label for the stage_seconds histogram (defaults to the class name)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if METRICS_ENABLED and "run" in cls.__dict__ and not getattr(cls.run, "__isabstractmethod__", False):
+            cls.run = _timed_run(cls.run, cls.stage or cls.__name__)
+
     def __init__(self, name):
         self.name = name
         self.logger = setup_logger(name, f"logs/{name}.log")
-    
+        self.log_sampler = LogSampler()
+        self.metrics = Metrics()
+
     @abstractmethod
     def run(self, *args, **kwargs):
         pass
 
-    def log(self, message, level="info"):
+    def log(self, message, level="info", sample_key=None):
+        """
+        Log a message. Per-frame messages should pass a sample_key: each key is then
+        logged at most once per LOG_SAMPLE_INTERVAL, with a count of what was skipped.
+        """
+        if sample_key is not None:
+            allowed, suppressed = self.log_sampler.allow(sample_key)
+            if not allowed:
+                return
+            if suppressed:
+                message = f"{message} ({suppressed} similar suppressed)"
+
         if level == "info":
             self.logger.info(message)
         elif level == "error":
@@ -0,0 +1,190 @@
+import numpy as np
+from agents.base_agent import BaseAgent
+from agents.aggregator import ConfidenceAggregatorAgent, build_lookup_table, anomaly_ids
+from tools.detections import Detections
+from utils.memory import SharedMemory
+from config import (
+    AGGREGATOR_POLICY, AGGREGATOR_REQUIRED_FRAMES, AGGREGATOR_CONFIDENCE_TARGET, AGGREGATOR_WINDOW_FRAMES,
+    AGGREGATOR_MAX_FRAME_GAP
+)
+
+POLICIES = ("consecutive", "weighted", "window")
+
+class BatchAggregatorAgent(BaseAgent):
+    """
+    Aggregates one tick (at most one analyzed frame per camera) for many cameras at once.
+    The per-(camera, anomaly) state lives in NumPy arrays, one row per camera and one column
+    per anomaly type, so a tick is a handful of array operations however many cameras there
+    are; Python only runs for the cameras that confirm an incident.
+
+    Policies:
+        consecutive - AGGREGATOR_REQUIRED_FRAMES hits over an unbroken run of frames (the 3-frame rule)
+        weighted    - the frames' highest confidences over an unbroken run add up to AGGREGATOR_CONFIDENCE_TARGET
+        window      - hits in AGGREGATOR_REQUIRED_FRAMES of the last AGGREGATOR_WINDOW_FRAMES analyzed frames
+    """
+    stage = "aggregation"
+
+    def __init__(self, policy=AGGREGATOR_POLICY, required=AGGREGATOR_REQUIRED_FRAMES,
+                 confidence_target=AGGREGATOR_CONFIDENCE_TARGET, window=AGGREGATOR_WINDOW_FRAMES, capacity=16):
+        super().__init__("BatchAggregatorAgent")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown aggregator policy '{policy}' (expected {', '.join(POLICIES)})")
+        self.memory = SharedMemory()
+        self.policy = policy
+        self.required = required
+        self.confidence_target = confidence_target
+        self.window = max(1, window)
+
+        self.anomaly_mapping = dict(ConfidenceAggregatorAgent.ANOMALY_MAPPING)
+        self.anomaly_types = sorted(set(self.anomaly_mapping.values()))
+        self._lookup_tables = {} # {id(names): (names, class_id -> anomaly index array)}
+
+        self.rows = {} # {camera_id: row}
+        self.evidence = [] # EvidenceRecorder per row; None = caller already wrote snapshot_path
+        anomalies = len(self.anomaly_types)
+        capacity = max(1, capacity)
+        self.counts = np.zeros((capacity, anomalies), dtype=np.int32) # Hits in the current unbroken run
+        self.scores = np.zeros((capacity, anomalies), dtype=np.float32) # weighted: confidence summed over the run
+        self.history = np.zeros((capacity, anomalies, self.window), dtype=bool) # window: hit per analyzed frame
+        self.ticks = np.zeros(capacity, dtype=np.int64) # Analyzed frames per camera (window ring position)
+        self.last_frame = np.full(capacity, -1, dtype=np.int64)
+        self.max_frame_gap = np.zeros(capacity, dtype=np.int64)
+
+    def _lookup_table(self, names):
+        cached = self._lookup_tables.get(id(names))
+        if cached is not None and cached[0] is names:
+            return cached[1]
+        table = build_lookup_table(names, self.anomaly_mapping, self.anomaly_types)
+        self._lookup_tables[id(names)] = (names, table)
+        return table
+
+    def add_camera(self, camera_id, evidence=None, max_frame_gap=AGGREGATOR_MAX_FRAME_GAP):
+        """Give a camera a row (or reset its existing one). Returns the row."""
+        row = self.rows.get(camera_id)
+        if row is None:
+            row = len(self.rows)
+            if row == len(self.counts):
+                self._grow()
+            self.rows[camera_id] = row
+            self.evidence.append(None)
+        self.evidence[row] = evidence
+        self.max_frame_gap[row] = max_frame_gap
+        self._clear(np.array([row]))
+        self.ticks[row] = 0
+        self.last_frame[row] = -1
+        return row
+
+    def _grow(self):
+        """Double the number of rows."""
+        for name in ("counts", "scores", "history", "ticks", "max_frame_gap"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.last_frame = np.concatenate([self.last_frame, np.full_like(self.last_frame, -1)])
+
+    def _clear(self, rows):
+        self.counts[rows] = 0
+        self.scores[rows] = 0
+        self.history[rows] = False
+
+    def get_counts(self, camera_id):
+        """{anomaly_type: hits in the current run} for one camera."""
+        row = self.rows[camera_id]
+        return {anomaly: int(count) for anomaly, count in zip(self.anomaly_types, self.counts[row])}
+
+    def run(self, frames):
+        """
+        frames: [(camera_id, detections, frame_count, snapshot_path)], at most one per camera.
+        Returns the incident records confirmed in this tick.
+        """
+        if not frames:
+            return []
+        rows = np.array([self.rows[camera_id] for camera_id, *_ in frames], dtype=np.intp)
+        if len(np.unique(rows)) != len(rows):
+            raise ValueError("A tick takes at most one frame per camera")
+        frame_counts = np.array([frame_count for _, _, frame_count, _ in frames], dtype=np.int64)
+        detections = [
+            dets if isinstance(dets, Detections) else Detections.from_dicts(dets) for _, dets, _, _ in frames
+        ]
+        snapshot_paths = [snapshot_path for *_, snapshot_path in frames]
+
+        # Rows whose previous frame is too far back start a new run
+        gap_limit = self.max_frame_gap[rows]
+        last = self.last_frame[rows]
+        broken = rows[(gap_limit > 0) & (last >= 0) & (frame_counts - last > gap_limit)]
+        if len(broken) and self.counts[broken].any():
+            self.log(f"Frame gap on {len(broken)} camera(s); consecutive counts reset", sample_key="frame_gap")
+            self._clear(broken)
+        self.last_frame[rows] = frame_counts
+
+        # Every detection of the tick -> (frame in the tick, anomaly), then per-(frame, anomaly) hits
+        # and highest confidence
+        hits = np.zeros((len(frames), len(self.anomaly_types)), dtype=np.int32)
+        best = np.zeros(hits.shape, dtype=np.float32)
+        if any(len(dets) for dets in detections):
+            entries = np.repeat(np.arange(len(frames)), [len(dets) for dets in detections])
+            names = detections[0].names
+            if all(dets.names is names for dets in detections):
+                # One detector for every camera: a single lookup for the whole tick
+                ids = anomaly_ids(np.concatenate([dets.class_ids for dets in detections]), self._lookup_table(names))
+            else:
+                ids = np.concatenate([
+                    anomaly_ids(dets.class_ids, self._lookup_table(dets.names)) for dets in detections
+                ])
+            confidences = np.concatenate([dets.confidences for dets in detections])
+            matched = ids >= 0
+            entries, ids = entries[matched], ids[matched]
+            np.add.at(hits, (entries, ids), 1)
+            np.maximum.at(best, (entries, ids), confidences[matched])
+        present = hits > 0
+
+        # One update for every camera; anomalies missing from a frame break their run
+        previous = self.counts[rows]
+        self.counts[rows] = counts = np.where(present, previous + hits, 0)
+        if self.policy == "consecutive":
+            confirm = present & (counts >= self.required)
+        elif self.policy == "weighted":
+            self.scores[rows] = scores = np.where(present, self.scores[rows] + best, 0)
+            confirm = present & (scores >= self.confidence_target)
+        else:
+            slots = self.ticks[rows] % self.window
+            self.history[rows, :, slots] = present
+            confirm = present & (self.history[rows].sum(axis=2) >= self.required)
+        self.ticks[rows] += 1
+
+        candidates = np.flatnonzero(present.any(axis=1))
+        if len(candidates):
+            self.log(f"Potential anomalies on {len(candidates)} camera(s)", sample_key="potential")
+        for i in candidates:
+            # Candidate evidence: only frames with a potential anomaly are written
+            evidence = self.evidence[rows[i]]
+            if evidence is not None and snapshot_paths[i] is None:
+                snapshot_paths[i] = evidence.save_snapshot(int(frame_counts[i]))
+
+        confirmed_incidents = []
+        for i in np.flatnonzero(confirm.any(axis=1)):
+            camera_id = frames[i][0]
+            if self.memory.get_session(camera_id)["incident_confirmed"]:
+                continue
+            position, anomaly_type = self._crossing(detections[i], confirm[i], previous[i])
+            confidence = float(detections[i].confidences[position])
+            self.log(f"[{camera_id}] CONFIRMED INCIDENT: {anomaly_type}")
+            incident_record = self.memory.confirm_incident(anomaly_type, confidence, snapshot_paths[i], camera_id)
+            evidence = self.evidence[rows[i]]
+            if evidence is not None:
+                evidence.record_incident(incident_record, int(frame_counts[i]))
+            confirmed_incidents.append(incident_record)
+        return confirmed_incidents
+
+    def _crossing(self, detections, confirm, previous):
+        """(position, anomaly_type) of the first detection, in detection order, that confirms."""
+        ids = anomaly_ids(detections.class_ids, self._lookup_table(detections.names))
+        crossing = None
+        for anomaly_id in np.flatnonzero(confirm):
+            hits = np.flatnonzero(ids == anomaly_id)
+            if self.policy == "consecutive":
+                position = hits[max(1, self.required - int(previous[anomaly_id])) - 1]
+            else:
+                position = hits[0]
+            if crossing is None or position < crossing[0]:
+                crossing = (position, self.anomaly_types[anomaly_id])
+        return crossing
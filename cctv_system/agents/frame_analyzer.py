@@ -1,11 +1,248 @@
+import time
 from agents.base_agent import BaseAgent
-from tools.yolo_tool import YOLOTool
+from agents.aggregator import ConfidenceAggregatorAgent
+from tools.yolo_tool import YOLOTool, CascadeYOLOTool, TiledYOLOTool
+from tools.motion_tool import MotionGateTool
+from tools.roi_tool import RegionOfInterestTool
+from tools.detections import Detections
+from config import (
+    INFERENCE_BATCH_SIZE, INFERENCE_BATCH_MAX_WAIT,
+    MOTION_GATE_ENABLED, MOTION_GATE_REUSE_DETECTIONS, CASCADE_ENABLED, TILING_ENABLED
+)
 
 class FrameAnalyzerAgent(BaseAgent):
-    def __init__(self):
+    stage = "inference"
+
+    def __init__(self, batch_size=INFERENCE_BATCH_SIZE, max_wait=INFERENCE_BATCH_MAX_WAIT,
+                 motion_gate=MOTION_GATE_ENABLED, cascade=CASCADE_ENABLED, tiling=TILING_ENABLED):
         super().__init__("FrameAnalyzerAgent")
-        self.yolo_tool = YOLOTool()
+        if cascade and tiling:
+            raise ValueError("CASCADE_ENABLED and TILING_ENABLED cannot be combined")
+        # The cascade escalates (and tiling zooms in on) exactly the classes the aggregator turns into incidents
+        if cascade:
+            self.yolo_tool = CascadeYOLOTool(ConfidenceAggregatorAgent.ANOMALY_MAPPING)
+        elif tiling:
+            self.yolo_tool = TiledYOLOTool(ConfidenceAggregatorAgent.ANOMALY_MAPPING)
+        else:
+            self.yolo_tool = YOLOTool()
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self._batch = [] # [(key, stream, frame, gated)] waiting for the next forward pass
+        self._batch_deadline = None
+
+        # Motion gate state is kept per stream (camera) so interleaved cameras don't mix
+        self.motion_gate_enabled = motion_gate
+        self.reuse_detections = MOTION_GATE_REUSE_DETECTIONS
+        self.motion_gates = {} # {stream: MotionGateTool}
+        self.last_detections = {} # {stream: detections}
+        self.rois = {} # {stream: RegionOfInterestTool}; other streams are analyzed whole
+
+    def set_roi(self, stream, polygons):
+        """Only analyze the given polygons of this stream's frames (None/empty = the whole frame)."""
+        if polygons:
+            self.rois[stream] = RegionOfInterestTool(polygons)
+        else:
+            self.rois.pop(stream, None)
 
-    def run(self, frame):
+    def filter_roi(self, detections, frame_shape, stream=None):
+        """Drop detections outside the stream's ROI (for detections made elsewhere, e.g. by worker processes)."""
+        roi = self.rois.get(stream)
+        return roi.filter(detections, frame_shape) if roi is not None else detections
+
+    def warmup(self, background=False):
+        """Load the model and run a dummy inference before the first real frame."""
+        return self.yolo_tool.warmup(background=background)
+
+    def run(self, frame, stream=None):
         # self.log("Analyzing frame...")
-        return self.yolo_tool.detect(frame)
+        if self._is_gated(frame, stream):
+            return self._gated_detections(stream)
+        with self.metrics.timer("inference_seconds"):
+            detections = self._detect([frame], [stream])[0]
+        self.metrics.inc("inference_calls")
+        self.metrics.inc("inference_frames")
+        self.last_detections[stream] = detections
+        return detections
+
+    def run_batch(self, frames, streams=None):
+        """Analyze several frames (optionally from different streams) with one forward pass."""
+        streams = list(streams) if streams is not None else [None] * len(frames)
+        results = [None] * len(frames)
+        to_infer = []
+        for i, (frame, stream) in enumerate(zip(frames, streams)):
+            if self._is_gated(frame, stream):
+                results[i] = self._gated_detections(stream)
+            else:
+                to_infer.append(i)
+        inferred = self._infer_batch([frames[i] for i in to_infer], [streams[i] for i in to_infer])
+        for i, detections in zip(to_infer, inferred):
+            results[i] = detections
+        return results
+
+    def _infer_batch(self, frames, streams):
+        detections = self._detect_batch(frames, streams)
+        for stream, dets in zip(streams, detections):
+            self.last_detections[stream] = dets
+        return detections
+
+    def _detect_batch(self, frames, streams=None):
+        """One timed forward pass over frames (no-op for an empty batch)."""
+        if not frames:
+            return []
+        # Batched paths don't go through run(), so they feed the inference stage directly (once per batch)
+        streams = list(streams) if streams is not None else [None] * len(frames)
+        with self.metrics.timer("stage_seconds", stage=self.stage), self.metrics.timer("inference_seconds"):
+            detections = self._detect(frames, streams)
+        self.metrics.inc("inference_calls")
+        self.metrics.inc("inference_frames", len(frames))
+        return detections
+
+    def _detect(self, frames, streams):
+        """Detections per frame; streams with an ROI only have their crops analyzed."""
+        results = [None] * len(frames)
+        whole = [i for i, stream in enumerate(streams) if stream not in self.rois]
+        cropped = [i for i, stream in enumerate(streams) if stream in self.rois]
+        if whole:
+            detected = self._run_tool([frames[i] for i in whole], [streams[i] for i in whole])
+            for i, detections in zip(whole, detected):
+                results[i] = detections
+        if cropped:
+            detected = self._detect_regions([frames[i] for i in cropped], [streams[i] for i in cropped])
+            for i, detections in zip(cropped, detected):
+                results[i] = detections
+        return results
+
+    def _detect_regions(self, frames, streams):
+        """Run every ROI crop (one batch per input size) and map the boxes back to their frames."""
+        parts = [[] for _ in frames]
+        groups = {} # {input size: [(frame index, crop, x0, y0)]}
+        for i, (frame, stream) in enumerate(zip(frames, streams)):
+            roi = self.rois[stream]
+            for crop, x0, y0 in roi.crops(frame):
+                size = roi.input_size(crop.shape, frame.shape, self.yolo_tool.imgsz)
+                groups.setdefault(size, []).append((i, crop, x0, y0))
+        for size, items in groups.items():
+            # Tiling keys its motion state by crop, so each crop is compared with itself
+            crop_streams = [(streams[i], x0, y0) for i, _, x0, y0 in items]
+            # The synthetic demo detections are defined on whole frames: they are added once per frame below
+            detected = self._run_tool([crop for _, crop, _, _ in items], crop_streams, imgsz=size, mock=False)
+            for (i, _, x0, y0), detections in zip(items, detected):
+                parts[i].append((detections, x0, y0))
+        demo_tool = next((tool for tool in (self.yolo_tool, getattr(self.yolo_tool, "detector", None))
+                          if getattr(tool, "mock_enabled", False)), None)
+        if demo_tool is not None:
+            for frame, part in zip(frames, parts):
+                mock = demo_tool._mock_detections(frame)
+                if mock is not None:
+                    part.append((mock, 0, 0))
+        return [self.rois[stream].merge(part, frame.shape, self.yolo_tool.names)
+                for frame, stream, part in zip(frames, streams, parts)]
+
+    def _run_tool(self, frames, streams, imgsz=None, mock=True):
+        if isinstance(self.yolo_tool, TiledYOLOTool):
+            # Tiling keeps motion state per stream
+            return self.yolo_tool.detect_batch(frames, streams=streams, imgsz=imgsz, mock=mock)
+        return self.yolo_tool.detect_batch(frames, imgsz=imgsz, mock=mock)
+
+    def _is_gated(self, frame, stream=None):
+        if not self.motion_gate_enabled:
+            return False
+        gate = self.motion_gates.get(stream)
+        if gate is None:
+            gate = self.motion_gates[stream] = MotionGateTool()
+        gated = not gate.should_infer(frame)
+        if gated:
+            self.metrics.inc("frames_gated")
+        return gated
+
+    def _gated_detections(self, stream=None):
+        # Nothing changed: either repeat what the detector last saw or report an empty scene
+        empty = Detections(names=self.yolo_tool.names)
+        return self.last_detections.get(stream, empty) if self.reuse_detections else empty
+
+    def get_gate_stats(self):
+        """Motion gate counters summed over all streams (None when gating is disabled)."""
+        if not self.motion_gate_enabled:
+            return None
+        totals = {"frames_seen": 0, "frames_gated": 0, "frames_forced": 0}
+        for gate in self.motion_gates.values():
+            stats = gate.get_stats()
+            for name in totals:
+                totals[name] += stats[name]
+        totals["gated_ratio"] = totals["frames_gated"] / totals["frames_seen"] if totals["frames_seen"] else 0.0
+        return totals
+
+    def get_cascade_stats(self):
+        """Escalation rate and per-stage cost of the model cascade (None when it is disabled)."""
+        if not isinstance(self.yolo_tool, CascadeYOLOTool):
+            return None
+        return self.yolo_tool.get_stats()
+
+    def get_roi_stats(self):
+        """Share of the pixels analyzed and detections dropped outside the ROIs (None without ROIs)."""
+        if not self.rois:
+            return None
+        stats = [roi.get_stats() for roi in self.rois.values()]
+        pixels_total = sum(roi.pixels_total for roi in self.rois.values())
+        return {
+            "cameras": len(stats),
+            "frames": sum(stat["frames"] for stat in stats),
+            "pixel_ratio": round(sum(roi.pixels_analyzed for roi in self.rois.values()) / pixels_total, 3)
+                           if pixels_total else 0.0,
+            "detections_outside": sum(stat["detections_outside"] for stat in stats),
+        }
+
+    def get_tiling_stats(self):
+        """Tiles run per frame and detections only the tiles found (None when tiling is disabled)."""
+        if not isinstance(self.yolo_tool, TiledYOLOTool):
+            return None
+        return self.yolo_tool.get_stats()
+
+    def submit(self, key, frame, stream=None):
+        """
+        Queue a frame for batched analysis.
+        Returns [(key, detections), ...] once the batch is full or its deadline has passed.
+        Frames rejected by the motion gate are returned immediately unless they have to
+        wait for an earlier frame of the same stream that is still in the batch.
+        """
+        gated = self._is_gated(frame, stream)
+        if gated and not any(pending_stream == stream for _, pending_stream, _, _ in self._batch):
+            return [(key, self._gated_detections(stream))] + self.poll()
+        if not self._batch:
+            self._batch_deadline = time.monotonic() + self.max_wait
+        self._batch.append((key, stream, frame, gated))
+        if sum(1 for *_, pending_gated in self._batch if not pending_gated) >= self.batch_size:
+            return self.flush()
+        return self.poll()
+
+    def poll(self):
+        """Flush the pending batch if it has waited longer than max_wait."""
+        if self._batch and time.monotonic() >= self._batch_deadline:
+            return self.flush()
+        return []
+
+    def time_until_deadline(self):
+        """Seconds left before the pending batch must be flushed (None if nothing is pending)."""
+        if not self._batch:
+            return None
+        return max(0.0, self._batch_deadline - time.monotonic())
+
+    def flush(self):
+        if not self._batch:
+            return []
+        batch = self._batch
+        self._batch = []
+        self._batch_deadline = None
+        to_infer = [(stream, frame) for _, stream, frame, gated in batch if not gated]
+        inferred = iter(self._detect_batch([frame for _, frame in to_infer], [stream for stream, _ in to_infer]))
+
+        # Resolve in submission order so gated frames reuse the detections of the frame before them
+        ready = []
+        for key, stream, frame, gated in batch:
+            if gated:
+                detections = self._gated_detections(stream)
+            else:
+                detections = next(inferred)
+                self.last_detections[stream] = detections
+            ready.append((key, detections))
+        return ready
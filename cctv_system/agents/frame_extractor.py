@@ -1,18 +1,39 @@
 from agents.base_agent import BaseAgent
-from tools.video_tool import VideoTool
+from tools.video_tool import create_video_tool
 
 class VideoFrameExtractorAgent(BaseAgent):
-    def __init__(self):
+    stage = "decode"
+
+    def __init__(self, source=None, frame_pool=None):
         super().__init__("VideoFrameExtractorAgent")
-        self.video_tool = VideoTool()
+        self.frame_pool = frame_pool
+        self.video_tool = create_video_tool(frame_pool=frame_pool) if source is None else create_video_tool(source, frame_pool)
     
     def run(self):
         self.log(f"Starting video extraction from {self.video_tool.video_source}")
         
+        skipped = self.video_tool.frames_skipped
+        stale = self.video_tool.frames_stale
         try:
             for frame_count, frame in self.video_tool.stream_frames():
+                self.metrics.inc("frames_in")
+                if self.video_tool.frames_skipped != skipped:
+                    self.metrics.inc("frames_dropped", self.video_tool.frames_skipped - skipped, reason="sampling")
+                    skipped = self.video_tool.frames_skipped
+                if self.video_tool.frames_stale != stale:
+                    self.metrics.inc("frames_dropped", self.video_tool.frames_stale - stale, reason="stale")
+                    stale = self.video_tool.frames_stale
                 yield frame_count, frame
         except Exception as e:
             self.log(f"Error during video extraction: {e}", "error")
 
         self.log("Video extraction finished")
+
+    def is_live(self):
+        """Frames are read freshest-first from a live (or real-time rehearsed) source."""
+        return self.video_tool.latest_only()
+
+    def release(self, frame):
+        """Hand a processed frame's buffer back to the frame pool (no-op without one)."""
+        if self.frame_pool is not None:
+            self.frame_pool.release(frame)
@@ -1,15 +1,69 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
 from agents.base_agent import BaseAgent
 from tools.gemini_tool import GeminiTool
+from utils.memory import SharedMemory
+from config import REPORT_WORKERS
 
 class ReportGeneratorAgent(BaseAgent):
-    def __init__(self):
+    stage = "report"
+
+    def __init__(self, workers=REPORT_WORKERS):
         super().__init__("ReportGeneratorAgent")
         self.gemini_tool = GeminiTool()
+        # Reports are generated off the frame thread; max_workers caps concurrent requests
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self.pending = []
+
+    def preload(self):
+        """Initialize the report backend (and its imports) on a worker thread."""
+        return self.executor.submit(lambda: self.gemini_tool.backend)
 
     def run(self, incident_data):
+        """Generate a report and wait for it. Returns the report path."""
+        return self.submit(incident_data).result()
+
+    def submit(self, incident_data, after=None):
+        """
+        Queue report generation in the background. Returns a Future resolving to the report path.
+        If `after` (e.g. the responder's dispatch Future) is given, the report waits for it.
+        """
+        self.log(f"Queueing report for incident {incident_data['id']}...")
+        if after is None:
+            # Snapshot the record: evidence paths and actions may still be updated in place
+            future = self.executor.submit(self._generate, copy.deepcopy(incident_data))
+        else:
+            future = self.executor.submit(self._generate_after, after, incident_data)
+        self.pending.append(future)
+        return future
+
+    def _generate_after(self, after, incident_data):
+        after.result()
+        # Memory writes (actions, evidence paths) hold its lock, so the snapshot is consistent
+        with SharedMemory().lock:
+            snapshot = copy.deepcopy(incident_data)
+        return self._generate(snapshot)
+
+    def _generate(self, incident_data):
         self.log("Generating final report...")
         
-        report_path = self.gemini_tool.generate_report(incident_data)
+        with self.metrics.timer("report_seconds"):
+            report_path = self.gemini_tool.generate_report(incident_data)
             
         self.log(f"Report saved to {report_path}")
         return report_path
+
+    def close(self, wait=True):
+        """Wait for queued reports (if wait) and stop the worker pool. Returns finished report paths."""
+        self.executor.shutdown(wait=wait)
+        paths = []
+        for future in self.pending:
+            if not future.done():
+                continue
+            error = future.exception()
+            if error is not None:
+                self.log(f"Report generation failed: {type(error).__name__}: {error}", level="error")
+            else:
+                paths.append(future.result())
+        self.pending = []
+        return paths
@@ -1,22 +1,33 @@
 from agents.base_agent import BaseAgent
 from utils.memory import SharedMemory
-from tools.emergency_tool import EmergencyTool
+from tools.emergency_tool import EmergencyDispatcher
+from config import EMERGENCY_DRY_RUN
 
 class EmergencyResponderAgent(BaseAgent):
-    def __init__(self):
+    stage = "response"
+
+    def __init__(self, dry_run=EMERGENCY_DRY_RUN):
         super().__init__("EmergencyResponderAgent")
         self.memory = SharedMemory()
-        self.emergency_tool = EmergencyTool()
+        self.dispatcher = EmergencyDispatcher(dry_run=dry_run)
 
     def run(self, incident_record):
+        """Dispatch the incident in the background. Returns a Future resolving to the action records."""
         incident_type = incident_record["type"]
         
         self.log(f"INITIATING EMERGENCY RESPONSE FOR: {incident_type}")
         
-        actions = self.emergency_tool.trigger_response(incident_type)
-        
+        return self.dispatcher.dispatch(
+            incident_record, on_complete=lambda actions: self._record_actions(incident_record, actions)
+        )
+
+    def _record_actions(self, incident_record, actions):
         for action in actions:
-            self.log(f"Action taken: {action}")
-            self.memory.log_action(action)
-            
-        return actions
+            level = "error" if action["status"] == "failed" else "info"
+            self.log(f"Action taken: {action['action']}", level=level)
+        # All channels' results in one history write
+        self.memory.log_actions(incident_record["id"], actions)
+
+    def close(self, wait=True):
+        """Wait for in-flight dispatches (if wait) and stop the dispatcher."""
+        self.dispatcher.close(wait=wait)
@@ -6,15 +6,152 @@ load_dotenv()
 # System Configuration
 VIDEO_SOURCE = "data/sample_video.mp4" # Path to video file 
 YOLO_MODEL_PATH = "yolov8n.pt"
+INFERENCE_BACKEND = "torch" # "torch" (ultralytics/PyTorch), "onnx" (ONNX Runtime) or "openvino"; exported next to YOLO_MODEL_PATH on first use
+INFERENCE_INT8 = False # INT8 post-training quantization for the onnx/openvino backends
+INFERENCE_CALIBRATION_SOURCES = [] # Videos for INT8 calibration (empty = the CAMERAS sources)
+INFERENCE_CALIBRATION_FRAMES = 100
+INFERENCE_THREADS = 0 # Intra-op threads for the inference runtime (0 = runtime default)
+INFERENCE_CPU_AFFINITY = [] # CPU core ids to pin the process to, e.g. [0, 1, 2, 3] (Linux; empty = no pinning)
 CONFIDENCE_THRESHOLD = 0.5
-FRAME_RATE = 5 # Process 1 frame every X seconds or just fixed FPS processing
+MODEL_WARMUP = True # Load the model and run a dummy inference while the video source opens
+STARTUP_TIME_TARGET = 5.0 # Seconds from launch to first analyzed frame; slower starts are logged as warnings
+INFERENCE_BATCH_SIZE = 1 # Frames per forward pass (1 = single-frame inference)
+INFERENCE_BATCH_MAX_WAIT = 0.05 # Max seconds a partial batch waits for more frames
+INFERENCE_WORKERS = 0 # Pipelined mode: detector processes fed frames through a shared-memory ring (0 = analyzer threads)
+FRAME_RATE = 5 # Target analysis FPS
+FRAME_SAMPLING = True # Skip (grab without decode to BGR) source frames above FRAME_RATE
+FRAME_POOL_ENABLED = True # Decode into recycled frame buffers sized to the pipeline depth
+FRAME_POOL_WAIT = 0.05 # Seconds the decoder waits for a released buffer before allocating a spare
+VIDEO_DECODER = "opencv" # "opencv" (cv2.VideoCapture) or "ffmpeg" (ffmpeg subprocess, needs ffmpeg >= 5.1 on PATH)
+FFMPEG_BINARY = "ffmpeg"
+FFMPEG_THREADS = 0 # Decoder threads (0 = ffmpeg picks per core count)
+FFMPEG_SCALE_TO_MODEL = True # Downscale to MODEL_INPUT_SIZE while decoding (snapshots/evidence are at that size too)
+FFMPEG_SKIP_FRAMES = "" # "" = decode every frame, "noref" = skip non-reference frames, "nokey" = keyframes only (fast triage)
+PREPROCESS_POOLED = True # Letterbox/normalize into a reused model-input tensor (False = ultralytics preprocessing)
+MODEL_INPUT_SIZE = 640 # Long side of the model input
+LIVE_MODE = "auto" # "auto" = camera indexes/stream URLs are read freshest-frame-first, "on" = also play files in real time, "off"
+LIVE_LATENCY_SLO = 1.0 # Target seconds from capture to aggregation for live sources
+LIVE_INPUT_SIZES = [MODEL_INPUT_SIZE, 480, 320] # Detector input sizes stepped through while the SLO is missed
+LIVE_ADJUST_INTERVAL = 10 # Min analyzed frames between input size changes
+LIVE_MAX_FRAME_GAP = 30 # Live: analyzed frames more than this many source frames apart break a consecutive run
+AGGREGATOR_MAX_FRAME_GAP = 0 # Same for recorded video (0 = never)
+AGGREGATOR_REQUIRED_FRAMES = 3 # Consecutive hits that confirm an incident (the "3-frame rule")
+AGGREGATOR_POLICY = "consecutive" # Batched aggregator: "consecutive", "weighted" (summed confidence) or "window" (k of n)
+AGGREGATOR_CONFIDENCE_TARGET = 2.0 # weighted: sum of per-frame confidences over an unbroken run that confirms
+AGGREGATOR_WINDOW_FRAMES = 5 # window: confirm when AGGREGATOR_REQUIRED_FRAMES of the last N analyzed frames hit
+CASCADE_ENABLED = False # Screen every frame with a cheap model; run the full detector only on suspicious frames
+CASCADE_SCREENER_MODEL = YOLO_MODEL_PATH # Screener weights (same weights at a smaller input by default)
+CASCADE_SCREENER_INPUT_SIZE = 320
+CASCADE_SCREENER_THRESHOLD = 0.25 # Anomaly-class confidence that escalates a frame (ultralytics drops < 0.25 anyway)
+CASCADE_DETECTOR_MODEL = YOLO_MODEL_PATH # Escalation model, run at MODEL_INPUT_SIZE (e.g. "yolov8s.pt")
+TILING_ENABLED = False # Also detect on overlapping full-resolution tiles of large frames, so small objects survive
+TILING_POLICY = "adaptive" # "always", or "adaptive": only tiles near a full-frame anomaly-class hit or with motion
+TILING_TILE_SIZE = MODEL_INPUT_SIZE # Tile side in source pixels (the model sees tiles unscaled)
+TILING_OVERLAP = 0.2 # Fraction of a tile shared with its neighbours
+TILING_MIN_FRAME_SIDE = 1280 # Frames whose long side is at most this are not tiled (needs FFMPEG_SCALE_TO_MODEL off)
+TILING_TRIGGER_THRESHOLD = 0.25 # adaptive: full-frame confidence of an anomaly class that tiles around it
+TILING_MERGE_THRESHOLD = 0.5 # Cross-tile NMS: intersection over the smaller box that merges two boxes
+TILING_BATCH_SIZE = 16 # Tiles per forward pass
 OUTPUT_DIR = "data"
 SNAPSHOT_DIR = os.path.join(OUTPUT_DIR, "snapshots")
 LOG_DIR = "logs"
+LOG_ASYNC = True # Format and write log records on a background thread
+LOG_SINGLE_FILE = True # All agents log to logs/system.log instead of one file each
+LOG_SAMPLE_INTERVAL = 1.0 # Per-frame messages are logged at most once per interval per key (0 = log all)
+INCIDENT_DB_FILE = os.path.join(OUTPUT_DIR, "incident_history.db") # Indexed long-term memory
+
+# Metrics Configuration
+METRICS_ENABLED = True # Time every agent's run() and count frames/inference calls
+METRICS_FILE = os.path.join(LOG_DIR, "metrics.prom") # Prometheus text format, rewritten periodically
+METRICS_FLUSH_INTERVAL = 5.0 # Seconds between metrics file writes
+METRICS_HTTP_PORT = 0 # Serve /metrics on 127.0.0.1:<port> (0 = off)
+PROFILE_ENABLED = False # cProfile a window of frames and dump the stats
+PROFILE_START_FRAME = 10 # First profiled frame (analyzed frames, counted from 1)
+PROFILE_FRAMES = 50 # Length of the profiled window
+PROFILE_OUTPUT = os.path.join(LOG_DIR, "profile.prof") # A .txt summary is written next to it
+
+# Motion Gate Configuration (skip inference on unchanged frames)
+MOTION_GATE_ENABLED = False
+MOTION_GATE_WIDTH = 64 # Width of the grayscale thumbnail used for differencing
+MOTION_GATE_PIXEL_THRESHOLD = 25 # Per-pixel intensity change counted as motion
+MOTION_GATE_AREA_THRESHOLD = 0.01 # Fraction of changed pixels that triggers inference
+MOTION_GATE_FORCE_INTERVAL = 15 # Force a full inference at least every N frames
+MOTION_GATE_REUSE_DETECTIONS = True # Gated frames reuse the last detections (False = empty)
+
+# Camera Configuration
+# Each camera gets its own session state and aggregator; CAMERAS[0] is the default camera.
+# An optional "roi" lists polygons of [x, y] points as fractions of the frame width/height, e.g.
+# "roi": [[[0.3, 0.2], [0.6, 0.2], [0.6, 1.0], [0.3, 1.0]]]: only those regions are analyzed.
+CAMERAS = [
+    {"camera_id": "CAM-001", "location": "Main Entrance", "source": VIDEO_SOURCE},
+]
+ROI_CROP_MARGIN = 32 # Source pixels of context kept around each ROI's bounding box
+ROI_MIN_INPUT_SIZE = 128 # Smallest model input for an ROI crop (crops run at the full frame's scale)
+ROI_ANCHOR = "center" # Point of a box that must lie inside the ROI: "center" or "bottom" (feet, wheels)
+MULTI_CAMERA_ENABLED = False # Serve every camera in CAMERAS from one process and one model
+MULTI_CAMERA_QUEUE_SIZE = 2 # Decoded frames buffered per camera
+MULTI_CAMERA_BATCH_SIZE = 8 # Max frames per forward pass (at most one per camera)
+MULTI_CAMERA_BATCH_AGGREGATION = True # Aggregate each inference batch in one vectorized update over all cameras
+
+# Cluster Configuration (python main.py --role coordinator|worker)
+# The coordinator spreads CAMERAS over the connected workers and stores/dispatches their incidents.
+CLUSTER_ROLE = "standalone" # "standalone", "coordinator" or "worker" (--role overrides)
+CLUSTER_HOST = "127.0.0.1" # Coordinator address: it listens here and workers connect here (--coordinator HOST:PORT)
+CLUSTER_PORT = 7070
+CLUSTER_HEARTBEAT_INTERVAL = 1.0 # Seconds between worker load reports
+CLUSTER_HEARTBEAT_TIMEOUT = 5.0 # A worker silent this long is dropped and its cameras reassigned
+CLUSTER_CONNECT_TIMEOUT = 30.0 # Seconds a worker keeps retrying to reach the coordinator
+CLUSTER_LOAD_LOG_INTERVAL = 10.0 # Seconds between per-worker load log lines on the coordinator
+CLUSTER_WORKER_DIR = os.path.join(OUTPUT_DIR, "cluster") # Each worker's local incident journal
+
+# Evidence Configuration
+EVIDENCE_SELECTIVE = True # Buffer frames in RAM and only write candidate/incident frames (False = snapshot every frame)
+EVIDENCE_BUFFER_FRAMES = 150 # Ring buffer length (analyzed frames)
+EVIDENCE_BUFFER_MAX_MB = 64 # Ring buffer RAM cap
+EVIDENCE_BUFFER_COMPRESSION = "jpeg" # "jpeg" (compressed in RAM) or "raw"
+EVIDENCE_JPEG_QUALITY = 90
+EVIDENCE_WRITER_WORKERS = 2 # Background evidence writer threads
+EVIDENCE_CLIP_ENABLED = False # Write a short video clip around each confirmed incident
+EVIDENCE_CLIP_PRE_SECONDS = 3
+EVIDENCE_CLIP_POST_SECONDS = 2
+
+# Pipeline Configuration
+PIPELINE_ENABLED = False # Run decode, inference, snapshots and aggregation as concurrent stages
+PIPELINE_QUEUE_SIZE = 8 # Max frames buffered between stages (backpressure)
+PIPELINE_ANALYZER_WORKERS = 1 # Each worker loads its own model
+PIPELINE_SNAPSHOT_WORKERS = 2
+
+# Detection Cache Configuration
+DETECTION_CACHE_DIR = os.path.join(OUTPUT_DIR, "detection_cache") # Raw detections per video/model/backend
+DETECTION_CACHE_MAX_MB = 1024 # Least recently used entries are evicted above this size
+REPLAY_ENABLED = False # Feed cached detections of VIDEO_SOURCE to the aggregator instead of running the detector
+
+# Benchmark Configuration (python -m utils.benchmark)
+BENCHMARK_DIR = "benchmarks" # Generated videos and JSON results
+BENCHMARK_RESOLUTIONS = ["640", "720p", "1080p", "4k"]
+BENCHMARK_DURATIONS = [10] # Seconds of synthetic footage per scenario
+BENCHMARK_DENSITIES = [0, 8] # Distractor objects per frame
+BENCHMARK_MOTION = ["static", "high"]
+BENCHMARK_DETECTORS = ["stub", "yolo"] # "stub" skips the model to isolate pipeline overhead, "cascade" screens then escalates, "tiled" adds full-resolution tiles
+BENCHMARK_VIDEO_FPS = 5
+BENCHMARK_STUB_LATENCY = 0.0 # Simulated inference seconds per call for the stub detector
+BENCHMARK_REGRESSION_TOLERANCE = 0.10 # Relative slowdown flagged by --compare
 
 # Gemini Configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Report Configuration
+REPORT_BACKEND = "auto" # "auto" (Gemini if an API key is set), "gemini" or "mock"
+REPORT_MODEL = "gemini-2.5-pro"
+REPORT_DIR = os.path.join(OUTPUT_DIR, "reports") # One report file per incident
+REPORT_CACHE_DIR = os.path.join(REPORT_DIR, "cache") # Report cache keyed by incident type, camera, confidence and actions
+REPORT_CACHE_MAX_ENTRIES = 256 # Least recently used cached reports beyond this are deleted
+REPORT_WORKERS = 2 # Max concurrent report generations
+REPORT_TIMEOUT = 60 # Seconds per generation request
+REPORT_MAX_RETRIES = 2
+REPORT_RETRY_BACKOFF = 2.0 # Seconds before the first retry, doubled each time
+REPORT_MOCK_LATENCY = 0.0 # Simulated latency of the mock backend (seconds)
+
 # Emergency Configuration
 EMERGENCY_TYPES = {
     "fire": "Fire Department",
@@ -25,3 +162,21 @@ EMERGENCY_TYPES = {
     "accident": "Ambulance",
     "theft": "Police"
 }
+
+# Emergency Dispatch Configuration
+# Every confirmed incident is sent to all of these concurrently. Besides "simulated" and "alarm":
+#   {"type": "webhook", "url": "https://alerts.example.com/hook", "headers": {"Authorization": "..."}}
+#   {"type": "smtp", "host": "smtp.example.com", "port": 587, "starttls": True, "username": "...",
+#    "password": "...", "sender": "cctv@example.com", "recipients": ["security@example.com"]}
+# Any entry may also set "name", "timeout", "retries" and "action" (the history entry, formatted with the alert).
+EMERGENCY_CHANNELS = [
+    {"type": "simulated", "name": "dispatch", "action": "Alert sent to {target}"},
+    {"type": "alarm"}, # Add "command": ["/usr/local/bin/siren", "{type}"] to drive real hardware
+    {"type": "simulated", "name": "admin", "action": "Building admin notified"},
+]
+EMERGENCY_WORKERS = 4 # Channels sent to concurrently
+EMERGENCY_TIMEOUT = 5.0 # Seconds per send attempt
+EMERGENCY_MAX_RETRIES = 2
+EMERGENCY_RETRY_BACKOFF = 1.0 # Seconds before the first retry, doubled each time
+EMERGENCY_COOLDOWN = 300 # Seconds before the same incident type on the same camera alerts again
+EMERGENCY_DRY_RUN = False # Record what would be sent without contacting any channel (always on in replay mode)
@@ -1,67 +1,356 @@
+import time
+import argparse
+import socket
+_START_TIME = time.perf_counter() # Startup is measured from here to the first analyzed frame
 import os
 import cv2
-import time
 from agents.frame_extractor import VideoFrameExtractorAgent
 from agents.frame_analyzer import FrameAnalyzerAgent
 from agents.aggregator import ConfidenceAggregatorAgent
 from agents.responder import EmergencyResponderAgent
 from agents.reporter import ReportGeneratorAgent
-from utils.logger import setup_logger
+from utils.logger import setup_logger, LogSampler, shutdown_logging
 from utils.memory import SharedMemory
-from config import SNAPSHOT_DIR
+from utils.pipeline import FramePipeline
+from utils.multi_camera import MultiCameraRuntime
+from utils.evidence import EvidenceRecorder
+from utils.metrics import Metrics, MetricsExporter, FrameProfiler
+from utils.frame_pool import FramePool, SharedFrameRing
+from utils.inference_workers import InferenceWorkerPool
+from utils.detection_cache import DetectionCache
+from utils.live_control import LatencyController
+from utils.cluster import ClusterCoordinator, ClusterWorker, parse_address
+from config import (
+    SNAPSHOT_DIR, PIPELINE_ENABLED, PIPELINE_QUEUE_SIZE,
+    PIPELINE_ANALYZER_WORKERS, PIPELINE_SNAPSHOT_WORKERS,
+    CAMERAS, MULTI_CAMERA_ENABLED, MULTI_CAMERA_QUEUE_SIZE, MULTI_CAMERA_BATCH_SIZE,
+    EVIDENCE_SELECTIVE, MODEL_WARMUP, STARTUP_TIME_TARGET,
+    METRICS_ENABLED, PROFILE_ENABLED, FRAME_POOL_ENABLED, INFERENCE_BATCH_SIZE, INFERENCE_WORKERS,
+    REPLAY_ENABLED, VIDEO_SOURCE, CONFIDENCE_THRESHOLD, LIVE_MAX_FRAME_GAP,
+    CLUSTER_ROLE, CLUSTER_HOST, CLUSTER_PORT, CLUSTER_WORKER_DIR
+)
+
+_startup_reported = False
+_frame_log_sampler = LogSampler()
+
+def log_frame(logger, message):
+    """Per-frame progress messages are sampled to keep logging off the hot path."""
+    allowed, suppressed = _frame_log_sampler.allow("frame")
+    if allowed:
+        logger.info(f"{message} ({suppressed} frames since last log)" if suppressed else message)
+
+def report_startup(logger):
+    """Log the time from launch to the first analyzed frame (once)."""
+    global _startup_reported
+    if _startup_reported:
+        return
+    _startup_reported = True
+    startup_time = time.perf_counter() - _START_TIME
+    if startup_time > STARTUP_TIME_TARGET:
+        logger.warning(f"Startup took {startup_time:.2f}s (target {STARTUP_TIME_TARGET:.2f}s)")
+    else:
+        logger.info(f"Startup took {startup_time:.2f}s (target {STARTUP_TIME_TARGET:.2f}s)")
+
+def frame_pool_size():
+    """Frames that can be in flight at once, so the pool covers the whole pipeline depth."""
+    if PIPELINE_ENABLED and INFERENCE_WORKERS > 0:
+        # Both frame queues, the frames dispatched to the workers, the snapshot workers and the frame being decoded
+        return 2 * PIPELINE_QUEUE_SIZE + 2 * INFERENCE_WORKERS * INFERENCE_BATCH_SIZE + PIPELINE_SNAPSHOT_WORKERS + 1
+    if PIPELINE_ENABLED:
+        # Both frame queues, each analyzer's pending batch, the snapshot workers and the frame being decoded
+        return (2 * PIPELINE_QUEUE_SIZE + PIPELINE_ANALYZER_WORKERS * (INFERENCE_BATCH_SIZE + 1)
+                + PIPELINE_SNAPSHOT_WORKERS + 1)
+    return 2
+
+def handle_incidents(confirmed_incidents, responder, reporter, logger):
+    """Respond to and report on confirmed incidents. Returns True when processing should stop."""
+    for incident in confirmed_incidents:
+        dispatched = responder.run(incident)
+
+        # Generate Report in the background once the alerts are out; it is awaited at shutdown
+        reporter.submit(incident, after=dispatched)
+        logger.info(f"System finished. Report for incident {incident['id']} queued.")
+
+        # Stop after one incident as per requirements
+        return True
+    return False
+
+def run_sequential(extractor, analyzer, aggregator, responder, reporter, memory, logger, evidence=None, profiler=None,
+                   controller=None):
+    metrics = Metrics()
+    for frame_count, frame in extractor.run():
+        if memory.session_state["incident_confirmed"]:
+            logger.info("Incident confirmed. Stopping video processing.")
+            break
+
+        log_frame(logger, f"Processing Frame {frame_count}")
+        if profiler is not None:
+            profiler.on_frame()
+
+        # 1. Analyze Frame
+        detections = analyzer.run(frame)
+        report_startup(logger)
+
+        with metrics.timer("stage_seconds", stage="snapshot"):
+            if evidence is not None:
+                # Buffer the frame; the aggregator only persists candidate/incident frames
+                evidence.add_frame(frame_count, frame)
+                snapshot_path = None
+            else:
+                # Save snapshot for potential evidence
+                snapshot_path = os.path.join(SNAPSHOT_DIR, f"frame_{frame_count}.jpg")
+                cv2.imwrite(snapshot_path, frame)
+
+        # The frame has been analyzed and buffered/written; recycle its buffer
+        extractor.release(frame)
+
+        # 2. Aggregate & Check for Incidents
+        confirmed_incidents = aggregator.run(detections, frame_count, snapshot_path)
+        if controller is not None:
+            controller.observe(extractor.video_tool.pop_capture_time(frame_count))
+
+        # 3. Respond to Incidents & 4. Generate Report
+        if handle_incidents(confirmed_incidents, responder, reporter, logger):
+            return
+
+def run_pipelined(extractor, analyzers, aggregator, responder, reporter, logger, evidence=None, profiler=None,
+                  workers=None, controller=None):
+    pipeline = FramePipeline(
+        extractor, analyzers, aggregator, SNAPSHOT_DIR,
+        # Live frames must not age in queues: hand the stages the freshest frame instead
+        queue_size=1 if controller is not None else PIPELINE_QUEUE_SIZE,
+        snapshot_workers=PIPELINE_SNAPSHOT_WORKERS,
+        logger=logger,
+        evidence=evidence,
+        workers=workers
+    )
+    analyzer_workers = f"{workers.workers} inference process(es)" if workers is not None else f"{len(analyzers)} analyzer worker(s)"
+    logger.info(
+        f"Pipelined mode: {analyzer_workers}, "
+        f"{PIPELINE_SNAPSHOT_WORKERS} snapshot worker(s), queue size {pipeline.queue_size}"
+    )
+
+    results = pipeline.run()
+    try:
+        for frame_count, confirmed_incidents in results:
+            report_startup(logger)
+            log_frame(logger, f"Processed Frame {frame_count}")
+            if controller is not None:
+                controller.observe(extractor.video_tool.pop_capture_time(frame_count))
+            if profiler is not None:
+                profiler.on_frame()
+            if confirmed_incidents:
+                # Stop the upstream stages first so they drain while we respond
+                pipeline.stop()
+            if handle_incidents(confirmed_incidents, responder, reporter, logger):
+                return
+    finally:
+        results.close()
+        if pipeline.errors:
+            logger.error(f"Pipeline finished with {len(pipeline.errors)} stage error(s)")
+
+def run_replay(aggregator, responder, reporter, logger, roi=None):
+    """
+    Feed cached raw detections of VIDEO_SOURCE to the aggregator; no decoding or inference.
+    roi (the default camera's RegionOfInterestTool) drops detections outside it, as live analysis does.
+    """
+    entry = DetectionCache().get_or_build(VIDEO_SOURCE, need_frame_shape=roi is not None)
+    start = time.perf_counter()
+    replayed = 0
+    try:
+        for frame_count, detections in entry.replay(CONFIDENCE_THRESHOLD):
+            replayed += 1
+            report_startup(logger)
+            if roi is not None:
+                detections = roi.filter(detections, entry.frame_shape)
+            # No frames are decoded, so there are no snapshots to attach
+            confirmed_incidents = aggregator.run(detections, frame_count)
+            if handle_incidents(confirmed_incidents, responder, reporter, logger):
+                return
+    finally:
+        elapsed = time.perf_counter() - start
+        logger.info(f"Replayed {replayed} of {len(entry)} cached frames in {elapsed:.3f}s "
+                    f"({replayed / elapsed if elapsed else 0:.0f} frames/s)")
+
+def run_multi_camera(analyzer, responder, reporter, logger):
+    runtime = MultiCameraRuntime(
+        CAMERAS, analyzer, responder, reporter, SNAPSHOT_DIR,
+        queue_size=MULTI_CAMERA_QUEUE_SIZE,
+        batch_size=MULTI_CAMERA_BATCH_SIZE,
+        logger=logger,
+        on_first_frame=lambda: report_startup(logger)
+    )
+    runtime.run()
+
+def run_coordinator(address, logger):
+    """Shard CAMERAS across worker nodes; incidents are stored, dispatched and reported here."""
+    host, port = parse_address(address)
+    responder = EmergencyResponderAgent()
+    reporter = ReportGeneratorAgent()
+    exporter = MetricsExporter().start() if METRICS_ENABLED else None
+
+    def on_incident(incident):
+        dispatched = responder.run(incident)
+        reporter.submit(incident, after=dispatched)
+
+    coordinator = ClusterCoordinator(CAMERAS, host, port, on_incident=on_incident, logger=logger)
+    try:
+        coordinator.run()
+        logger.info("All cameras finished.")
+    except KeyboardInterrupt:
+        logger.info("System stopped by user.")
+    finally:
+        for worker_id, load in sorted(coordinator.get_load().items()):
+            logger.info(f"Worker {worker_id}: {load}")
+        coordinator.close()
+        for report_path in reporter.close():
+            logger.info(f"Report available at: {report_path}")
+        responder.close()
+        if exporter is not None:
+            exporter.stop()
+        logger.info("System shutdown.")
+        shutdown_logging()
+
+def run_worker(address, worker_id, logger):
+    """Serve the cameras the coordinator assigns and stream incidents back to it."""
+    host, port = parse_address(address)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    # Workers keep a local journal; the coordinator holds the central incident store
+    SharedMemory.DB_FILE = os.path.join(CLUSTER_WORKER_DIR, worker_id, "incident_history.db")
+    analyzer = FrameAnalyzerAgent()
+    if MODEL_WARMUP:
+        analyzer.warmup(background=True)
+    exporter = MetricsExporter().start() if METRICS_ENABLED else None
+    worker = ClusterWorker(analyzer, worker_id, host, port, SNAPSHOT_DIR, logger=logger,
+                           on_first_frame=lambda: report_startup(logger))
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        logger.info("System stopped by user.")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}", exc_info=True)
+    finally:
+        if exporter is not None:
+            exporter.stop()
+        logger.info("System shutdown.")
+        shutdown_logging()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-Agent CCTV Surveillance System")
+    parser.add_argument("--role", choices=["standalone", "coordinator", "worker"], default=CLUSTER_ROLE)
+    parser.add_argument("--coordinator", default=f"{CLUSTER_HOST}:{CLUSTER_PORT}",
+                        help="HOST:PORT the coordinator listens on / workers connect to")
+    parser.add_argument("--worker-id", default=None, help="worker name (default: hostname-pid)")
+    return parser.parse_args(argv)
 
 def main():
+    args = parse_args()
     logger = setup_logger("MainSystem", "logs/system.log")
     logger.info("Starting Multi-Agent CCTV Surveillance System")
+    if args.role == "coordinator":
+        return run_coordinator(args.coordinator, logger)
+    if args.role == "worker":
+        return run_worker(args.coordinator, args.worker_id, logger)
 
-    # Initializing Agents
-    extractor = VideoFrameExtractorAgent()
-    analyzer = FrameAnalyzerAgent()
-    aggregator = ConfidenceAggregatorAgent()
-    responder = EmergencyResponderAgent()
+    # Initializing Agents (tools load their models lazily)
+    # Multi-camera streams get one pool per camera
+    frame_pool = FramePool(frame_pool_size()) if FRAME_POOL_ENABLED and not MULTI_CAMERA_ENABLED and not REPLAY_ENABLED else None
+    workers = None
+    if INFERENCE_WORKERS > 0 and PIPELINE_ENABLED and not MULTI_CAMERA_ENABLED and not REPLAY_ENABLED:
+        # Decoded frames go straight into shared memory the worker processes read from
+        ring = SharedFrameRing(frame_pool_size())
+        frame_pool = ring if FRAME_POOL_ENABLED else None
+        workers = InferenceWorkerPool(ring).start()
+    extractor = VideoFrameExtractorAgent(frame_pool=frame_pool)
+    # The analyzers only motion-gate when worker processes run the detector
+    analyzers = [FrameAnalyzerAgent() for _ in range(PIPELINE_ANALYZER_WORKERS if PIPELINE_ENABLED and workers is None else 1)]
+    if not MULTI_CAMERA_ENABLED and CAMERAS and CAMERAS[0]["source"] == VIDEO_SOURCE:
+        # Single-stream modes analyze the default camera, so its regions of interest apply
+        for analyzer in analyzers:
+            analyzer.set_roi(None, CAMERAS[0].get("roi"))
+    if MODEL_WARMUP and workers is None and not REPLAY_ENABLED:
+        # Model load + first inference overlap with opening the video source
+        for analyzer in analyzers:
+            analyzer.warmup(background=True)
+    evidence = EvidenceRecorder(SNAPSHOT_DIR) if EVIDENCE_SELECTIVE and not MULTI_CAMERA_ENABLED and not REPLAY_ENABLED else None
+    aggregator = ConfidenceAggregatorAgent(evidence=evidence)
+    controller = None
+    if extractor.is_live() and not MULTI_CAMERA_ENABLED and not REPLAY_ENABLED:
+        # Freshest-frame reading drops frames, so consecutive detections may be far apart
+        aggregator.max_frame_gap = LIVE_MAX_FRAME_GAP
+        # Worker processes keep their own models, so only in-process detectors are resized
+        controller = LatencyController([analyzer.yolo_tool for analyzer in analyzers] if workers is None else [])
+        extractor.video_tool.track_capture_times()
+    # Replayed footage is not happening now: record the alerts but never send them
+    responder = EmergencyResponderAgent(dry_run=True) if REPLAY_ENABLED else EmergencyResponderAgent()
     reporter = ReportGeneratorAgent()
-    
+    reporter.preload()
+
     memory = SharedMemory()
     memory.reset_session()
 
+    exporter = MetricsExporter().start() if METRICS_ENABLED else None
+    # cProfile sees the thread driving the loop (the whole frame path in sequential mode)
+    profiler = FrameProfiler() if PROFILE_ENABLED else None
+
     # Main Loop
     try:
-        for frame_count, frame in extractor.run():
-            if memory.session_state["incident_confirmed"]:
-                logger.info("Incident confirmed. Stopping video processing.")
-                break
-            
-            logger.info(f"Processing Frame {frame_count}")
-            
-            # 1. Analyze Frame
-            detections = analyzer.run(frame)
-            
-            # Save snapshot for potential evidence
-            snapshot_path = os.path.join(SNAPSHOT_DIR, f"frame_{frame_count}.jpg")
-            cv2.imwrite(snapshot_path, frame)
-            
-            # 2. Aggregate & Check for Incidents
-            confirmed_incidents = aggregator.run(detections, frame_count, snapshot_path)
-            
-            # 3. Respond to Incidents
-            for incident in confirmed_incidents:
-                responder.run(incident)
-                
-                # 4. Generate Report
-                report_path = reporter.run(incident)
-                logger.info(f"System finished. Report available at: {report_path}")
-                
-                # Stop after one incident as per requirements
-                return
-
-            
+        if REPLAY_ENABLED:
+            run_replay(aggregator, responder, reporter, logger, analyzers[0].rois.get(None))
+        elif MULTI_CAMERA_ENABLED:
+            run_multi_camera(analyzers[0], responder, reporter, logger)
+        elif PIPELINE_ENABLED:
+            run_pipelined(extractor, analyzers, aggregator, responder, reporter, logger, evidence, profiler, workers,
+                          controller)
+        else:
+            run_sequential(extractor, analyzers[0], aggregator, responder, reporter, memory, logger, evidence, profiler,
+                           controller)
 
     except KeyboardInterrupt:
         logger.info("System stopped by user.")
     except Exception as e:
         logger.error(f"Unexpected error: {e}", exc_info=True)
     finally:
+        if evidence is not None:
+            # Wait for background evidence writes so incident records get their final paths
+            evidence.close()
+        for report_path in reporter.close():
+            logger.info(f"Report available at: {report_path}")
+        responder.close()
+        for analyzer in analyzers:
+            gate_stats = analyzer.get_gate_stats()
+            if gate_stats:
+                logger.info(f"Motion gate: {gate_stats}")
+            cascade_stats = analyzer.get_cascade_stats()
+            if cascade_stats and cascade_stats["frames_screened"]:
+                logger.info(f"Cascade: {cascade_stats}")
+            roi_stats = analyzer.get_roi_stats()
+            if roi_stats and (roi_stats["frames"] or roi_stats["detections_outside"]):
+                logger.info(f"ROI: {roi_stats}")
+            tiling_stats = analyzer.get_tiling_stats()
+            if tiling_stats and tiling_stats["frames"]:
+                logger.info(f"Tiling: {tiling_stats}")
+        if frame_pool is not None:
+            logger.info(f"Frame pool: {frame_pool.get_stats()}")
+        if workers is not None:
+            workers.close()
+        if controller is not None:
+            logger.info(f"Live: {controller.get_stats()}, frames dropped as stale: {extractor.video_tool.frames_stale}, "
+                        f"sampled out: {extractor.video_tool.frames_skipped}")
+        if profiler is not None and profiler.dump():
+            logger.info(f"Profile written to {profiler.output}")
+        if exporter is not None:
+            exporter.stop()
+            for stage, stats in sorted(Metrics().summary("stage_seconds").items()):
+                if not stats["count"]:
+                    continue
+                logger.info(
+                    f"Latency {stage}: n={stats['count']} p50={stats['p50'] * 1000:.1f}ms "
+                    f"p95={stats['p95'] * 1000:.1f}ms p99={stats['p99'] * 1000:.1f}ms"
+                )
+            logger.info(f"Metrics written to {exporter.path}")
         logger.info("System shutdown.")
+        shutdown_logging()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+
+# Modules import each other from the cctv_system root (e.g. "from config import ...")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.memory import SharedMemory
+
+@pytest.fixture(autouse=True)
+def run_from_root(monkeypatch):
+    """Config paths (model weights, sample video, logs) are relative to the cctv_system root."""
+    monkeypatch.chdir(ROOT)
+
+@pytest.fixture
+def memory(tmp_path, monkeypatch):
+    """A fresh SharedMemory singleton whose incident store lives in tmp_path."""
+    monkeypatch.setattr(SharedMemory, "DB_FILE", str(tmp_path / "incidents.db"))
+    monkeypatch.setattr(SharedMemory, "MEMORY_FILE", str(tmp_path / "incident_history.json"))
+    monkeypatch.setattr(SharedMemory, "_instance", None)
+    memory = SharedMemory()
+    yield memory
+    memory.store.close()
+    SharedMemory._instance = None
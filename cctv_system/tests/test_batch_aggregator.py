@@ -0,0 +1,77 @@
+import pytest
+from agents.aggregator import ConfidenceAggregatorAgent
+from agents.batch_aggregator import BatchAggregatorAgent
+from tools.detections import Detections
+
+NAMES = {0: "person", 39: "bottle", 43: "knife"}
+
+def frame(*hits):
+    """Detections of (class_id, confidence) pairs."""
+    return Detections([[0, 0, 10, 10]] * len(hits), [conf for _, conf in hits], [class_id for class_id, _ in hits], NAMES)
+
+def run(aggregator, sequence, camera_id="CAM-A"):
+    """Feed one camera's frames; returns the frame numbers that confirmed and the incident types."""
+    confirmed = []
+    for frame_count, detections in enumerate(sequence, start=1):
+        for incident in aggregator.run([(camera_id, detections, frame_count, None)]):
+            confirmed.append((frame_count, incident["type"]))
+    return confirmed
+
+@pytest.fixture
+def make(memory):
+    def make(policy="consecutive", cameras=("CAM-A",), **kwargs):
+        aggregator = BatchAggregatorAgent(policy=policy, capacity=1, **kwargs)
+        for camera_id in cameras:
+            aggregator.add_camera(camera_id)
+        return aggregator
+    return make
+
+def test_consecutive_matches_the_per_camera_aggregator(make, memory):
+    sequence = [frame((39, 0.9)), frame((39, 0.9)), frame(), frame((39, 0.9), (0, 0.8)), frame((39, 0.9)),
+                frame((39, 0.7), (43, 0.6)), frame((43, 0.9))]
+    batched = run(make(required=3), sequence)
+    assert batched == [(6, "smoke")]
+
+    memory.reset_session("CAM-A")
+    single = ConfidenceAggregatorAgent("CAM-A")
+    confirmed = [(frame_count, incident["type"]) for frame_count, detections in enumerate(sequence, start=1)
+                 for incident in single.run(detections, frame_count)]
+    assert confirmed == batched
+
+def test_several_hits_in_one_frame_count_separately(make):
+    aggregator = make(required=3)
+    assert run(aggregator, [frame((39, 0.9), (39, 0.8)), frame((39, 0.9))]) == [(2, "smoke")]
+
+def test_weighted_sums_the_best_confidence_per_frame(make):
+    aggregator = make("weighted", confidence_target=1.5)
+    assert run(aggregator, [frame((43, 0.6), (43, 0.2)), frame((43, 0.8)), frame((43, 0.9))]) == [(3, "weapon")]
+
+def test_window_tolerates_missed_frames(make):
+    aggregator = make("window", required=2, window=3)
+    assert run(aggregator, [frame((0, 0.9)), frame(), frame((0, 0.9))]) == [(3, "theft")]
+    strict = make("consecutive", cameras=("CAM-B",), required=2)
+    assert run(strict, [frame((0, 0.9)), frame(), frame((0, 0.9))], "CAM-B") == []
+
+def test_frame_gap_breaks_the_run(make):
+    aggregator = make(required=2)
+    aggregator.add_camera("CAM-A", max_frame_gap=5)
+    assert aggregator.run([("CAM-A", frame((39, 0.9)), 1, None)]) == []
+    assert aggregator.run([("CAM-A", frame((39, 0.9)), 10, None)]) == []
+    assert aggregator.get_counts("CAM-A")["smoke"] == 1
+    assert len(aggregator.run([("CAM-A", frame((39, 0.9)), 12, None)])) == 1
+
+def test_one_tick_serves_many_cameras(make):
+    cameras = [f"CAM-{i}" for i in range(40)]
+    aggregator = make(cameras=cameras, required=2) # Grows past its initial capacity
+    confirmed = []
+    for frame_count in (1, 2):
+        tick = [(camera_id, frame((39, 0.9)) if camera_id in ("CAM-3", "CAM-31") else frame(), frame_count, None)
+                for camera_id in cameras]
+        confirmed += aggregator.run(tick)
+    assert sorted(incident["camera_id"] for incident in confirmed) == ["CAM-3", "CAM-31"]
+    with pytest.raises(ValueError):
+        aggregator.run([("CAM-1", frame(), 3, None), ("CAM-1", frame(), 4, None)])
+
+def test_unknown_policy_is_rejected(memory):
+    with pytest.raises(ValueError):
+        BatchAggregatorAgent(policy="majority")
@@ -0,0 +1,127 @@
+import os
+import queue
+import socket
+import threading
+import time
+import pytest
+from agents.frame_analyzer import FrameAnalyzerAgent
+from tools.yolo_tool import StubYOLOTool
+from utils.cluster import ClusterCoordinator, ClusterWorker, Connection
+
+SAMPLE_VIDEO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sample_video.mp4")
+
+def cameras(count, source="unused.mp4"):
+    return [{"camera_id": f"CAM-{i}", "location": f"Room {i}", "source": source} for i in range(count)]
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.02)
+
+class FakeWorker:
+    """Speaks the worker side of the protocol without running any cameras."""
+
+    def __init__(self, coordinator, worker_id):
+        sock = socket.create_connection(("127.0.0.1", coordinator.server.getsockname()[1]))
+        self.connection = Connection(sock)
+        self.assignments = queue.Queue()
+        self.connection.send({"type": "hello", "worker_id": worker_id})
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self):
+        for message in self.connection.messages():
+            if message["type"] == "assign":
+                self.assignments.put(sorted(camera["camera_id"] for camera in message["cameras"]))
+
+    def assignment(self, timeout=5.0):
+        return self.assignments.get(timeout=timeout)
+
+    def send(self, message):
+        self.connection.send(message)
+
+@pytest.fixture
+def coordinator(memory):
+    coordinator = ClusterCoordinator(cameras(5), "127.0.0.1", 0, heartbeat_timeout=0.5).start()
+    yield coordinator
+    coordinator.finished.set()
+    coordinator.close()
+
+def test_rebalance_splits_evenly_and_keeps_cameras_in_place(coordinator):
+    first = FakeWorker(coordinator, "a")
+    assert first.assignment() == [f"CAM-{i}" for i in range(5)]
+    second = FakeWorker(coordinator, "b")
+    kept, moved = first.assignment(), second.assignment()
+    assert (len(kept), len(moved)) == (3, 2)
+    assert sorted(kept + moved) == [f"CAM-{i}" for i in range(5)]
+
+    # Finished cameras are not handed out again
+    second.send({"type": "camera_done", "camera_id": moved[0]})
+    wait_for(lambda: moved[0] in coordinator.done)
+    third = FakeWorker(coordinator, "c")
+    wait_for(lambda: len(coordinator.workers) == 3)
+    loads = coordinator.get_load()
+    assert sorted(len(load["cameras"]) for load in loads.values()) == [1, 1, 2]
+    assert moved[0] not in {camera for load in loads.values() for camera in load["cameras"]}
+
+def test_missed_heartbeat_reassigns_cameras(coordinator):
+    threading.Thread(target=coordinator.run, daemon=True).start()
+    alive = FakeWorker(coordinator, "alive")
+    alive.assignment()
+    silent = FakeWorker(coordinator, "silent")
+    silent.assignment()
+    alive.assignment()
+
+    # Only "alive" keeps sending heartbeats
+    deadline = time.monotonic() + 5.0
+    while "silent" in coordinator.get_load():
+        assert time.monotonic() < deadline
+        alive.send({"type": "load", "cameras": [], "frames": 0, "fps": 0.0})
+        time.sleep(0.1)
+    assert alive.assignment() == [f"CAM-{i}" for i in range(5)]
+
+def test_incidents_get_central_ids(coordinator, memory):
+    received = []
+    coordinator.on_incident = received.append
+    memory.add_incident({"type": "smoke", "camera_id": "CAM-9", "timestamp": "2026-01-01T00:00:00", "actions": []})
+    worker = FakeWorker(coordinator, "a")
+    worker.assignment()
+    record = {"id": 1, "type": "fire", "camera_id": "CAM-0", "timestamp": "2026-01-01T00:00:01", "actions": []}
+    worker.send({"type": "incident", "local_id": 1, "record": record})
+    worker.send({"type": "incident_update", "local_id": 1, "fields": {"snapshot_path": "frame_7.jpg"}})
+    wait_for(lambda: received and memory.get_incident_by_id(received[0]["id"]).get("snapshot_path"))
+
+    incident = received[0]
+    assert incident["id"] != 1 and incident["worker_id"] == "a"
+    assert memory.get_incident_by_id(incident["id"])["snapshot_path"] == "frame_7.jpg"
+    # The worker's local id must not touch the unrelated central incident 1
+    assert memory.get_incident_by_id(1)["type"] == "smoke"
+
+def test_two_workers_serve_every_camera(memory, tmp_path):
+    received = []
+    coordinator = ClusterCoordinator(cameras(2, SAMPLE_VIDEO), "127.0.0.1", 0, on_incident=received.append).start()
+    port = coordinator.server.getsockname()[1]
+    threads = []
+    for worker_id in ("a", "b"):
+        analyzer = FrameAnalyzerAgent(batch_size=1, motion_gate=False, cascade=False, tiling=False)
+        analyzer.yolo_tool = StubYOLOTool()
+        worker = ClusterWorker(analyzer, worker_id, "127.0.0.1", port, str(tmp_path / worker_id),
+                               heartbeat_interval=0.2)
+        worker.connect()
+        # Both workers are connected before any camera runs, so each gets one
+        wait_for(lambda: worker_id in coordinator.workers)
+        threads.append(threading.Thread(target=worker.run, daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        assert coordinator.finished.wait(timeout=60)
+    finally:
+        coordinator.close()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    # The sample video's demo object confirms one incident per camera, one camera per worker
+    assert sorted(incident["camera_id"] for incident in received) == ["CAM-0", "CAM-1"]
+    assert sorted(incident["worker_id"] for incident in received) == ["a", "b"]
+    assert len({incident["id"] for incident in received}) == 2
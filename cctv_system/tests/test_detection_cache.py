@@ -0,0 +1,80 @@
+import os
+import shutil
+import pytest
+import utils.detection_cache as detection_cache
+from tools.yolo_tool import StubYOLOTool
+from utils.detection_cache import DetectionCache
+
+SAMPLE_VIDEO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sample_video.mp4")
+
+@pytest.fixture
+def video(tmp_path, monkeypatch):
+    model = tmp_path / "model.pt"
+    model.write_bytes(b"weights")
+    monkeypatch.setattr(detection_cache, "YOLO_MODEL_PATH", str(model))
+    path = tmp_path / "video.mp4"
+    shutil.copy(SAMPLE_VIDEO, path)
+    return str(path)
+
+def test_key_follows_content_and_settings(tmp_path, video, monkeypatch):
+    cache = DetectionCache(str(tmp_path / "cache"))
+    key = cache.key(video)
+    copy = str(tmp_path / "copy.mp4")
+    shutil.copy(video, copy)
+    assert cache.key(copy) == key # Same content under another name
+    input_size = detection_cache.MODEL_INPUT_SIZE
+    monkeypatch.setattr(detection_cache, "MODEL_INPUT_SIZE", 320)
+    assert cache.key(video) != key
+    monkeypatch.setattr(detection_cache, "MODEL_INPUT_SIZE", input_size)
+    with open(copy, "ab") as f:
+        f.write(b"\0")
+    assert cache.key(copy) != key
+
+def test_build_and_replay(tmp_path, video):
+    cache = DetectionCache(str(tmp_path / "cache"))
+    assert cache.get(video) is None
+    entry = cache.build(video, StubYOLOTool(), batch_size=4)
+    assert entry.frame_shape is not None and len(entry) > 0
+    replayed = list(cache.get(video).replay(0.5))
+    assert [frame_count for frame_count, _ in replayed] == entry.frames.tolist()
+    # The sample video's demo object shows up in its later frames
+    assert sum(len(detections) for _, detections in replayed) > 0
+    assert all(name == "bottle" for _, detections in replayed for name in detections.class_names)
+
+def test_evicts_least_recently_used(tmp_path, video):
+    cache = DetectionCache(str(tmp_path / "cache"))
+    entries = cache.index["entries"]
+    for key, last_used in (("old", 1.0), ("recent", 3.0), ("middle", 2.0)):
+        os.makedirs(os.path.join(cache.cache_dir, key))
+        entries[key] = {"source": key, "bytes": 400, "last_used": last_used}
+    cache.max_bytes = 1000
+    cache.evict(keep="old")
+    assert sorted(entries) == ["old", "recent"]
+    assert not os.path.exists(os.path.join(cache.cache_dir, "middle"))
+
+def test_replay_confirms_an_incident_and_writes_its_report(tmp_path, memory, monkeypatch):
+    import logging
+    import main
+    from agents.aggregator import ConfidenceAggregatorAgent
+    from agents.reporter import ReportGeneratorAgent
+    from agents.responder import EmergencyResponderAgent
+    from tools.gemini_tool import GeminiTool
+
+    cache = DetectionCache(str(tmp_path / "cache"))
+    cache.build(main.VIDEO_SOURCE, StubYOLOTool())
+    monkeypatch.setattr(main, "DetectionCache", lambda: cache)
+    reporter = ReportGeneratorAgent(workers=1)
+    reporter.gemini_tool = GeminiTool(backend="mock", cache_dir=str(tmp_path / "reports" / "cache"))
+    monkeypatch.setattr(reporter.gemini_tool, "report_path",
+                        lambda incident: str(tmp_path / "reports" / f"incident_{incident['id']}.md"))
+    responder = EmergencyResponderAgent(dry_run=True)
+
+    main.run_replay(ConfidenceAggregatorAgent(), responder, reporter, logging.getLogger("test"))
+    paths = reporter.close()
+    responder.close()
+
+    # Replay decodes no frames, so the incident has no snapshot, and still gets its report
+    assert len(paths) == 1
+    with open(paths[0]) as f:
+        report = f.read()
+    assert "smoke" in report and "No snapshot was recorded" in report
@@ -0,0 +1,37 @@
+from tools.detections import Detections
+
+NAMES = {0: "person", 39: "bottle"}
+
+def detections():
+    return Detections(
+        [[0, 0, 10, 10], [1, 1, 11, 11], [100, 100, 110, 110], [0, 0, 10, 10]],
+        [0.6, 0.9, 0.8, 0.7],
+        [0, 0, 0, 39],
+        NAMES
+    )
+
+def test_detections_indexing_and_filters():
+    dets = detections()
+    assert len(dets) == 4
+    assert dets[3] == {"class": "bottle", "confidence": 0.7, "bbox": [0.0, 0.0, 10.0, 10.0]}
+    assert dets.above(0.75).class_names == ["person", "person"]
+
+def test_to_source_maps_and_clips_boxes():
+    dets = Detections([[20, 10, 60, 50]], [0.9], [0], NAMES)
+    mapped = dets.to_source(scale=0.5, offset=(10, 0), clip_shape=(90, 70))
+    assert mapped.boxes.tolist() == [[20.0, 20.0, 70.0, 90.0]]
+
+def test_dict_round_trip():
+    dets = Detections.from_dicts([
+        {"class": "knife", "confidence": 0.8, "bbox": [1, 2, 3, 4]},
+        {"class": "person", "confidence": 0.6, "bbox": [5, 6, 7, 8]},
+    ], NAMES)
+    assert dets.class_names == ["knife", "person"]
+    assert dets.class_ids[1] == 0
+    assert Detections.from_dicts(dets.to_dicts(), dets.names).class_names == dets.class_names
+
+def test_concat():
+    dets = detections()
+    merged = Detections.concat([dets, None, dets[:1]])
+    assert len(merged) == 5 and merged.names is NAMES
+    assert len(Detections.concat([])) == 0
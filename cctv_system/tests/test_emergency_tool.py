@@ -0,0 +1,70 @@
+import pytest
+from tools.emergency_tool import AlertChannel, SimulatedChannel, EmergencyDispatcher
+
+INCIDENT = {"id": 1, "type": "smoke", "confidence": 0.9, "camera_id": "CAM-001", "location": "Lobby"}
+
+class FlakyChannel(AlertChannel):
+    kind = "flaky"
+    default_action = "Sent on attempt"
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.calls = 0
+
+    def send(self, alert):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("unreachable")
+
+def dispatcher(channels, cooldown=60.0):
+    return EmergencyDispatcher(channels=channels, workers=2, cooldown=cooldown, backoff=0.0, dry_run=False)
+
+def test_channel_without_send_fails_at_construction():
+    class Incomplete(AlertChannel):
+        kind = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    assert SimulatedChannel().name == "simulated"
+
+def test_retries_until_sent():
+    channel = FlakyChannel(failures=2, retries=2)
+    records = dispatcher([channel]).dispatch(INCIDENT).result(timeout=5)
+    assert [(record["status"], record["attempts"]) for record in records] == [("sent", 3)]
+
+def test_gives_up_after_retries():
+    channel = FlakyChannel(failures=5, retries=1)
+    records = dispatcher([channel]).dispatch(INCIDENT).result(timeout=5)
+    assert [(record["status"], record["attempts"]) for record in records] == [("failed", 2)]
+
+def test_repeat_incident_suppressed_during_cooldown():
+    dispatch = dispatcher([SimulatedChannel()])
+    assert dispatch.dispatch(INCIDENT).result(timeout=5)[0]["status"] == "sent"
+    assert dispatch.dispatch(INCIDENT).result(timeout=5)[0]["status"] == "suppressed"
+    # Another camera is not affected
+    other = dict(INCIDENT, camera_id="CAM-002")
+    assert dispatch.dispatch(other).result(timeout=5)[0]["status"] == "sent"
+
+def test_failed_dispatch_does_not_start_cooldown():
+    channel = FlakyChannel(failures=1, retries=0)
+    dispatch = dispatcher([channel])
+    assert dispatch.dispatch(INCIDENT).result(timeout=5)[0]["status"] == "failed"
+    assert dispatch.dispatch(INCIDENT).result(timeout=5)[0]["status"] == "sent"
+
+class BrokenActionChannel(FlakyChannel):
+    default_action = "Sent to {no_such_field}"
+
+def test_broken_action_text_neither_resends_nor_hangs():
+    channel = BrokenActionChannel(failures=0, retries=2)
+    records = dispatcher([channel]).dispatch(INCIDENT).result(timeout=5)
+    assert channel.calls == 1
+    assert [(record["status"], record["attempts"]) for record in records] == [("sent", 1)]
+    dry_run = EmergencyDispatcher(channels=[BrokenActionChannel(failures=0)], dry_run=True)
+    assert dry_run.dispatch(INCIDENT).result(timeout=5)[0]["status"] == "dry_run"
+
+def test_dispatch_resolves_when_a_send_raises(monkeypatch):
+    dispatch = dispatcher([SimulatedChannel()])
+    monkeypatch.setattr(dispatch, "_send", lambda channel, alert: 1 / 0)
+    records = dispatch.dispatch(INCIDENT).result(timeout=5)
+    assert [record["status"] for record in records] == ["failed"]
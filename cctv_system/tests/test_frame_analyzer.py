@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from agents.frame_analyzer import FrameAnalyzerAgent
+from tools.yolo_tool import StubYOLOTool
+
+ROI = [[[0.0, 0.0], [0.25, 0.0], [0.25, 1.0], [0.0, 1.0]]] # Left quarter
+
+class RecordingStub(StubYOLOTool):
+    """Stub detector that remembers the input size and shape of every frame it was asked to run."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def detect(self, frame, raw=False, imgsz=None, mock=True):
+        self.calls.append((frame.shape[:2], imgsz))
+        return super().detect(frame, raw, imgsz, mock)
+
+    def detect_batch(self, frames, raw=False, imgsz=None, mock=True):
+        self.calls.extend((frame.shape[:2], imgsz) for frame in frames)
+        return super().detect_batch(frames, raw, imgsz, mock)
+
+def analyzer(**kwargs):
+    return FrameAnalyzerAgent(batch_size=1, motion_gate=False, **kwargs)
+
+@pytest.mark.parametrize("mode", ["plain", "cascade", "tiling"])
+def test_roi_crops_run_at_their_own_input_size(mode):
+    agent = analyzer(cascade=mode == "cascade", tiling=mode == "tiling")
+    stubs = []
+    if mode == "plain":
+        agent.yolo_tool = RecordingStub()
+        stubs.append(agent.yolo_tool)
+    else:
+        # The cascade's detector only runs on escalated frames: check the screener and the tiler's full-frame pass
+        attribute = "screener" if mode == "cascade" else "detector"
+        stub = RecordingStub()
+        stub.imgsz = agent.yolo_tool.screener.imgsz if mode == "cascade" else stub.imgsz
+        setattr(agent.yolo_tool, attribute, stub)
+        stubs.append(stub)
+    agent.set_roi(None, ROI)
+    agent.run(np.zeros((1080, 1920, 3), dtype=np.uint8))
+    shape, imgsz = stubs[0].calls[0]
+    assert shape == (1080, 513) # The 480 px wide quarter plus the 32 px margin (+1: inclusive edge)
+    # The crop's 1080 px side at the 640 / 1920 scale of the whole frame, stride-aligned; the screener never runs larger
+    expected = 320 if mode == "cascade" else 384
+    assert imgsz == expected
+
+def test_detections_outside_the_roi_are_dropped():
+    agent = analyzer()
+    agent.yolo_tool = StubYOLOTool()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame[350, 325, 1] = 255 # The stub's demo object at (300, 300)-(350, 450)
+    assert len(agent.run(frame)) == 1
+    agent.set_roi(None, ROI)
+    assert len(agent.run(frame)) == 0
+    agent.set_roi(None, [[[0.4, 0.5], [0.6, 0.5], [0.6, 1.0], [0.4, 1.0]]])
+    assert len(agent.run(frame)) == 1
+
+class FlagRecordingStub(StubYOLOTool):
+    """Stub detector that remembers mock_enabled and the per-call mock argument of every batch."""
+
+    def __init__(self):
+        super().__init__()
+        self.flags = []
+
+    def detect_batch(self, frames, raw=False, imgsz=None, mock=True):
+        self.flags.append((self.mock_enabled, mock))
+        return super().detect_batch(frames, raw, imgsz, mock)
+
+def test_roi_crops_leave_the_shared_tool_untouched():
+    # Another camera's thread may be using the same tool at the same time
+    agent = analyzer()
+    agent.yolo_tool = FlagRecordingStub()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame[350, 325, 1] = 255
+    agent.set_roi(None, [[[0.4, 0.5], [0.6, 0.5], [0.6, 1.0], [0.4, 1.0]]])
+    assert len(agent.run(frame)) == 1 # The demo object, added once for the whole frame
+    assert agent.yolo_tool.flags == [(True, False)]
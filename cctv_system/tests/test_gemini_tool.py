@@ -0,0 +1,56 @@
+import os
+from tools.gemini_tool import GeminiTool, MockReportBackend
+
+class CountingBackend(MockReportBackend):
+    def __init__(self):
+        super().__init__(latency=0)
+        self.calls = 0
+
+    def generate(self, incident_data, prompt, timeout):
+        self.calls += 1
+        return super().generate(incident_data, prompt, timeout)
+
+def incident(incident_id, incident_type="smoke", camera_id="CAM-001"):
+    return {
+        "id": incident_id, "type": incident_type, "confidence": 0.951, "camera_id": camera_id,
+        "location": "Lobby", "timestamp": f"2026-01-01T00:00:{incident_id:02d}",
+        "snapshot_path": f"frame_{incident_id}.jpg",
+        "actions": [{"action": "Alert sent to Fire Department", "timestamp": f"2026-01-01T00:01:{incident_id:02d}"}],
+    }
+
+def tool(tmp_path, max_entries=256):
+    gemini = GeminiTool(backend="mock", cache_dir=str(tmp_path / "cache"), cache_max_entries=max_entries)
+    gemini.backend = CountingBackend()
+    return gemini
+
+def test_incidents_with_the_same_content_share_a_report(tmp_path):
+    gemini = tool(tmp_path)
+    assert gemini.cache_key(incident(1)) == gemini.cache_key(incident(2))
+    assert gemini.cache_key(incident(1)) != gemini.cache_key(incident(1, camera_id="CAM-002"))
+
+    first = gemini.generate_report(incident(1), str(tmp_path / "1.md"))
+    second = gemini.generate_report(incident(2), str(tmp_path / "2.md"))
+    assert gemini.backend.calls == 1
+    # Per-incident fields are filled in, not copied from the cached report
+    with open(second) as f:
+        report = f.read()
+    assert "2026-01-01T00:00:02" in report and "frame_2.jpg" in report and "{{" not in report
+    with open(first) as f:
+        assert "frame_1.jpg" in f.read()
+
+def test_cache_is_bounded(tmp_path):
+    gemini = tool(tmp_path, max_entries=2)
+    for i, incident_type in enumerate(["smoke", "fire", "weapon", "fight"]):
+        gemini.generate_report(incident(i, incident_type), str(tmp_path / f"{i}.md"))
+    assert len(os.listdir(tmp_path / "cache")) == 2
+
+def test_incident_without_snapshot_gets_a_report(tmp_path):
+    gemini = tool(tmp_path)
+    data = dict(incident(3), snapshot_path=None)
+    path = gemini.generate_report(data, str(tmp_path / "3.md"))
+    with open(path) as f:
+        report = f.read()
+    assert "No snapshot was recorded" in report and "{{" not in report
+    assert gemini.backend.calls == 1
+    # Incidents with and without a snapshot do not share a cached report
+    assert gemini.cache_key(data) != gemini.cache_key(incident(3))
@@ -0,0 +1,34 @@
+import json
+from utils.incident_store import IncidentStore
+
+LEGACY = [
+    {"id": 1, "type": "smoke", "camera_id": "CAM-001", "timestamp": "2026-01-01T10:00:00", "actions": []},
+    {"id": 2, "type": "fire", "camera_id": "CAM-002", "timestamp": "2026-01-02T10:00:00", "actions": []},
+]
+
+def test_migrate_json_imports_once(tmp_path):
+    legacy = tmp_path / "incident_history.json"
+    legacy.write_text(json.dumps(LEGACY))
+    store = IncidentStore(str(tmp_path / "incidents.db"), legacy_json_path=str(legacy))
+    assert store.count() == 2
+    assert store.get(2)["type"] == "fire"
+    # Already migrated: a second run (or a reopened store) does not import again
+    assert store.migrate_json(str(legacy)) == 0
+    store.close()
+    reopened = IncidentStore(str(tmp_path / "incidents.db"), legacy_json_path=str(legacy))
+    assert reopened.count() == 2
+    # New incidents continue after the migrated ids
+    assert reopened.add({"type": "weapon", "camera_id": "CAM-001", "timestamp": "2026-01-03T10:00:00"}) == 3
+    reopened.close()
+
+def test_queries_and_updates(tmp_path):
+    store = IncidentStore(str(tmp_path / "incidents.db"))
+    for record in LEGACY:
+        store.add(dict(record, id=None))
+    assert [record["id"] for record in store.by_camera("CAM-001")] == [1]
+    assert [record["type"] for record in store.by_type("fire")] == ["fire"]
+    assert len(store.in_range("2026-01-01T00:00:00", "2026-01-01T23:59:59")) == 1
+    assert store.update(1, snapshot_path="frame_12.jpg")["snapshot_path"] == "frame_12.jpg"
+    assert store.get(1)["snapshot_path"] == "frame_12.jpg"
+    assert store.update(99, snapshot_path="x") is None
+    store.close()
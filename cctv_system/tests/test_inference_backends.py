@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+from tools.inference_backends import InferenceBackend, OnnxBackend
+from utils.backend_report import parse_backend
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        InferenceBackend("yolov8n.pt")
+    assert OnnxBackend("yolov8n.pt", int8=True).name == "onnx-int8"
+
+@pytest.mark.parametrize("spec, expected", [
+    ("torch", ("torch", False)),
+    ("onnx", ("onnx", False)),
+    ("onnx-int8", ("onnx", True)),
+    ("openvino-int8", ("openvino", True)),
+])
+def test_parse_backend(spec, expected):
+    assert parse_backend(spec) == expected
+
+@pytest.mark.parametrize("spec", ["torch-int8", "onnx-fp16", "tensorrt"])
+def test_parse_backend_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_backend(spec)
+
+def test_onnx_fp32_matches_torch(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    import os
+    import shutil
+    import cv2
+    import torch
+    import ultralytics
+    from ultralytics import YOLO
+    from tools.detections import Detections
+    from tools.inference_backends import postprocess
+    from tools.preprocess import LetterboxPreprocessor
+
+    # Export next to a copy of the weights so the test leaves no .onnx file in the tree
+    model_path = str(tmp_path / "yolov8n.pt")
+    shutil.copy("yolov8n.pt", model_path)
+    frame = cv2.imread(os.path.join(os.path.dirname(ultralytics.__file__), "assets", "bus.jpg"))
+    tensor = LetterboxPreprocessor(640)([frame])[0].copy()
+
+    backend = OnnxBackend(model_path, int8=False, imgsz=640).load()
+    onnx_raw = backend.forward(tensor)
+    model = YOLO(model_path)
+    with torch.no_grad():
+        torch_raw = model.model.eval()(torch.from_numpy(tensor))[0].numpy()
+    assert onnx_raw.shape == torch_raw.shape
+    np.testing.assert_allclose(onnx_raw, torch_raw, atol=1e-3)
+
+    # A threshold relative to the best score keeps candidates even for weakly trained weights
+    conf = float(torch_raw[:, 4:].max()) / 2
+    torch_dets = Detections.from_array(postprocess(torch_raw, conf=conf)[0], dict(model.names))
+    onnx_dets = Detections.from_array(postprocess(onnx_raw, conf=conf)[0], backend.names)
+    assert len(torch_dets) > 0
+    assert onnx_dets.class_names == torch_dets.class_names
+    np.testing.assert_allclose(onnx_dets.boxes, torch_dets.boxes, atol=1.0)
+    np.testing.assert_allclose(onnx_dets.confidences, torch_dets.confidences, rtol=0.01)
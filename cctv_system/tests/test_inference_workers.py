@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import pytest
+from utils.frame_pool import SharedFrameRing
+from utils.inference_workers import InferenceWorkerPool
+
+def frames(count):
+    """Frames outside the ring; every other one shows the stub's demo object."""
+    result = []
+    for i in range(count):
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        if i % 2 == 0:
+            frame[350, 325, 1] = 255
+        result.append(frame)
+    return result
+
+def start_pool(ring_size=4, stub_latency=0.0):
+    ring = SharedFrameRing(ring_size)
+    return InferenceWorkerPool(ring, workers=1, batch_size=2, cascade=False, tiling=False,
+                               stub_latency=stub_latency).start()
+
+def collect(pool, count, timeout=30.0):
+    results = {}
+    deadline = time.monotonic() + timeout
+    while len(results) < count:
+        assert time.monotonic() < deadline, "Timed out waiting for worker results"
+        batch = pool.get_result(timeout=0.5)
+        if batch is not None:
+            results.update(batch[1])
+    return results
+
+def test_results_come_back_by_seq_and_free_every_slot():
+    pool = start_pool()
+    try:
+        copied = {seq: pool.submit(seq, frame, timeout=5.0) for seq, frame in enumerate(frames(4))}
+        assert sorted(copied.values()) == [0, 1, 2, 3]
+        results = collect(pool, 4)
+        assert sorted(results) == [0, 1, 2, 3]
+        for seq, detections in results.items():
+            assert detections.class_names == (["bottle"] if seq % 2 == 0 else [])
+            pool.ring.release_slot(copied[seq])
+        assert pool.ring.free.qsize() == pool.ring.size
+    finally:
+        pool.close()
+
+def test_worker_errors_are_raised_by_get_result():
+    pool = start_pool()
+    try:
+        # A single-channel frame breaks the stub's colour check inside the worker
+        pool.submit(0, np.zeros((480, 640), dtype=np.uint8), timeout=5.0)
+        with pytest.raises(RuntimeError, match=r"frames \[0\]"):
+            collect(pool, 1)
+    finally:
+        pool.close()
+
+def test_close_with_frames_in_flight():
+    pool = start_pool(stub_latency=0.2)
+    processes = list(pool.processes)
+    for seq, frame in enumerate(frames(4)):
+        pool.submit(seq, frame, timeout=5.0)
+    start = time.monotonic()
+    pool.close()
+    assert time.monotonic() - start < 15.0
+    assert not any(process.is_alive() for process in processes)
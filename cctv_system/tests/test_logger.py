@@ -0,0 +1,19 @@
+import json
+import logging
+import utils.logger as logger_module
+from utils.logger import setup_logger, shutdown_logging
+
+def test_records_after_shutdown_are_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger_module, "LOG_ASYNC", True)
+    monkeypatch.setattr(logger_module, "LOG_SINGLE_FILE", False)
+    log_file = str(tmp_path / "after_shutdown.log")
+    logger = setup_logger("test.after_shutdown", log_file, level=logging.WARNING)
+    logger.warning("queued")
+    shutdown_logging()
+    logger.warning("direct")
+    for handler in logger.handlers:
+        handler.flush()
+    with open(log_file) as f:
+        messages = [json.loads(line)["message"] for line in f]
+    assert messages == ["queued", "direct"]
+    assert not any(isinstance(handler, logging.handlers.QueueHandler) for handler in logger.handlers)
@@ -0,0 +1,35 @@
+import numpy as np
+from utils.pipeline import FramePipeline, _END
+
+class CountingExtractor:
+    def __init__(self):
+        self.released = []
+
+    def release(self, frame):
+        self.released.append(frame)
+
+class StoppingAnalyzer:
+    """Asks the pipeline to stop while it is working on the frame, like a Ctrl+C mid-inference."""
+    batch_size = 1
+
+    def __init__(self):
+        self.pipeline = None
+
+    def run(self, frame):
+        self.pipeline.stop()
+        return []
+
+def test_frame_dropped_during_stop_is_released():
+    extractor = CountingExtractor()
+    analyzer = StoppingAnalyzer()
+    pipeline = FramePipeline(extractor, [analyzer], None, "unused", queue_size=2, snapshot_workers=0)
+    analyzer.pipeline = pipeline
+    pipeline._remaining = {"analyze": 1}
+    for _ in range(2):
+        pipeline.snapshot_queue.put("busy") # The snapshot stage is not keeping up
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    pipeline.analyze_queue.put((0, 0, frame))
+    pipeline.analyze_queue.put(_END)
+    pipeline._analyze_stage(analyzer)
+    assert len(extractor.released) == 1 and extractor.released[0] is frame
+    assert not pipeline.errors
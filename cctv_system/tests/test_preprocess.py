@@ -0,0 +1,35 @@
+import numpy as np
+from tools.detections import Detections
+from tools.preprocess import LetterboxPreprocessor
+
+def test_target_shape_is_stride_aligned():
+    preprocessor = LetterboxPreprocessor(640)
+    assert preprocessor.target_shape((1080, 1920)) == (384, 640)
+    assert preprocessor.target_shape((480, 640)) == (480, 640)
+    assert preprocessor.target_shape((1080, 1920), imgsz=320) == (192, 320)
+
+def test_letterbox_geometry_maps_boxes_back():
+    preprocessor = LetterboxPreprocessor(640)
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    frame[540:, :, 2] = 255 # Red bottom half (BGR)
+    tensor, geometries = preprocessor([frame])
+    assert tensor.shape == (1, 3, 384, 640) and tensor.dtype == np.float32
+    scale, (top, left) = geometries[0]
+    assert (scale, top, left) == (1 / 3, 12, 0)
+    # RGB channel order, 0-1 range, gray padding above the frame
+    assert tensor[0, 0, 300, 320] == 1.0 and tensor[0, 2, 300, 320] == 0.0
+    assert np.allclose(tensor[0, :, 0, 0], 114 / 255)
+
+    model_box = Detections([[left + 30, top + 60, left + 90, top + 120]], [0.9], [0])
+    assert np.allclose(model_box.to_source(scale, (left, top)).boxes, [[90, 180, 270, 360]])
+
+def test_mixed_sizes_share_a_square_input_and_the_tensor_is_reused():
+    preprocessor = LetterboxPreprocessor(320)
+    frames = [np.zeros((240, 320, 3), np.uint8), np.zeros((320, 240, 3), np.uint8)]
+    tensor, geometries = preprocessor(frames)
+    assert tensor.shape == (2, 3, 320, 320)
+    assert geometries == [(1.0, (40, 0)), (1.0, (0, 40))]
+    again, _ = preprocessor(frames[:1] * 2)
+    assert again.shape == (2, 3, 256, 320)
+    reused, _ = preprocessor(frames[:1] * 2)
+    assert reused.base is again.base
@@ -0,0 +1,19 @@
+from agents.reporter import ReportGeneratorAgent
+
+def test_close_reports_failed_generations(monkeypatch):
+    reporter = ReportGeneratorAgent(workers=1)
+    logged = []
+    monkeypatch.setattr(reporter, "log", lambda message, level="info", sample_key=None: logged.append((level, message)))
+
+    def generate_report(incident_data):
+        if incident_data["id"] == 2:
+            raise KeyError("snapshot_path")
+        return f"incident_{incident_data['id']}.md"
+
+    monkeypatch.setattr(reporter.gemini_tool, "generate_report", generate_report)
+    for incident_id in (1, 2):
+        reporter.submit({"id": incident_id, "type": "smoke"})
+    assert reporter.close() == ["incident_1.md"]
+    assert [message for level, message in logged if level == "error"] == [
+        "Report generation failed: KeyError: 'snapshot_path'"
+    ]
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from tools.detections import Detections
+from tools.roi_tool import RegionOfInterestTool
+
+# Left half of the frame and a small square in the bottom right corner
+POLYGONS = [
+    [[0.0, 0.0], [0.5, 0.0], [0.5, 1.0], [0.0, 1.0]],
+    [[0.8, 0.8], [0.9, 0.8], [0.9, 0.9], [0.8, 0.9]],
+]
+
+def test_geometry_scales_polygons_and_caches_per_shape():
+    roi = RegionOfInterestTool(POLYGONS, margin=10)
+    rects, mask = roi.geometry((1000, 2000, 3))
+    assert rects.tolist() == [[0, 0, 1011, 1000], [1590, 790, 1811, 911]]
+    assert mask.shape == (1000, 2000)
+    assert mask[500, 900] and not mask[500, 1100] and mask[850, 1700] and not mask[700, 1700]
+    assert roi.geometry((1000, 2000)) is roi.geometry((1000, 2000, 3))
+
+def test_overlapping_crops_are_merged():
+    roi = RegionOfInterestTool([
+        [[0.1, 0.1], [0.4, 0.1], [0.4, 0.4], [0.1, 0.4]],
+        [[0.3, 0.3], [0.6, 0.3], [0.6, 0.6], [0.3, 0.6]],
+    ], margin=0)
+    rects, _ = roi.geometry((100, 100))
+    assert rects.tolist() == [[10, 10, 61, 61]]
+
+def test_crops_are_views_and_counted():
+    roi = RegionOfInterestTool(POLYGONS, margin=0)
+    frame = np.zeros((100, 200, 3), dtype=np.uint8)
+    crops = roi.crops(frame)
+    assert [(crop.shape[:2], x0, y0) for crop, x0, y0 in crops] == [((100, 101), 0, 0), ((11, 21), 160, 80)]
+    assert all(np.shares_memory(crop, frame) for crop, _, _ in crops)
+    assert roi.get_stats()["pixel_ratio"] == round((100 * 101 + 11 * 21) / (100 * 200), 3)
+
+def test_filter_by_anchor_point():
+    boxes = [[10, 10, 30, 30], [120, 10, 140, 30], [70, 60, 120, 100], [160, 40, 180, 88]]
+    dets = Detections(boxes, [0.9] * 4, [0] * 4)
+    center = RegionOfInterestTool(POLYGONS)
+    assert center.filter(dets, (100, 200)).boxes.tolist() == [[10, 10, 30, 30], [70, 60, 120, 100]]
+    assert center.get_stats()["detections_outside"] == 2
+    # The last box only reaches into the small square with its bottom edge
+    bottom = RegionOfInterestTool(POLYGONS, anchor="bottom")
+    assert bottom.filter(dets, (100, 200)).boxes.tolist() == [[10, 10, 30, 30], [70, 60, 120, 100], [160, 40, 180, 88]]
+
+def test_merge_maps_crop_boxes_to_the_frame():
+    roi = RegionOfInterestTool(POLYGONS, margin=0)
+    parts = [(Detections([[5, 5, 15, 15]], [0.9], [0]), 0, 0), (Detections([[2, 2, 8, 8]], [0.8], [0]), 160, 80),
+             (Detections([[150, 5, 160, 15]], [0.7], [0]), 0, 0)]
+    merged = roi.merge(parts, (100, 200))
+    assert merged.boxes.tolist() == [[5, 5, 15, 15], [162, 82, 168, 88]]
+
+def test_input_size_follows_the_crop():
+    roi = RegionOfInterestTool(POLYGONS, min_input_size=128)
+    # A 4K frame runs at 640: a quarter-width crop runs at the same scale
+    assert roi.input_size((2160, 960), (2160, 3840), 640) == 384
+    assert roi.input_size((100, 100), (2160, 3840), 640) == 128
+    assert roi.input_size((2160, 3840), (2160, 3840), 640) == 640
+
+def test_invalid_regions_are_rejected():
+    with pytest.raises(ValueError):
+        RegionOfInterestTool([])
+    with pytest.raises(ValueError):
+        RegionOfInterestTool([[[0, 0], [1, 1]]])
+    with pytest.raises(ValueError):
+        RegionOfInterestTool(POLYGONS, anchor="top")
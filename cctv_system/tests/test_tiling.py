@@ -0,0 +1,38 @@
+import numpy as np
+from tools.detections import Detections, nms_indices
+from tools.yolo_tool import tile_grid
+
+def test_tile_grid_covers_the_frame_with_overlap():
+    tiles = tile_grid(2160, 3840, 640, 0.2)
+    assert np.all(tiles[:, 2] - tiles[:, 0] == 640) and np.all(tiles[:, 3] - tiles[:, 1] == 640)
+    # Every pixel is inside a tile, and the last row/column ends at the frame edge
+    covered = np.zeros((2160, 3840), dtype=bool)
+    for x0, y0, x1, y1 in tiles:
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+    assert tiles[:, 2].max() == 3840 and tiles[:, 3].max() == 2160
+    xs = sorted(set(tiles[:, 0].tolist()))
+    assert all(640 - (b - a) >= 0.2 * 640 for a, b in zip(xs, xs[1:]))
+
+def test_tile_grid_small_frames():
+    assert tile_grid(480, 640, 640, 0.2).tolist() == [[0, 0, 640, 480]]
+    assert tile_grid(480, 1000, 640, 0.2).tolist() == [[0, 0, 640, 480], [360, 0, 1000, 480]]
+
+def test_nms_keeps_best_box_per_overlapping_group_and_class():
+    dets = Detections(
+        [[0, 0, 10, 10], [1, 1, 11, 11], [100, 100, 110, 110], [0, 0, 10, 10]],
+        [0.6, 0.9, 0.8, 0.7],
+        [0, 0, 0, 39]
+    )
+    keep = nms_indices(dets.boxes, dets.confidences, dets.class_ids, 0.5)
+    # Highest confidence first; box 0 overlaps the better box 1; box 3 is another class
+    assert keep.tolist() == [1, 2, 3]
+
+def test_nms_ios_removes_boxes_inside_larger_ones():
+    boxes = np.array([[0, 0, 100, 100], [10, 10, 30, 30]], dtype=np.float32)
+    confidences = np.array([0.9, 0.8])
+    class_ids = np.array([0, 0])
+    assert nms_indices(boxes, confidences, class_ids, 0.5, "iou").tolist() == [0, 1]
+    assert nms_indices(boxes, confidences, class_ids, 0.5, "ios").tolist() == [0]
+    assert len(Detections(boxes, confidences, class_ids).nms(0.5, "ios")) == 1
+    assert len(Detections().nms()) == 0
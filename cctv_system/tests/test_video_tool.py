@@ -0,0 +1,14 @@
+from tools.video_tool import VideoTool
+
+def test_capture_times_untracked_by_default():
+    tool = VideoTool("0")
+    assert tool.capture_times is None
+    assert tool.pop_capture_time(1) is None
+
+def test_pop_capture_time_drops_older_frames():
+    tool = VideoTool("0")
+    tool.track_capture_times()
+    tool.capture_times.update({1: 0.1, 2: 0.2, 3: 0.3})
+    assert tool.pop_capture_time(2) == 0.2
+    # Frame 1 was dropped downstream and never popped
+    assert list(tool.capture_times) == [3]
@@ -0,0 +1,152 @@
+import numpy as np
+
+def nms_indices(boxes, confidences, class_ids, threshold=0.5, metric="iou"):
+    """
+    Class-aware greedy non-maximum suppression. Returns the indices of the kept boxes,
+    highest confidence first. metric="ios" measures overlap as intersection over the
+    smaller box, which also removes partial boxes of an object inside a larger one.
+    """
+    order = np.argsort(-confidences, kind="stable")
+    boxes = boxes[order]
+    class_ids = class_ids[order]
+    areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        rest = boxes[i + 1:]
+        width = np.clip(np.minimum(rest[:, 2], boxes[i, 2]) - np.maximum(rest[:, 0], boxes[i, 0]), 0, None)
+        height = np.clip(np.minimum(rest[:, 3], boxes[i, 3]) - np.maximum(rest[:, 1], boxes[i, 1]), 0, None)
+        intersection = width * height
+        if metric == "ios":
+            base = np.minimum(areas[i + 1:], areas[i])
+        else:
+            base = areas[i + 1:] + areas[i] - intersection
+        overlap = intersection / np.maximum(base, 1e-9)
+        suppressed[i + 1:] |= (class_ids[i + 1:] == class_ids[i]) & (overlap > threshold)
+    return order[keep]
+
+class Detections:
+    """
+    Detection results for one frame stored as contiguous arrays:
+    boxes (N, 4) xyxy float32, confidences (N,) float64 and class_ids (N,) int32.
+    Iterating or indexing with an int yields the legacy
+    {"class", "confidence", "bbox"} dicts, built lazily.
+    """
+
+    __slots__ = ("boxes", "confidences", "class_ids", "names")
+
+    def __init__(self, boxes=None, confidences=None, class_ids=None, names=None):
+        self.boxes = np.zeros((0, 4), dtype=np.float32) if boxes is None else np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = np.zeros(0, dtype=np.float64) if confidences is None else np.ascontiguousarray(confidences, dtype=np.float64).reshape(-1)
+        self.class_ids = np.zeros(0, dtype=np.int32) if class_ids is None else np.ascontiguousarray(class_ids, dtype=np.int32).reshape(-1)
+        self.names = names if names is not None else {} # {class_id: class_name}
+
+    @classmethod
+    def from_result(cls, result, names):
+        """Build from an ultralytics Results object without touching individual boxes."""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls(names=names)
+        return cls(
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy(),
+            boxes.cls.cpu().numpy(),
+            names
+        )
+
+    @classmethod
+    def from_array(cls, detections, names):
+        """Build from an (N, 6) [x1, y1, x2, y2, confidence, class_id] array (NMS output)."""
+        return cls(detections[:, :4], detections[:, 4], detections[:, 5], names)
+
+    @classmethod
+    def from_dicts(cls, detections, names=None):
+        """Build from legacy detection dicts."""
+        names = dict(names) if names else {}
+        ids = {name: class_id for class_id, name in names.items()}
+        class_ids = []
+        for det in detections:
+            if det["class"] not in ids:
+                ids[det["class"]] = max(names, default=-1) + 1
+                names[ids[det["class"]]] = det["class"]
+            class_ids.append(ids[det["class"]])
+        return cls(
+            [det["bbox"] for det in detections],
+            [det["confidence"] for det in detections],
+            class_ids,
+            names
+        )
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [part for part in parts if part is not None]
+        if not parts:
+            return cls()
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            np.concatenate([part.boxes for part in parts]),
+            np.concatenate([part.confidences for part in parts]),
+            np.concatenate([part.class_ids for part in parts]),
+            parts[0].names
+        )
+
+    def __len__(self):
+        return len(self.confidences)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return {
+                "class": self.names.get(int(self.class_ids[index]), str(int(self.class_ids[index]))),
+                "confidence": float(self.confidences[index]),
+                "bbox": self.boxes[index].tolist()
+            }
+        # Slices, index arrays and boolean masks select a sub-container
+        return Detections(self.boxes[index], self.confidences[index], self.class_ids[index], self.names)
+
+    def to_source(self, scale=1.0, offset=(0.0, 0.0), clip_shape=None):
+        """
+        Map boxes from a resized/cropped view back to source pixels:
+        source = (box - offset) / scale, optionally clipped to a (height, width) frame.
+        """
+        if not len(self):
+            return self
+        boxes = self.boxes.copy()
+        boxes[:, [0, 2]] -= offset[0]
+        boxes[:, [1, 3]] -= offset[1]
+        if scale != 1.0:
+            boxes /= scale
+        if clip_shape is not None:
+            boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, clip_shape[1])
+            boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, clip_shape[0])
+        return Detections(boxes, self.confidences, self.class_ids, self.names)
+
+    def nms(self, threshold=0.5, metric="iou"):
+        """Drop boxes that overlap a higher-confidence box of the same class (see nms_indices)."""
+        if len(self) < 2:
+            return self
+        return self[nms_indices(self.boxes, self.confidences, self.class_ids, threshold, metric)]
+
+    def filter(self, mask):
+        return self[np.asarray(mask)]
+
+    def above(self, threshold):
+        """Detections with confidence >= threshold."""
+        return self.filter(self.confidences >= threshold)
+
+    @property
+    def class_names(self):
+        return [self.names.get(int(class_id), str(int(class_id))) for class_id in self.class_ids]
+
+    def to_dicts(self):
+        return list(self)
+
+    def __repr__(self):
+        return f"Detections(n={len(self)})"
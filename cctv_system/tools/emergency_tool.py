@@ -1,16 +1,268 @@
-from config import EMERGENCY_TYPES
+import json
+import smtplib
+import subprocess
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+from utils.metrics import Metrics
+from config import (
+    EMERGENCY_TYPES, EMERGENCY_CHANNELS, EMERGENCY_WORKERS, EMERGENCY_TIMEOUT, EMERGENCY_MAX_RETRIES,
+    EMERGENCY_RETRY_BACKOFF, EMERGENCY_COOLDOWN, EMERGENCY_DRY_RUN
+)
 
-class EmergencyTool:
-    def __init__(self):
+class AlertChannel(ABC):
+    """
+    One way of notifying responders. send() raises on failure; timeouts, retries and
+    concurrency are handled by the dispatcher. `action` is the history entry recorded on
+    success, formatted with the alert's fields.
+    """
+    kind = None
+    default_action = None
+
+    def __init__(self, name=None, timeout=EMERGENCY_TIMEOUT, retries=EMERGENCY_MAX_RETRIES, action=None):
+        self.name = name or self.kind
+        self.timeout = timeout
+        self.retries = retries
+        self.action = action or self.default_action
+
+    def describe(self, alert):
+        return self.action.format(**alert)
+
+    @abstractmethod
+    def send(self, alert):
+        pass
+
+class SimulatedChannel(AlertChannel):
+    """Records the action without contacting anything (the defaults until real channels are set up)."""
+    kind = "simulated"
+    default_action = "Alert sent to {target}"
+
+    def send(self, alert):
         pass
 
-    def trigger_response(self, incident_type):
-        response_target = EMERGENCY_TYPES.get(incident_type, "General Emergency")
-        
-        actions = [
-            f"Alert sent to {response_target}",
-            f"Local alarm triggered for {incident_type}",
-            "Building admin notified"
-        ]
-        
-        return actions
+class LocalAlarmChannel(AlertChannel):
+    """Runs a local alarm command (e.g. a siren or strobe script), or prints the alarm if none is set."""
+    kind = "alarm"
+    default_action = "Local alarm triggered for {type}"
+
+    def __init__(self, command=None, **kwargs):
+        super().__init__(**kwargs)
+        self.command = command
+
+    def send(self, alert):
+        if not self.command:
+            print(f"[ALARM] {alert['type']} at {alert['location']} ({alert['camera_id']})")
+            return
+        subprocess.run([part.format(**alert) for part in self.command], timeout=self.timeout, check=True,
+                       stdout=subprocess.DEVNULL)
+
+class WebhookChannel(AlertChannel):
+    """POSTs the alert as JSON; any non-2xx response counts as a failure."""
+    kind = "webhook"
+    default_action = "Alert posted to {channel}"
+
+    def __init__(self, url, headers=None, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.headers = dict(headers or {})
+
+    def send(self, alert):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(alert).encode("utf-8"), method="POST",
+            headers={"Content-Type": "application/json", **self.headers}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+class SmtpChannel(AlertChannel):
+    """Emails the alert through an SMTP relay."""
+    kind = "smtp"
+    default_action = "Email sent to {recipients}"
+
+    def __init__(self, host, recipients, sender="cctv@localhost", port=25, username=None, password=None,
+                 starttls=False, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.recipients = list(recipients)
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def describe(self, alert):
+        return self.action.format(**alert, recipients=", ".join(self.recipients))
+
+    def send(self, alert):
+        message = EmailMessage()
+        message["Subject"] = f"[ALERT] {alert['type']} at {alert['location']} ({alert['camera_id']})"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(json.dumps(alert, indent=2))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+CHANNELS = {
+    "simulated": SimulatedChannel,
+    "alarm": LocalAlarmChannel,
+    "webhook": WebhookChannel,
+    "smtp": SmtpChannel,
+}
+
+def create_channel(spec):
+    """Build a channel from an EMERGENCY_CHANNELS entry, e.g. {"type": "webhook", "url": ...}."""
+    spec = dict(spec)
+    kind = spec.pop("type", None)
+    if kind not in CHANNELS:
+        raise ValueError(f"Unknown emergency channel '{kind}' (expected {', '.join(CHANNELS)})")
+    return CHANNELS[kind](**spec)
+
+class EmergencyDispatcher:
+    """
+    Fans an incident out to every channel concurrently on a small thread pool, so a slow
+    or unreachable channel never holds up the frame loop or the other channels. Repeat
+    incidents of the same type on the same camera are suppressed for `cooldown` seconds.
+    """
+
+    def __init__(self, channels=EMERGENCY_CHANNELS, workers=EMERGENCY_WORKERS, cooldown=EMERGENCY_COOLDOWN,
+                 backoff=EMERGENCY_RETRY_BACKOFF, dry_run=EMERGENCY_DRY_RUN):
+        self.channels = [create_channel(spec) if isinstance(spec, dict) else spec for spec in channels]
+        self.cooldown = cooldown
+        self.backoff = backoff
+        self.dry_run = dry_run
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dispatch")
+        self.lock = threading.Lock()
+        self.last_dispatch = {} # {(camera_id, incident type): time.monotonic() of the last dispatch}
+        self.metrics = Metrics()
+
+    @staticmethod
+    def build_alert(incident):
+        return {
+            "incident_id": incident.get("id"),
+            "type": incident["type"],
+            "target": EMERGENCY_TYPES.get(incident["type"], "General Emergency"),
+            "confidence": incident.get("confidence"),
+            "camera_id": incident.get("camera_id"),
+            "location": incident.get("location", "Unknown"),
+            "timestamp": incident.get("timestamp"),
+            "snapshot_path": incident.get("snapshot_path"),
+        }
+
+    @staticmethod
+    def _record(action, channel, status, attempts):
+        return {
+            "action": action,
+            "timestamp": datetime.now().isoformat(),
+            "channel": channel,
+            "status": status,
+            "attempts": attempts,
+        }
+
+    def dispatch(self, incident, on_complete=None):
+        """
+        Send the incident to every channel without waiting. Returns a Future resolving to one
+        action record per channel (a single "suppressed" record during the cooldown).
+        on_complete(records) runs before the Future resolves, so waiters see its effects.
+        """
+        alert = self.build_alert(incident)
+        key = (alert["camera_id"], alert["type"])
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_dispatch.get(key)
+            suppressed = last is not None and now - last < self.cooldown
+            if not suppressed:
+                self.last_dispatch[key] = now
+
+        done = Future()
+
+        def finish(records):
+            if not any(record["status"] in ("sent", "dry_run") for record in records):
+                # Nothing got through: let the next incident try again instead of waiting out the cooldown
+                with self.lock:
+                    if self.last_dispatch.get(key) == now:
+                        del self.last_dispatch[key]
+            try:
+                if on_complete is not None:
+                    on_complete(records)
+            finally:
+                done.set_result(records)
+
+        if suppressed:
+            self.metrics.inc("dispatch_suppressed")
+            action = (f"Dispatch suppressed: {alert['type']} on {alert['camera_id']} "
+                      f"already alerted {now - last:.0f}s ago")
+            finish([self._record(action, None, "suppressed", 0)])
+            return done
+        if not self.channels:
+            finish([])
+            return done
+
+        records = [None] * len(self.channels)
+        remaining = [len(self.channels)]
+
+        def collect(index, future):
+            try:
+                records[index] = future.result()
+            except Exception as e:
+                # _send never raises, but the Future must resolve whatever happens
+                channel = self.channels[index].name
+                records[index] = self._record(f"{channel} failed: {type(e).__name__}: {e}", channel, "failed", 0)
+            with self.lock:
+                remaining[0] -= 1
+                last_one = remaining[0] == 0
+            if last_one:
+                finish(records)
+
+        for index, channel in enumerate(self.channels):
+            future = self.executor.submit(self._send, channel, alert)
+            future.add_done_callback(lambda f, index=index: collect(index, f))
+        return done
+
+    def _send(self, channel, alert):
+        """Deliver to one channel with retries. Never raises; failures become a "failed" record."""
+        alert = dict(alert, channel=channel.name)
+        if self.dry_run:
+            return self._record(f"Dry run, not sent: {self._describe(channel, alert)}", channel.name, "dry_run", 0)
+
+        start = time.perf_counter()
+        delay = self.backoff
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                channel.send(alert)
+                # Described outside the retry: a formatting error must not send the alert again
+                status, action = "sent", None
+                break
+            except Exception as e:
+                if attempts > channel.retries:
+                    status, action = "failed", f"{channel.name} failed after {attempts} attempt(s): {type(e).__name__}: {e}"
+                    print(f"[ERROR] Emergency channel {action}")
+                    break
+                time.sleep(delay)
+                delay *= 2
+        if action is None:
+            action = self._describe(channel, alert)
+        self.metrics.observe("dispatch_seconds", time.perf_counter() - start, channel=channel.name)
+        self.metrics.inc("dispatch_total", channel=channel.name, status=status)
+        return self._record(action, channel.name, status, attempts)
+
+    @staticmethod
+    def _describe(channel, alert):
+        """The channel's action text; a broken action template falls back to a generic one."""
+        try:
+            return channel.describe(alert)
+        except Exception as e:
+            print(f"[ERROR] Emergency channel {channel.name} action text failed: {type(e).__name__}: {e}")
+            return f"Alert for {alert['type']} via {channel.name}"
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait)
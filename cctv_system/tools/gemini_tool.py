@@ -1,59 +1,191 @@
+import hashlib
+import json
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
+import time
+from config import (
+    GEMINI_API_KEY, REPORT_BACKEND, REPORT_MODEL, REPORT_DIR, REPORT_CACHE_DIR, REPORT_CACHE_MAX_ENTRIES,
+    REPORT_TIMEOUT, REPORT_MAX_RETRIES, REPORT_RETRY_BACKOFF, REPORT_MOCK_LATENCY
+)
 
-# Load environment variables directly
-print(f"[DEBUG] Current working directory: {os.getcwd()}")
-print(f"[DEBUG] Looking for .env file at: {os.path.join(os.getcwd(), '.env')}")
-print(f"[DEBUG] .env file exists: {os.path.exists('.env')}")
+# Fields that differ between otherwise identical incidents: the backend sees {{field}} placeholders,
+# filled in per incident, so one generated report serves every incident with the same content
+PLACEHOLDER_FIELDS = ("id", "timestamp", "snapshot_path", "clip_path")
 
-dotenv_loaded = load_dotenv()
-print(f"[DEBUG] load_dotenv() returned: {dotenv_loaded}")
+class GeminiReportBackend:
+    """Gemini text generation with a per-request timeout."""
 
-# Get configuration
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-print(f"[DEBUG] os.getenv('GEMINI_API_KEY') returned: {repr(GEMINI_API_KEY)}")
-print(f"[DEBUG] Type: {type(GEMINI_API_KEY)}")
-print(f"[DEBUG] Bool value: {bool(GEMINI_API_KEY)}")
-if GEMINI_API_KEY:
-    print(f"[DEBUG] Length: {len(GEMINI_API_KEY)}")
-    print(f"[DEBUG] First 20 chars: {GEMINI_API_KEY[:20]}")
+    def __init__(self, api_key, model_name=REPORT_MODEL):
+        # google.generativeai is slow to import; only pay for it when a report is generated
+        import google.generativeai as genai
+        self.name = model_name
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
 
-OUTPUT_DIR = "data"
+    def generate(self, incident_data, prompt, timeout):
+        response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        return response.text
+
+class MockReportBackend:
+    """Offline stand-in for Gemini: same interface, template report, optional simulated latency."""
+
+    name = "mock"
+
+    def __init__(self, latency=REPORT_MOCK_LATENCY):
+        self.latency = latency
+
+    def generate(self, incident_data, prompt, timeout):
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+            if self.latency > timeout:
+                raise TimeoutError(f"Mock report backend timed out after {timeout}s")
+        return mock_report(incident_data)
+
+def mock_report(data):
+    snapshot = data.get("snapshot_path")
+    return f"""
+# Security Incident Report
+
+**Date:** {data.get('timestamp') or 'Unknown'}
+**Incident Type:** {data['type']}
+**Location:** {data.get('location') or 'Unknown'}
+**Camera ID:** {data.get('camera_id') or 'Unknown'}
+
+## Summary
+A {data['type']} incident was detected with {data.get('confidence') or 0.0:.2f} confidence.
+
+## Actions Taken
+{chr(10).join(['- ' + a['action'] for a in data.get('actions', [])])}
+
+## Snapshot
+{f'![Snapshot]({snapshot})' if snapshot else 'No snapshot was recorded for this incident.'}
+"""
 
 class GeminiTool:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, backend=REPORT_BACKEND, cache_dir=REPORT_CACHE_DIR,
+                 cache_max_entries=REPORT_CACHE_MAX_ENTRIES):
         # Use provided key or load from environment
         self.api_key = api_key or GEMINI_API_KEY
-        print(f"\n{'='*60}")
-        print(f"GeminiTool Initialization")
-        print(f"{'='*60}")
-        if self.api_key:
-            print(f"[OK] Gemini API key found (length: {len(self.api_key)})")
+        self.backend_name = backend
+        self.cache_dir = cache_dir
+        self.cache_max_entries = cache_max_entries
+        self.timeout = REPORT_TIMEOUT
+        self.max_retries = REPORT_MAX_RETRIES
+        self.fallback = MockReportBackend(latency=0)
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        """Report backend, created on first use."""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._create_backend()
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    def _create_backend(self):
+        if self.backend_name == "mock":
+            print("[MOCK] Using local mock report backend")
+            return MockReportBackend()
+        if not self.api_key:
+            print("[WARN] No Gemini API key found - using mock report generator "
+                  "(add GEMINI_API_KEY to .env to enable Gemini reports)")
+            return MockReportBackend()
+        try:
+            backend = GeminiReportBackend(self.api_key)
+            print(f"[OK] Gemini model initialized: {backend.name}")
+            return backend
+        except Exception as e:
+            print(f"[ERROR] Error initializing Gemini: {e}")
+            return MockReportBackend()
+
+    @property
+    def model(self):
+        """The Gemini model in use (None when reports come from the mock backend)."""
+        return getattr(self.backend, "model", None)
+
+    def report_path(self, incident_data):
+        return os.path.join(REPORT_DIR, f"incident_{incident_data['id']}.md")
+
+    @staticmethod
+    def report_payload(incident_data):
+        """What the report is generated from: the incident's content, per-incident fields as placeholders."""
+        payload = {
+            "type": incident_data["type"],
+            "camera_id": incident_data.get("camera_id"),
+            "location": incident_data.get("location", "Unknown"),
+            "confidence": round(float(incident_data.get("confidence") or 0.0), 2),
+            # Action text only: each record's own timestamp would make every incident unique
+            "actions": [{"action": action["action"]} for action in incident_data.get("actions", [])],
+        }
+        for field in PLACEHOLDER_FIELDS:
+            # Missing fields stay in as None (e.g. no snapshot in replay mode) so the report can say so
+            payload[field] = f"{{{{{field}}}}}" if incident_data.get(field) is not None else None
+        return payload
+
+    @staticmethod
+    def fill_placeholders(report_content, incident_data):
+        for field in PLACEHOLDER_FIELDS:
+            if incident_data.get(field) is not None:
+                report_content = report_content.replace(f"{{{{{field}}}}}", str(incident_data[field]))
+        return report_content
+
+    def cache_key(self, incident_data):
+        """Address of an incident's report payload for the current backend."""
+        payload = json.dumps(self.report_payload(incident_data), sort_keys=True, default=str)
+        return hashlib.sha256(f"{self.backend.name}\n{payload}".encode("utf-8")).hexdigest()
+
+    def generate_report(self, incident_data, report_path=None):
+        report_path = report_path or self.report_path(incident_data)
+        cache_path = os.path.join(self.cache_dir, f"{self.cache_key(incident_data)}.md")
+
+        try:
+            with open(cache_path, "r") as f:
+                template = f.read()
+            os.utime(cache_path) # Recently used: evicted last
+            print(f"[CACHE] Reusing cached report for incident {incident_data['id']}")
+        except OSError:
+            template, generated = self._generate(self.report_payload(incident_data))
+            if generated:
+                # Only real backend output is cached; fallbacks are retried next time
+                self._write(cache_path, template)
+                self._evict()
+
+        self._write(report_path, self.fill_placeholders(template, incident_data))
+        return report_path
+
+    def _evict(self):
+        """Delete the least recently used cached reports beyond cache_max_entries."""
+        try:
+            paths = [entry.path for entry in os.scandir(self.cache_dir) if entry.name.endswith(".md")]
+        except OSError:
+            return
+        if len(paths) <= self.cache_max_entries:
+            return
+        mtimes = {}
+        for path in paths:
             try:
-                genai.configure(api_key=self.api_key)
-                self.model = genai.GenerativeModel('gemini-2.5-pro')
-                print(f"[OK] Gemini model initialized: gemini-2.5-pro")
-            except Exception as e:
-                print(f"[ERROR] Error initializing Gemini: {e}")
-                self.model = None
-        else:
-            print(f"[WARN] No Gemini API key found - using mock report generator")
-            print(f"  To enable Gemini reports:")
-            print(f"  1. Get API key from: https://aistudio.google.com/apikey")
-            print(f"  2. Add to .env file: GEMINI_API_KEY=your_key_here")
-            self.model = None
-        print(f"{'='*60}\n")
-
-    def generate_report(self, incident_data):
-        report_path = os.path.join(OUTPUT_DIR, "final_report.md")
-        
-        if self.model:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                pass # Evicted by another worker
+        for path in sorted(mtimes, key=mtimes.get)[:len(mtimes) - self.cache_max_entries]:
             try:
-                print("\n[AI] Generating AI-powered report with Gemini...")
-                prompt = f"""
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _generate(self, incident_data):
+        """Returns (report_content, generated_by_backend)."""
+        prompt = f"""
                 Generate a detailed security incident report based on the following data:
                 {incident_data}
+
+                Values written as {{{{name}}}} are placeholders: copy them into the report unchanged.
                 
                 The report should include:
                 1. Executive Summary
@@ -64,37 +196,26 @@ class GeminiTool:
                 
                 Format as Markdown.
                 """
-                response = self.model.generate_content(prompt)
-                report_content = response.text
-                print("[OK] Gemini report generated successfully!")
+        print(f"\n[AI] Generating report with {self.backend.name} backend...")
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                report_content = self.backend.generate(incident_data, prompt, self.timeout)
+                print("[OK] Report generated successfully!")
+                return report_content, True
             except Exception as e:
-                print(f"[ERROR] Error generating report with Gemini: {e}")
-                print("  Falling back to mock report...")
-                report_content = self._mock_report(incident_data)
-        else:
-            print("\n[MOCK] Generating mock report (no Gemini API key)...")
-            report_content = self._mock_report(incident_data)
-            
-        with open(report_path, "w") as f:
-            f.write(report_content)
-            
-        return report_path
+                print(f"[ERROR] Report attempt {attempt} failed: {e}")
+                if attempt <= self.max_retries:
+                    time.sleep(min(REPORT_RETRY_BACKOFF * 2 ** (attempt - 1), self.timeout))
+        print("  Falling back to mock report...")
+        return self.fallback.generate(incident_data, prompt, self.timeout), False
 
-    def _mock_report(self, data):
-        return f"""
-# Security Incident Report
-
-**Date:** {data['timestamp']}
-**Incident Type:** {data['type']}
-**Location:** {data['location']}
-**Camera ID:** {data['camera_id']}
-
-## Summary
-A {data['type']} incident was detected with {data['confidence']:.2f} confidence.
+    @staticmethod
+    def _write(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.part"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
 
-## Actions Taken
-{chr(10).join(['- ' + a['action'] for a in data['actions']])}
-
-## Snapshot
-![Snapshot]({data['snapshot_path']})
-"""
+    def _mock_report(self, data):
+        return mock_report(data)
@@ -0,0 +1,239 @@
+import ast
+import os
+import shutil
+from abc import ABC, abstractmethod
+import cv2
+from config import (
+    INFERENCE_THREADS, INFERENCE_CPU_AFFINITY, INFERENCE_INT8,
+    INFERENCE_CALIBRATION_SOURCES, INFERENCE_CALIBRATION_FRAMES, CAMERAS, MODEL_INPUT_SIZE
+)
+
+# ultralytics' predict() defaults, so every backend filters and suppresses exactly like detect()
+PREDICT_CONF = 0.25
+PREDICT_IOU = 0.7
+PREDICT_MAX_DET = 300
+
+def apply_cpu_settings(threads=INFERENCE_THREADS, affinity=INFERENCE_CPU_AFFINITY):
+    """
+    Pin the process to the configured cores (Linux only; affects every thread in the process)
+    and cap torch's intra-op threads. Runtime-specific thread counts are set by each backend.
+    """
+    if affinity and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, set(affinity))
+        print(f"[OK] Inference pinned to CPU cores {sorted(affinity)}")
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+def calibration_frames(sources=None, count=INFERENCE_CALIBRATION_FRAMES):
+    """
+    Frames spread evenly over our own footage (the configured cameras by default),
+    used as the INT8 calibration set.
+    """
+    sources = sources or INFERENCE_CALIBRATION_SOURCES or [camera["source"] for camera in CAMERAS]
+    per_source = max(1, count // len(sources))
+    frames = []
+    for source in sources:
+        cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or per_source
+        step = max(1, total // per_source)
+        index = 0
+        taken = 0
+        while taken < per_source and cap.grab():
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    frames.append(frame)
+                    taken += 1
+            index += 1
+        cap.release()
+    if not frames:
+        raise ValueError(f"No calibration frames could be read from {sources}")
+    return frames
+
+def postprocess(raw, conf=PREDICT_CONF, iou=PREDICT_IOU, max_det=PREDICT_MAX_DET):
+    """Raw (B, 4 + classes, anchors) predictions -> per-image (N, 6) [x1, y1, x2, y2, conf, cls] arrays."""
+    import torch
+    try:
+        from ultralytics.utils.nms import non_max_suppression
+    except ImportError: # Older ultralytics releases
+        from ultralytics.utils.ops import non_max_suppression
+    output = non_max_suppression(torch.from_numpy(raw), conf, iou, max_det=max_det)
+    return [det.cpu().numpy() for det in output]
+
+class InferenceBackend(ABC):
+    """
+    A CPU runtime for an exported copy of the YOLO model. The .pt weights are exported
+    (and optionally INT8-quantized on frames from our footage) on first use, next to the
+    original model; later runs load the exported files directly.
+    """
+    FORMAT = None
+
+    def __init__(self, model_path, int8=INFERENCE_INT8, threads=INFERENCE_THREADS, imgsz=MODEL_INPUT_SIZE):
+        self.model_path = model_path
+        self.int8 = int8
+        self.threads = threads
+        self.imgsz = imgsz
+        self.names = None
+        self.calibration_sources = None
+
+    @property
+    def name(self):
+        return f"{self.FORMAT}-int8" if self.int8 else self.FORMAT
+
+    def _stem(self):
+        return os.path.splitext(self.model_path)[0]
+
+    @abstractmethod
+    def export_path(self, int8=None):
+        pass
+
+    def _export_fp32(self):
+        # Dynamic batch and input size so batching and rectangular letterboxes keep working
+        from ultralytics import YOLO
+        exported = YOLO(self.model_path).export(format=self.FORMAT, imgsz=self.imgsz, dynamic=True, verbose=False)
+        if os.path.abspath(exported) != os.path.abspath(self.export_path(int8=False)):
+            shutil.move(exported, self.export_path(int8=False))
+
+    @abstractmethod
+    def _quantize(self, calibration_tensors):
+        pass
+
+    def export(self):
+        """Export (and quantize) if needed. Returns the path that load() reads."""
+        if not os.path.exists(self.export_path(int8=False)):
+            print(f"[AI] Exporting {self.model_path} to {self.FORMAT}...")
+            self._export_fp32()
+        if self.int8 and not os.path.exists(self.export_path(int8=True)):
+            from tools.preprocess import LetterboxPreprocessor
+            print(f"[AI] Calibrating INT8 {self.FORMAT} model on our footage...")
+            preprocessor = LetterboxPreprocessor(self.imgsz)
+            # Copies: the preprocessor reuses its tensor between calls
+            tensors = [preprocessor([frame])[0].copy() for frame in calibration_frames(self.calibration_sources)]
+            self._quantize(tensors)
+        return self.export_path()
+
+    @abstractmethod
+    def load(self):
+        pass
+
+    @abstractmethod
+    def forward(self, tensor):
+        """Run the model on a preprocessed (B, 3, H, W) float32 tensor; returns raw predictions."""
+        pass
+
+    def predict(self, tensor):
+        return postprocess(self.forward(tensor))
+
+class OnnxBackend(InferenceBackend):
+    FORMAT = "onnx"
+
+    def export_path(self, int8=None):
+        int8 = self.int8 if int8 is None else int8
+        return f"{self._stem()}_int8.onnx" if int8 else f"{self._stem()}.onnx"
+
+    def _quantize(self, calibration_tensors):
+        import onnx
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+
+        class Reader(CalibrationDataReader):
+            def __init__(self, input_name, tensors):
+                self.items = iter([{input_name: tensor} for tensor in tensors])
+
+            def get_next(self):
+                return next(self.items, None)
+
+        fp32_path = self.export_path(int8=False)
+        prepared_path = f"{self._stem()}_prep.onnx"
+        quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+        input_name = onnx.load(fp32_path, load_external_data=False).graph.input[0].name
+        quantize_static(
+            prepared_path, self.export_path(int8=True), Reader(input_name, calibration_tensors),
+            quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+        os.remove(prepared_path)
+
+        # Keep ultralytics' metadata (class names, stride) on the quantized model
+        source = onnx.load(fp32_path, load_external_data=False)
+        quantized = onnx.load(self.export_path(int8=True))
+        del quantized.metadata_props[:]
+        quantized.metadata_props.extend(source.metadata_props)
+        onnx.save(quantized, self.export_path(int8=True))
+
+    def load(self):
+        import onnxruntime as ort
+        path = self.export()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+        return self
+
+    def forward(self, tensor):
+        return self.session.run(None, {self.input_name: tensor})[0]
+
+class OpenVINOBackend(InferenceBackend):
+    FORMAT = "openvino"
+
+    def export_path(self, int8=None):
+        int8 = self.int8 if int8 is None else int8
+        return f"{self._stem()}_int8_openvino_model" if int8 else f"{self._stem()}_openvino_model"
+
+    def _model_file(self, directory):
+        return os.path.join(directory, os.path.basename(self._stem()) + ".xml")
+
+    def _quantize(self, calibration_tensors):
+        import nncf
+        import openvino as ov
+        core = ov.Core()
+        fp32_dir = self.export_path(int8=False)
+        model = core.read_model(self._model_file(fp32_dir))
+        quantized = nncf.quantize(
+            model, nncf.Dataset(calibration_tensors),
+            preset=nncf.QuantizationPreset.MIXED,
+            subset_size=len(calibration_tensors),
+            # Keep the detection head's box/class decoding in full precision
+            ignored_scope=nncf.IgnoredScope(types=["Multiply", "Subtract", "Sigmoid"])
+        )
+        int8_dir = self.export_path(int8=True)
+        os.makedirs(int8_dir, exist_ok=True)
+        ov.save_model(quantized, self._model_file(int8_dir))
+        shutil.copy(os.path.join(fp32_dir, "metadata.yaml"), int8_dir)
+
+    def load(self):
+        import openvino as ov
+        import yaml
+        directory = self.export()
+        core = ov.Core()
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if self.threads:
+            config["INFERENCE_NUM_THREADS"] = self.threads
+        if INFERENCE_CPU_AFFINITY:
+            config["ENABLE_CPU_PINNING"] = True
+        self.compiled = core.compile_model(self._model_file(directory), "CPU", config)
+        with open(os.path.join(directory, "metadata.yaml")) as f:
+            self.names = yaml.safe_load(f).get("names", {})
+        return self
+
+    def forward(self, tensor):
+        return self.compiled(tensor)[0]
+
+BACKENDS = {
+    "onnx": OnnxBackend,
+    "openvino": OpenVINOBackend,
+}
+
+def create_backend(name, model_path, int8=INFERENCE_INT8, threads=INFERENCE_THREADS):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}' (expected torch, {', '.join(BACKENDS)})")
+    return BACKENDS[name](model_path, int8=int8, threads=threads)
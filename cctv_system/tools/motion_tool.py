@@ -0,0 +1,85 @@
+import cv2
+import numpy as np
+from config import (
+    MOTION_GATE_WIDTH, MOTION_GATE_PIXEL_THRESHOLD,
+    MOTION_GATE_AREA_THRESHOLD, MOTION_GATE_FORCE_INTERVAL
+)
+
+class MotionGateTool:
+    """
+    Cheap change detector run in front of the detector. Frames are downscaled to a small
+    grayscale thumbnail and compared against the thumbnail of the last analyzed frame.
+    """
+
+    def __init__(self, width=MOTION_GATE_WIDTH, pixel_threshold=MOTION_GATE_PIXEL_THRESHOLD,
+                 area_threshold=MOTION_GATE_AREA_THRESHOLD, force_interval=MOTION_GATE_FORCE_INTERVAL):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.force_interval = force_interval
+
+        self.reference = None
+        self.frames_since_inference = 0
+        self.frames_seen = 0
+        self.frames_gated = 0
+        self.frames_forced = 0
+        self.last_changed_ratio = 0.0
+
+    def _thumbnail(self, frame):
+        height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def changed_mask(self, frame):
+        """
+        Thumbnail-sized mask of the pixels that changed since the previous call (all set
+        for the first frame). Used on its own, not together with should_infer().
+        """
+        thumb = self._thumbnail(frame)
+        if self.reference is None or self.reference.shape != thumb.shape:
+            mask = np.ones(thumb.shape, dtype=bool)
+        else:
+            mask = cv2.absdiff(thumb, self.reference) > self.pixel_threshold
+        self.reference = thumb
+        return mask
+
+    def should_infer(self, frame):
+        """Return True when the frame changed enough (or a periodic refresh is due) to run the detector."""
+        self.frames_seen += 1
+        thumb = self._thumbnail(frame)
+
+        if self.reference is None or self.reference.shape != thumb.shape:
+            changed = True
+        else:
+            diff = cv2.absdiff(thumb, self.reference)
+            self.last_changed_ratio = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+            changed = self.last_changed_ratio > self.area_threshold
+
+        if not changed and self.force_interval and self.frames_since_inference + 1 >= self.force_interval:
+            # Periodic full inference so stationary threats are not missed
+            self.frames_forced += 1
+            changed = True
+
+        if changed:
+            # Compare against the last analyzed frame so slow drift still accumulates
+            self.reference = thumb
+            self.frames_since_inference = 0
+        else:
+            self.frames_since_inference += 1
+            self.frames_gated += 1
+        return changed
+
+    def get_stats(self):
+        return {
+            "frames_seen": self.frames_seen,
+            "frames_gated": self.frames_gated,
+            "frames_forced": self.frames_forced,
+            "gated_ratio": self.frames_gated / self.frames_seen if self.frames_seen else 0.0,
+            "last_changed_ratio": self.last_changed_ratio
+        }
+
+    def reset(self):
+        self.reference = None
+        self.frames_since_inference = 0
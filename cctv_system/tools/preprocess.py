@@ -0,0 +1,79 @@
+import threading
+import cv2
+import numpy as np
+from config import MODEL_INPUT_SIZE
+
+class LetterboxPreprocessor:
+    """
+    Resize + letterbox + BGR->RGB + CHW + /255 straight into a reusable float32 model-input
+    tensor, the same transform ultralytics applies internally (gray 114 padding, minimal
+    stride padding when every frame in the batch has the same size). Canvases and the input
+    tensor are allocated once per shape and reused, so steady-state preprocessing allocates
+    nothing per frame.
+    """
+
+    def __init__(self, imgsz=MODEL_INPUT_SIZE, stride=32, pad_value=114):
+        self.imgsz = imgsz
+        self.stride = stride
+        self.pad_value = pad_value
+        self._geometries = {} # {(source_hw, target_hw): (scale, (top, left), (new_h, new_w))}
+        self._canvases = {} # {(source_hw, target_hw): uint8 HWC canvas, padding pre-filled}
+        self._tensor = None # float32 (max_batch, 3, H, W)
+        self._lock = threading.Lock()
+
+    def target_shape(self, source_hw, imgsz=None):
+        """Smallest stride-aligned input that holds the frame scaled to imgsz on its long side."""
+        imgsz = imgsz or self.imgsz
+        h, w = source_hw
+        scale = min(imgsz / h, imgsz / w)
+        new_h, new_w = int(round(h * scale)), int(round(w * scale))
+        return (-(-new_h // self.stride) * self.stride, -(-new_w // self.stride) * self.stride)
+
+    def geometry(self, source_hw, target_hw):
+        key = (source_hw, target_hw)
+        geometry = self._geometries.get(key)
+        if geometry is None:
+            h, w = source_hw
+            scale = min(target_hw[0] / h, target_hw[1] / w)
+            new_h, new_w = int(round(h * scale)), int(round(w * scale))
+            top = (target_hw[0] - new_h) // 2
+            left = (target_hw[1] - new_w) // 2
+            geometry = self._geometries[key] = (scale, (top, left), (new_h, new_w))
+        return geometry
+
+    def _canvas(self, source_hw, target_hw):
+        key = (source_hw, target_hw)
+        canvas = self._canvases.get(key)
+        if canvas is None:
+            canvas = self._canvases[key] = np.full((target_hw[0], target_hw[1], 3), self.pad_value, dtype=np.uint8)
+        return canvas
+
+    def _input_tensor(self, batch, target_hw):
+        tensor = self._tensor
+        if tensor is None or tensor.shape[0] < batch or tensor.shape[2:] != target_hw:
+            tensor = self._tensor = np.empty((batch, 3, target_hw[0], target_hw[1]), dtype=np.float32)
+        return tensor[:batch]
+
+    def __call__(self, frames, imgsz=None):
+        """
+        Preprocess a batch of BGR frames (at imgsz instead of self.imgsz, if given). Returns
+        (tensor, geometries): a (B, 3, H, W) view of the pooled input tensor, valid until the
+        next call, and per-frame (scale, (top, left)) for mapping boxes back with Detections.to_source.
+        """
+        imgsz = imgsz or self.imgsz
+        with self._lock:
+            shapes = {frame.shape[:2] for frame in frames}
+            # Mixed sizes (e.g. several cameras) share one square input so they stay one batch
+            target_hw = self.target_shape(next(iter(shapes)), imgsz) if len(shapes) == 1 else (imgsz, imgsz)
+            tensor = self._input_tensor(len(frames), target_hw)
+            geometries = []
+            for i, frame in enumerate(frames):
+                source_hw = frame.shape[:2]
+                scale, (top, left), (new_h, new_w) = self.geometry(source_hw, target_hw)
+                canvas = self._canvas(source_hw, target_hw)
+                cv2.resize(frame, (new_w, new_h), dst=canvas[top:top + new_h, left:left + new_w],
+                           interpolation=cv2.INTER_LINEAR)
+                # BGR HWC uint8 -> RGB CHW float 0-1, written into the pooled tensor
+                np.multiply(canvas[..., ::-1].transpose(2, 0, 1), 1.0 / 255.0, out=tensor[i], casting="unsafe")
+                geometries.append((scale, (top, left)))
+            return tensor, geometries
@@ -0,0 +1,107 @@
+import cv2
+import numpy as np
+from tools.detections import Detections
+from config import ROI_CROP_MARGIN, ROI_MIN_INPUT_SIZE, ROI_ANCHOR
+
+class RegionOfInterestTool:
+    """
+    Per-camera regions of interest. polygons are lists of [x, y] points given as fractions
+    of the frame size, so they hold at any decode resolution. For each frame size the tool
+    precomputes the crop rectangles (polygon bounding boxes plus a margin, overlapping ones
+    merged so no pixel is analyzed twice) and a pixel mask of the polygons used to drop
+    detections whose anchor point falls outside them.
+    """
+
+    def __init__(self, polygons, margin=ROI_CROP_MARGIN, min_input_size=ROI_MIN_INPUT_SIZE, anchor=ROI_ANCHOR):
+        if anchor not in ("center", "bottom"):
+            raise ValueError(f"Unknown ROI anchor '{anchor}' (expected center or bottom)")
+        self.polygons = [np.asarray(polygon, dtype=np.float64).reshape(-1, 2) for polygon in polygons]
+        if not self.polygons or any(len(polygon) < 3 for polygon in self.polygons):
+            raise ValueError("An ROI needs at least one polygon of three or more points")
+        self.margin = margin
+        self.min_input_size = min_input_size
+        self.anchor = anchor
+        self._geometry = {} # {(height, width): (crop rectangles, mask)}
+        self.frames = 0
+        self.pixels_analyzed = 0
+        self.pixels_total = 0
+        self.detections_outside = 0
+
+    def geometry(self, shape):
+        """(N, 4) x0, y0, x1, y1 crop rectangles and the (height, width) bool mask for a frame shape."""
+        height, width = shape[:2]
+        cached = self._geometry.get((height, width))
+        if cached is not None:
+            return cached
+        scale = np.array([width, height], dtype=np.float64)
+        points = [np.round(polygon * scale).astype(np.int32) for polygon in self.polygons]
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, points, 1)
+
+        rects = []
+        for polygon in points:
+            x0, y0 = polygon.min(axis=0) - self.margin
+            x1, y1 = polygon.max(axis=0) + self.margin + 1
+            rects.append([max(0, x0), max(0, y0), min(width, x1), min(height, y1)])
+        # Merge overlapping rectangles until none overlap
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        rects = np.array([rect for rect in rects if rect[2] > rect[0] and rect[3] > rect[1]], dtype=np.int64).reshape(-1, 4)
+        cached = self._geometry[(height, width)] = (rects, mask.astype(bool))
+        return cached
+
+    def crops(self, frame):
+        """[(view, x0, y0)] of the frame's ROI crops (views, not copies)."""
+        rects, _ = self.geometry(frame.shape)
+        self.frames += 1
+        self.pixels_total += frame.shape[0] * frame.shape[1]
+        crops = []
+        for x0, y0, x1, y1 in rects:
+            self.pixels_analyzed += int((x1 - x0) * (y1 - y0))
+            crops.append((frame[y0:y1, x0:x1], int(x0), int(y0)))
+        return crops
+
+    def input_size(self, crop_shape, frame_shape, imgsz):
+        """
+        Model input for a crop: the crop at the scale the whole frame would have been run at,
+        so objects keep the detail they had and the input shrinks with the crop.
+        """
+        scale = min(1.0, imgsz / max(frame_shape[:2]))
+        size = -(-int(max(crop_shape[:2]) * scale) // 32) * 32
+        return int(min(imgsz, max(self.min_input_size, size)))
+
+    def filter(self, detections, frame_shape):
+        """Detections (in frame coordinates) whose anchor point lies inside a polygon."""
+        if not len(detections):
+            return detections
+        _, mask = self.geometry(frame_shape)
+        boxes = detections.boxes
+        x = ((boxes[:, 0] + boxes[:, 2]) / 2).astype(np.int64)
+        y = (boxes[:, 3] if self.anchor == "bottom" else (boxes[:, 1] + boxes[:, 3]) / 2).astype(np.int64)
+        inside = mask[np.clip(y, 0, mask.shape[0] - 1), np.clip(x, 0, mask.shape[1] - 1)]
+        self.detections_outside += int(len(inside) - inside.sum())
+        return detections.filter(inside)
+
+    def merge(self, parts, frame_shape, names=None):
+        """Map per-crop detections [(detections, x0, y0)] back to the frame and keep those inside the ROI."""
+        mapped = [detections.to_source(1.0, (-x0, -y0)) for detections, x0, y0 in parts if len(detections)]
+        detections = Detections.concat(mapped) if mapped else Detections(names=names)
+        return self.filter(detections, frame_shape)
+
+    def get_stats(self):
+        return {
+            "frames": self.frames,
+            "pixel_ratio": round(self.pixels_analyzed / self.pixels_total, 3) if self.pixels_total else 0.0,
+            "detections_outside": self.detections_outside,
+        }
@@ -1,17 +1,65 @@
 import cv2
+import queue
+from collections import OrderedDict
+import re
+import subprocess
+import threading
 import time
-from config import VIDEO_SOURCE, FRAME_RATE
+import numpy as np
+from config import (
+    VIDEO_SOURCE, FRAME_RATE, FRAME_SAMPLING, VIDEO_DECODER, MODEL_INPUT_SIZE, LIVE_MODE,
+    FFMPEG_BINARY, FFMPEG_THREADS, FFMPEG_SCALE_TO_MODEL, FFMPEG_SKIP_FRAMES
+)
+
+STREAM_SCHEMES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://")
+
+def is_live_source(source):
+    """Camera indexes and network streams produce frames in real time."""
+    return str(source).isdigit() or str(source).lower().startswith(STREAM_SCHEMES)
+
+def reads_latest_frame(source, live_mode=LIVE_MODE):
+    return live_mode == "on" or (live_mode == "auto" and is_live_source(source))
 
 class VideoTool:
-    def __init__(self, source=VIDEO_SOURCE, fps=FRAME_RATE):
+    def __init__(self, source=VIDEO_SOURCE, fps=FRAME_RATE, sample_frames=FRAME_SAMPLING, frame_pool=None,
+                 live_mode=LIVE_MODE):
         self.video_source = source
         self.frame_rate = fps
+        self.sample_frames = sample_frames
+        self.frame_pool = frame_pool # FramePool; consumers release frames back to it
+        self.live_mode = live_mode
         self.cap = None
+        self.source_fps = 0.0
+        self.frames_skipped = 0
+        self.frames_stale = 0 # Live: frames superseded by a newer one while the consumer was busy
+        self.capture_times = None # Live, once tracked: {frame_count: time.monotonic() at capture} until popped
+
+    def is_live(self):
+        return is_live_source(self.video_source)
+
+    def latest_only(self):
+        """Read freshest-frame-first (live sources, or every source with LIVE_MODE = "on")."""
+        return reads_latest_frame(self.video_source, self.live_mode)
+
+    def track_capture_times(self, limit=64):
+        """Record live capture times for a latency consumer (at most limit frames awaiting a pop)."""
+        self.capture_times = OrderedDict()
+        self.capture_times_limit = max(1, limit)
+
+    def pop_capture_time(self, frame_count):
+        if not self.capture_times:
+            return None
+        captured = self.capture_times.pop(frame_count, None)
+        # Frames are consumed in order: older entries belong to frames dropped downstream
+        while self.capture_times and next(iter(self.capture_times)) < frame_count:
+            self.capture_times.popitem(last=False)
+        return captured
 
     def open_source(self):
-        # Check if source is int (webcam) or string (file)
+        # Check if source is int (webcam) or string (file/stream URL)
         source = int(self.video_source) if str(self.video_source).isdigit() else self.video_source
         self.cap = cv2.VideoCapture(source)
+        self.source_fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
         return self.cap.isOpened()
 
     def read_frame(self):
@@ -23,21 +71,319 @@ class VideoTool:
         if self.cap:
             self.cap.release()
 
+    def _frame_timestamp(self, frame_count, start_time):
+        """Timestamp (seconds) of the frame that was just grabbed."""
+        if self.is_live():
+            return time.monotonic() - start_time
+        pos_msec = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if pos_msec > 0:
+            return pos_msec / 1000.0
+        if self.source_fps > 0:
+            return (frame_count - 1) / self.source_fps
+        return time.monotonic() - start_time
+
+    def _retrieve(self):
+        if self.frame_pool is None:
+            return self.cap.retrieve()
+        # Decode straight into a recycled buffer
+        buffer = self.frame_pool.acquire()
+        ret, frame = self.cap.retrieve(image=buffer)
+        if ret and frame is not buffer:
+            # First frames, an exhausted pool or a resolution change: OpenCV allocated
+            self.frame_pool.adopt(frame, replaces=buffer)
+        return ret, frame
+
+    def _grab_loop(self, state):
+        """
+        Capture thread for live reading: grab() every frame so nothing queues up in the
+        capture buffer, but only decode one when the consumer has asked for the next frame.
+        Files (LIVE_MODE = "on") are grabbed at their native rate to rehearse a live feed.
+        """
+        pace = 1.0 / self.source_fps if not self.is_live() and self.source_fps > 0 else 0.0
+        next_grab = time.monotonic()
+        grabbed = 0
+        try:
+            while not state["stop"]:
+                if pace:
+                    time.sleep(max(0.0, next_grab - time.monotonic()))
+                    next_grab += pace
+                if not self.cap.grab():
+                    break
+                grabbed += 1
+                captured = time.monotonic()
+                if not state["wanted"].is_set():
+                    # Not asked for: superseded while the consumer was busy (stale) or sampled out
+                    if state["busy"]:
+                        self.frames_stale += 1
+                    else:
+                        self.frames_skipped += 1
+                    continue
+                ret, frame = self._retrieve()
+                if not ret:
+                    break
+                state["wanted"].clear()
+                with state["ready"]:
+                    state["frame"] = (grabbed, frame, captured)
+                    state["ready"].notify()
+        finally:
+            with state["ready"]:
+                state["ended"] = True
+                state["ready"].notify()
+
+    def _stream_latest(self):
+        sampling = bool(self.sample_frames and self.frame_rate and self.frame_rate > 0)
+        interval = 1.0 / self.frame_rate if sampling else 0.0
+        state = {"stop": False, "busy": False, "ended": False, "frame": None,
+                 "wanted": threading.Event(), "ready": threading.Condition()}
+        grabber = threading.Thread(target=self._grab_loop, args=(state,), name="VideoGrabber", daemon=True)
+        grabber.start()
+        next_due = time.monotonic()
+        try:
+            while True:
+                state["busy"] = False
+                if sampling:
+                    # FRAME_RATE is a cap here: wait for the next slot, then take the freshest frame
+                    time.sleep(max(0.0, next_due - time.monotonic()))
+                    next_due = max(next_due + interval, time.monotonic())
+                state["wanted"].set()
+                with state["ready"]:
+                    while state["frame"] is None and not state["ended"]:
+                        state["ready"].wait()
+                    item, state["frame"] = state["frame"], None
+                if item is None:
+                    break
+                state["busy"] = True
+                frame_count, frame, captured = item
+                if self.capture_times is not None:
+                    self.capture_times[frame_count] = captured
+                    if len(self.capture_times) > self.capture_times_limit:
+                        self.capture_times.popitem(last=False)
+                yield frame_count, frame
+        finally:
+            state["stop"] = True
+            state["wanted"].set()
+            grabber.join()
+            self.release()
+
     def stream_frames(self):
         if not self.open_source():
             raise ValueError(f"Error opening video source: {self.video_source}")
+        if self.latest_only():
+            yield from self._stream_latest()
+            return
+
+        sampling = bool(self.sample_frames and self.frame_rate and self.frame_rate > 0)
+        interval = 1.0 / self.frame_rate if sampling else 0.0
+        # Half a source frame of slack keeps e.g. 30 -> 5 fps on an exact every-6th-frame grid
+        tolerance = 0.5 / self.source_fps if self.source_fps > 0 else 0.0
+        next_due = None
+        start_time = time.monotonic()
 
         frame_count = 0
         while self.cap.isOpened():
-            ret, frame = self.read_frame()
-            
-            if not ret:
+            # grab() only demuxes/decodes; skipped frames are never converted to BGR arrays
+            if not self.cap.grab():
                 break
             
             frame_count += 1
+
+            if sampling:
+                timestamp = self._frame_timestamp(frame_count, start_time)
+                if next_due is not None and timestamp + tolerance < next_due:
+                    self.frames_skipped += 1
+                    continue
+                next_due = (next_due if next_due is not None else timestamp) + interval
+                # Re-sync after a gap (e.g. a stalled live stream) instead of bursting
+                while next_due <= timestamp + tolerance:
+                    next_due += interval
+
+            ret, frame = self._retrieve()
+            if not ret:
+                break
+
+            # frame_count is the source frame index, so snapshots stay traceable
             yield frame_count, frame
-            
-            # Simulate real-time processing if needed
-            # time.sleep(1.0 / self.frame_rate)
         
         self.release()
+
+class FFmpegVideoTool(VideoTool):
+    """
+    Decodes through an ffmpeg subprocess that writes raw BGR frames to a pipe, read
+    straight into (pooled) NumPy buffers. Sampling and downscaling to the model input
+    size happen inside ffmpeg, so skipped frames are never scaled or copied and large
+    sources never exist as full-resolution BGR arrays. skip_frames ("noref"/"nokey")
+    has the decoder drop non-reference or all non-key frames for fast triage.
+    """
+    PTS_TIME = re.compile(r"pts_time:\s*(-?[\d.]+)")
+
+    def __init__(self, source=VIDEO_SOURCE, fps=FRAME_RATE, sample_frames=FRAME_SAMPLING, frame_pool=None,
+                 binary=FFMPEG_BINARY, threads=FFMPEG_THREADS, scale_to=MODEL_INPUT_SIZE if FFMPEG_SCALE_TO_MODEL else 0,
+                 skip_frames=FFMPEG_SKIP_FRAMES):
+        super().__init__(source, fps, sample_frames, frame_pool)
+        self.binary = binary
+        self.threads = threads
+        self.scale_to = scale_to
+        self.skip_frames = skip_frames
+        self.process = None
+        self.shape = None
+        self.timestamps = queue.Queue() # pts_time of each output frame, parsed from showinfo on stderr
+        self.stderr_tail = []
+        self.stderr_thread = None
+        self.frame_count = 0
+        self.first_pts = None
+
+    def _probe(self):
+        """Source size and frame rate (OpenCV is always installed; ffprobe may not be)."""
+        cap = cv2.VideoCapture(self.video_source)
+        try:
+            if not cap.isOpened():
+                return None
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            return (height, width), cap.get(cv2.CAP_PROP_FPS) or 0.0
+        finally:
+            cap.release()
+
+    def output_shape(self, source_hw):
+        """Decode-side downscale, same rounding as the letterbox so the preprocessor never resizes again."""
+        h, w = source_hw
+        if not self.scale_to or max(h, w) <= self.scale_to:
+            return (h, w)
+        scale = min(self.scale_to / h, self.scale_to / w)
+        return (int(round(h * scale)), int(round(w * scale)))
+
+    def _filters(self, source_hw):
+        filters = []
+        if self.sample_frames and self.frame_rate and self.frame_rate > 0:
+            # Same grid as the OpenCV path: keep a frame once an interval (minus half a source frame) has passed
+            tolerance = 0.5 / self.source_fps if self.source_fps > 0 else 0.0
+            interval = 1.0 / self.frame_rate - tolerance
+            filters.append(f"select='isnan(prev_selected_t)+gte(t-prev_selected_t,{interval:.6f})'")
+        if self.shape != source_hw:
+            filters.append(f"scale={self.shape[1]}:{self.shape[0]}:flags=bilinear")
+        filters.append("showinfo=checksum=0")
+        return ",".join(filters)
+
+    def command(self, source_hw):
+        cmd = [self.binary, "-hide_banner", "-nostdin", "-nostats", "-loglevel", "info", "-threads", str(self.threads)]
+        if self.skip_frames:
+            cmd += ["-skip_frame", self.skip_frames]
+        cmd += [
+            "-i", self.video_source, "-map", "0:v:0", "-an", "-sn",
+            "-vf", self._filters(source_hw), "-fps_mode", "passthrough",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"
+        ]
+        return cmd
+
+    def _read_stderr(self):
+        for line in iter(self.process.stderr.readline, b""):
+            match = self.PTS_TIME.search(line.decode(errors="replace"))
+            if match:
+                self.timestamps.put(float(match.group(1)))
+            else:
+                self.stderr_tail = (self.stderr_tail + [line.decode(errors="replace").rstrip()])[-5:]
+
+    def open_source(self):
+        probe = self._probe()
+        if probe is None:
+            return False
+        source_hw, self.source_fps = probe
+        self.shape = self.output_shape(source_hw)
+        try:
+            self.process = subprocess.Popen(self.command(source_hw), stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE, bufsize=0)
+        except FileNotFoundError:
+            print(f"[ERROR] ffmpeg not found ('{self.binary}'); install it or set VIDEO_DECODER = \"opencv\"")
+            return False
+        self.stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+        self.stderr_thread.start()
+        self.frame_count = 0
+        self.first_pts = None
+        print(f"[OK] FFmpeg decoding {source_hw[1]}x{source_hw[0]} -> {self.shape[1]}x{self.shape[0]}")
+        return True
+
+    def _read_into(self, buffer):
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view):
+            read = self.process.stdout.readinto(view[filled:])
+            if not read:
+                return False
+            filled += read
+        return True
+
+    def _source_index(self):
+        """1-based source frame index of the frame just read, from its presentation time."""
+        try:
+            pts = self.timestamps.get(timeout=1.0)
+        except queue.Empty:
+            return self.frame_count + 1
+        if self.first_pts is None:
+            self.first_pts = pts
+        if self.source_fps <= 0:
+            return self.frame_count + 1
+        return max(self.frame_count + 1, int(round((pts - self.first_pts) * self.source_fps)) + 1)
+
+    def read_frame(self):
+        if self.process is None:
+            return False, None
+        shape = (self.shape[0], self.shape[1], 3)
+        buffer = self.frame_pool.acquire() if self.frame_pool is not None else None
+        frame = buffer if buffer is not None and buffer.shape == shape else np.empty(shape, dtype=np.uint8)
+        if not self._read_into(frame):
+            if self.frame_pool is not None:
+                self.frame_pool.release(buffer)
+            return False, None
+        if self.frame_pool is not None and frame is not buffer:
+            self.frame_pool.adopt(frame, replaces=buffer)
+        return True, frame
+
+    def release(self):
+        if self.process is None:
+            return
+        stopped_early = self.process.poll() is None
+        # Closing the pipe first unblocks an ffmpeg that is waiting to write the next frame
+        self.process.stdout.close()
+        if stopped_early:
+            self.process.terminate()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        if self.stderr_thread is not None:
+            self.stderr_thread.join(timeout=1.0)
+        self.process.stderr.close()
+        if not stopped_early and self.process.returncode != 0 and self.stderr_tail:
+            print(f"[ERROR] ffmpeg exited with {self.process.returncode}: {self.stderr_tail[-1]}")
+        self.process = None
+
+    def stream_frames(self):
+        if not self.open_source():
+            raise ValueError(f"Error opening video source: {self.video_source}")
+        try:
+            while True:
+                ret, frame = self.read_frame()
+                if not ret:
+                    break
+                index = self._source_index()
+                # Frames ffmpeg dropped (sampling / skip_frames) never reach the pipe
+                self.frames_skipped += index - self.frame_count - 1
+                self.frame_count = index
+                yield index, frame
+        finally:
+            self.release()
+
+def create_video_tool(source=VIDEO_SOURCE, frame_pool=None, decoder=VIDEO_DECODER):
+    if decoder == "ffmpeg":
+        if str(source).isdigit():
+            # Capture devices are platform-specific ffmpeg inputs; OpenCV handles them
+            print("[WARN] FFmpeg decoder does not open camera indexes, using OpenCV")
+        elif reads_latest_frame(source):
+            # The freshest-frame reader needs grab() without decoding, which the pipe can't do
+            print("[WARN] FFmpeg decoder does not read live sources freshest-frame-first, using OpenCV")
+        else:
+            return FFmpegVideoTool(source, frame_pool=frame_pool)
+    elif decoder != "opencv":
+        raise ValueError(f"Unknown video decoder '{decoder}' (expected opencv or ffmpeg)")
+    return VideoTool(source, frame_pool=frame_pool)
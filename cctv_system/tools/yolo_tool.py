@@ -1,34 +1,505 @@
-from ultralytics import YOLO
-from config import YOLO_MODEL_PATH, CONFIDENCE_THRESHOLD
+import threading
+import time
+import numpy as np
+from tools.detections import Detections, nms_indices
+from tools.motion_tool import MotionGateTool
+from tools.preprocess import LetterboxPreprocessor
+from tools.inference_backends import apply_cpu_settings, create_backend
+from utils.metrics import Metrics
+from config import (
+    YOLO_MODEL_PATH, CONFIDENCE_THRESHOLD, PREPROCESS_POOLED, MODEL_INPUT_SIZE,
+    INFERENCE_BACKEND, INFERENCE_INT8, INFERENCE_THREADS, CASCADE_SCREENER_MODEL,
+    CASCADE_SCREENER_INPUT_SIZE, CASCADE_SCREENER_THRESHOLD, CASCADE_DETECTOR_MODEL, TILING_POLICY,
+    TILING_TILE_SIZE, TILING_OVERLAP, TILING_MIN_FRAME_SIDE, TILING_TRIGGER_THRESHOLD, TILING_MERGE_THRESHOLD,
+    TILING_BATCH_SIZE
+)
 
 class YOLOTool:
-    def __init__(self, model_path=YOLO_MODEL_PATH, conf_threshold=CONFIDENCE_THRESHOLD):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path=YOLO_MODEL_PATH, conf_threshold=CONFIDENCE_THRESHOLD,
+                 pooled_preprocess=PREPROCESS_POOLED, backend=INFERENCE_BACKEND, int8=INFERENCE_INT8,
+                 threads=INFERENCE_THREADS, imgsz=MODEL_INPUT_SIZE):
+        self.model_path = model_path
         self.conf_threshold = conf_threshold
+        # "torch" runs ultralytics directly; "onnx"/"openvino" run an exported copy of model_path
+        self.backend = backend
+        self.int8 = int8
+        self.threads = threads
+        # Letterbox into a reused input tensor instead of letting ultralytics allocate per frame
+        # (exported backends always take a preprocessed tensor)
+        self.imgsz = imgsz
+        self.preprocessor = LetterboxPreprocessor(self.imgsz) if pooled_preprocess or backend != "torch" else None
+        self._model = None
+        self._names = None
+        self.mock_class_id = None
+        self.mock_enabled = True # Synthetic "bottle" detections for the demo video
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+        self.load_time = None
+        self.warmup_time = None
 
-    def detect(self, frame):
-        results = self.model(frame, verbose=False)[0]
-        
-        detections = []
-        for box in results.boxes:
-            conf = float(box.conf[0])
-            if conf >= self.conf_threshold:
-                cls_id = int(box.cls[0])
-                cls_name = self.model.names[cls_id]
-                detections.append({
-                    "class": cls_name,
-                    "confidence": conf,
-                    "bbox": box.xyxy[0].tolist()
-                })
-        
+    @property
+    def model(self):
+        """The YOLO model, loaded on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load_model()
+        return self._model
+
+    @property
+    def names(self):
+        # One shared names dict so downstream lookup tables can be cached per model
+        if self._names is None:
+            self.model
+        return self._names
+
+    def _load_model(self):
+        start = time.perf_counter()
+        apply_cpu_settings(self.threads)
+        if self.backend == "torch":
+            # ultralytics pulls in torch; defer the import until a model is actually needed
+            from ultralytics import YOLO
+            model = YOLO(self.model_path)
+        else:
+            model = create_backend(self.backend, self.model_path, int8=self.int8, threads=self.threads).load()
+            print(f"[OK] {model.name} inference backend loaded")
+        self._names = dict(model.names)
+        self.mock_class_id = self._class_id("bottle")
+        self._model = model
+        self.load_time = time.perf_counter() - start
+
+    def _class_id(self, class_name):
+        for class_id, name in self._names.items():
+            if name == class_name:
+                return class_id
+        class_id = max(self._names, default=-1) + 1
+        self._names[class_id] = class_name
+        return class_id
+
+    def warmup(self, shape=(640, 640, 3), background=False):
+        """
+        Load the model and run one dummy inference so the first real frame doesn't pay
+        for lazy initialization. With background=True this runs on a thread and the next
+        detect() call waits for it.
+        """
+        if background:
+            self._warmup_thread = threading.Thread(target=self.warmup, args=(shape,), daemon=True)
+            self._warmup_thread.start()
+            return None
+        start = time.perf_counter()
+        self._predict([np.zeros(shape, dtype=np.uint8)])
+        self.warmup_time = time.perf_counter() - start
+        return self.warmup_time
+
+    def _wait_for_warmup(self):
+        thread = self._warmup_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+            self._warmup_thread = None
+
+    def _predict(self, frames, imgsz=None):
+        """
+        Unfiltered detections per frame plus their letterbox geometry
+        (None when ultralytics preprocesses and boxes are already in frame coordinates).
+        imgsz overrides the input size for this call.
+        """
+        model = self.model
+        names = self.names
+        if self.preprocessor is None:
+            results = model(frames[0] if len(frames) == 1 else list(frames), imgsz=imgsz or self.imgsz, verbose=False)
+            return [Detections.from_result(result, names) for result in results], None
+        tensor, geometries = self.preprocessor(frames, imgsz)
+        if self.backend != "torch":
+            return [Detections.from_array(dets, names) for dets in model.predict(tensor)], geometries
+        import torch
+        # from_numpy shares memory: the model reads the pooled tensor directly
+        results = model(torch.from_numpy(tensor), verbose=False)
+        return [Detections.from_result(result, names) for result in results], geometries
+
+    def set_input_size(self, imgsz):
+        """Change the model input size (long side) for subsequent frames."""
+        self.imgsz = imgsz
+        if self.preprocessor is not None:
+            self.preprocessor.imgsz = imgsz
+
+    def detect(self, frame, raw=False, imgsz=None, mock=True):
+        """
+        Detections for one frame; raw=True skips the conf_threshold filter (e.g. for the
+        detection cache), imgsz runs this frame at another input size (e.g. a small crop),
+        mock=False leaves out the synthetic demo detections for this call only.
+        """
+        self._wait_for_warmup()
+        detections, geometries = self._predict([frame], imgsz)
+        return self._parse_results(detections[0], frame, geometries[0] if geometries else None, raw, mock)
+
+    def detect_batch(self, frames, raw=False, imgsz=None, mock=True):
+        """Run several frames (e.g. from several cameras) through the model in one forward pass."""
+        if not frames:
+            return []
+        self._wait_for_warmup()
+        detections, geometries = self._predict(frames, imgsz)
+        geometries = geometries or [None] * len(frames)
+        return [self._parse_results(dets, frame, geometry, raw, mock)
+                for dets, frame, geometry in zip(detections, frames, geometries)]
+
+    def _parse_results(self, detections, frame, geometry=None, raw=False, mock=True):
+        if not raw:
+            # Confidence filtering is one vectorized comparison over the whole result
+            detections = detections.above(self.conf_threshold)
+        if geometry is not None:
+            # Boxes are in letterboxed input coordinates
+            scale, (top, left) = geometry
+            detections = detections.to_source(scale, (left, top), frame.shape[:2])
+        mock = self._mock_detections(frame) if mock and self.mock_enabled else None
+        return Detections.concat([detections, mock]) if mock is not None else detections
+
+    def _mock_detections(self, frame):
         # MOCK DETECTION FOR TESTING (preserved from previous logic)
         # Detect 'bottle' (mapped to smoke) if we see the green rectangle
         if frame.shape[0] > 400 and frame.shape[1] > 400:
             if frame[350, 325, 1] > 200: # Green channel high
-                detections.append({
-                    "class": "bottle", # Mapped to smoke
-                    "confidence": 0.95,
-                    "bbox": [300, 300, 350, 450]
-                })
-                
-        return detections
+                return Detections(
+                    [[300, 300, 350, 450]],
+                    [0.95],
+                    [self.mock_class_id], # 'bottle', mapped to smoke
+                    self.names
+                )
+        return None
+
+class CascadeYOLOTool:
+    """
+    Two-stage detector with YOLOTool's interface. A cheap screener (smaller input size or
+    lighter weights) sees every frame; only frames where it finds one of screen_classes at
+    screen_threshold or above are run through the full detector, whose result is returned.
+    Other frames get the screener's detections above the detector's threshold, which by
+    construction contain none of screen_classes.
+    """
+
+    def __init__(self, screen_classes, screener_model=CASCADE_SCREENER_MODEL, screener_imgsz=CASCADE_SCREENER_INPUT_SIZE,
+                 screen_threshold=CASCADE_SCREENER_THRESHOLD, detector_model=CASCADE_DETECTOR_MODEL,
+                 conf_threshold=CONFIDENCE_THRESHOLD, **tool_settings):
+        self.screener = YOLOTool(model_path=screener_model, conf_threshold=screen_threshold, imgsz=screener_imgsz,
+                                 **tool_settings)
+        self.detector = YOLOTool(model_path=detector_model, conf_threshold=conf_threshold, **tool_settings)
+        if screener_model == detector_model:
+            # Same weights at two input sizes: load them once
+            self.screener._load_model = self._share_detector_model
+        self.screen_classes = set(screen_classes)
+        self._screen_ids = None # (names, class ids of screen_classes) for the screener's names
+        self.frames_screened = 0
+        self.frames_escalated = 0
+        self.screener_seconds = 0.0
+        self.detector_seconds = 0.0
+        self.metrics = Metrics()
+
+    def _share_detector_model(self):
+        self.screener._model = self.detector.model
+        self.screener._names = self.detector.names
+        self.screener.mock_class_id = self.detector.mock_class_id
+        self.screener.load_time = 0.0
+
+    @property
+    def names(self):
+        return self.detector.names
+
+    @property
+    def conf_threshold(self):
+        return self.detector.conf_threshold
+
+    @property
+    def imgsz(self):
+        return self.detector.imgsz
+
+    def set_input_size(self, imgsz):
+        """Resize the full detector; the screener is already small."""
+        self.detector.set_input_size(imgsz)
+
+    def warmup(self, shape=(640, 640, 3), background=False):
+        if background:
+            thread = threading.Thread(target=self.warmup, args=(shape,), daemon=True)
+            self.screener._warmup_thread = self.detector._warmup_thread = thread
+            thread.start()
+            return None
+        return self.screener.warmup(shape) + self.detector.warmup(shape)
+
+    def _suspicious(self, detections):
+        names = detections.names
+        if self._screen_ids is None or self._screen_ids[0] is not names:
+            ids = [class_id for class_id, name in names.items() if name in self.screen_classes]
+            self._screen_ids = (names, np.asarray(ids, dtype=np.int32))
+        return bool(np.isin(detections.class_ids, self._screen_ids[1]).any())
+
+    def _timed(self, stage, tool, frames, raw, imgsz=None, mock=True):
+        start = time.perf_counter()
+        results = (tool.detect_batch(frames, raw, imgsz, mock) if len(frames) > 1
+                   else [tool.detect(frames[0], raw, imgsz, mock)])
+        elapsed = time.perf_counter() - start
+        self.metrics.observe("cascade_seconds", elapsed, stage=stage)
+        self.metrics.inc("cascade_frames", len(frames), stage=stage)
+        return results, elapsed
+
+    def detect(self, frame, raw=False, imgsz=None, mock=True):
+        return self.detect_batch([frame], raw, imgsz, mock)[0]
+
+    def detect_batch(self, frames, raw=False, imgsz=None, mock=True):
+        """imgsz runs the detector at another input size (e.g. a small crop); the screener never runs larger."""
+        if not frames:
+            return []
+        # Keep a pending background warmup out of the per-stage timings
+        self.screener._wait_for_warmup()
+        self.detector._wait_for_warmup()
+        # The screener always applies its own (low) threshold; raw only affects the full detector
+        screener_imgsz = min(imgsz, self.screener.imgsz) if imgsz else None
+        screened, elapsed = self._timed("screener", self.screener, frames, False, screener_imgsz, mock)
+        self.frames_screened += len(frames)
+        self.screener_seconds += elapsed
+        escalate = [i for i, detections in enumerate(screened) if self._suspicious(detections)]
+        results = [detections.above(self.detector.conf_threshold) for detections in screened]
+        if escalate:
+            detected, elapsed = self._timed("detector", self.detector, [frames[i] for i in escalate], raw, imgsz, mock)
+            self.frames_escalated += len(escalate)
+            self.detector_seconds += elapsed
+            for i, detections in zip(escalate, detected):
+                results[i] = detections
+        return results
+
+    def get_stats(self):
+        screened = self.frames_screened
+        return {
+            "frames_screened": screened,
+            "frames_escalated": self.frames_escalated,
+            "escalation_rate": round(self.frames_escalated / screened, 3) if screened else 0.0,
+            "screener_ms_per_frame": round(1000.0 * self.screener_seconds / screened, 1) if screened else 0.0,
+            "detector_ms_per_escalation": round(1000.0 * self.detector_seconds / self.frames_escalated, 1)
+                                          if self.frames_escalated else 0.0,
+            "ms_per_frame": round(1000.0 * (self.screener_seconds + self.detector_seconds) / screened, 1)
+                            if screened else 0.0,
+        }
+
+def tile_grid(height, width, tile_size, overlap):
+    """(N, 4) x0, y0, x1, y1 windows covering the frame, neighbours sharing about `overlap` of a tile."""
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1 - overlap)))
+        return list(range(0, length - tile_size, stride)) + [length - tile_size]
+    return np.array([(x, y, min(x + tile_size, width), min(y + tile_size, height))
+                     for y in starts(height) for x in starts(width)], dtype=np.int64)
+
+class TiledYOLOTool:
+    """
+    Detector for high-resolution cameras with YOLOTool's interface. Besides the usual
+    full-frame pass, frames whose long side exceeds min_frame_side are cut into overlapping
+    tile_size tiles that the model sees unscaled, so small objects (knives, scissors) are not
+    lost when the whole frame is shrunk to the model input. The tiles of all frames run as
+    batches, their boxes are mapped back to frame coordinates and merged with the full-frame
+    boxes by class-aware NMS.
+
+    policy="always" runs every tile; "adaptive" only runs the tiles that overlap one of
+    trigger_classes found by the full-frame pass, or that changed since the stream's last frame.
+    """
+
+    def __init__(self, trigger_classes, policy=TILING_POLICY, tile_size=TILING_TILE_SIZE, overlap=TILING_OVERLAP,
+                 min_frame_side=TILING_MIN_FRAME_SIDE, trigger_threshold=TILING_TRIGGER_THRESHOLD,
+                 merge_threshold=TILING_MERGE_THRESHOLD, batch_size=TILING_BATCH_SIZE,
+                 conf_threshold=CONFIDENCE_THRESHOLD, **tool_settings):
+        if policy not in ("always", "adaptive"):
+            raise ValueError(f"Unknown tiling policy '{policy}' (expected always or adaptive)")
+        self.detector = YOLOTool(conf_threshold=conf_threshold, **tool_settings)
+        # Same weights at the tile size; the synthetic demo detections come from the full-frame pass only
+        self.tiler = YOLOTool(conf_threshold=conf_threshold, imgsz=tile_size, **tool_settings)
+        self.tiler._load_model = self._share_detector_model
+        self.tiler.mock_enabled = False
+        self.policy = policy
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_frame_side = min_frame_side
+        self.trigger_classes = set(trigger_classes)
+        self.trigger_threshold = trigger_threshold
+        self.merge_threshold = merge_threshold
+        self.batch_size = max(1, batch_size)
+        self._grids = {} # {(height, width): tile windows}
+        self._trigger_ids = None # (names, class ids of trigger_classes)
+        self.motion = {} # {stream: MotionGateTool} for the adaptive policy
+        self.frames = 0
+        self.frames_tiled = 0
+        self.tiles_run = 0
+        self.tiles_skipped = 0
+        self.tile_only_detections = 0 # Kept detections the full-frame pass did not have
+        self.full_seconds = 0.0
+        self.tile_seconds = 0.0
+        self.metrics = Metrics()
+
+    def _share_detector_model(self):
+        self.tiler._model = self.detector.model
+        self.tiler._names = self.detector.names
+        self.tiler.mock_class_id = self.detector.mock_class_id
+        self.tiler.load_time = 0.0
+
+    @property
+    def names(self):
+        return self.detector.names
+
+    @property
+    def conf_threshold(self):
+        return self.detector.conf_threshold
+
+    @property
+    def imgsz(self):
+        return self.detector.imgsz
+
+    def set_input_size(self, imgsz):
+        """Resize the full-frame pass; tiles always run at tile_size."""
+        self.detector.set_input_size(imgsz)
+
+    def warmup(self, shape=(640, 640, 3), background=False):
+        if background:
+            thread = threading.Thread(target=self.warmup, args=(shape,), daemon=True)
+            self.detector._warmup_thread = self.tiler._warmup_thread = thread
+            thread.start()
+            return None
+        return self.detector.warmup(shape) + self.tiler.warmup((self.tile_size, self.tile_size, 3))
+
+    def _grid(self, height, width):
+        grid = self._grids.get((height, width))
+        if grid is None:
+            grid = self._grids[(height, width)] = tile_grid(height, width, self.tile_size, self.overlap)
+        return grid
+
+    def _active_tiles(self, tiles, frame, stream, detections):
+        if self.policy == "always":
+            return np.ones(len(tiles), dtype=bool)
+        names = detections.names
+        if self._trigger_ids is None or self._trigger_ids[0] is not names:
+            ids = [class_id for class_id, name in names.items() if name in self.trigger_classes]
+            self._trigger_ids = (names, np.asarray(ids, dtype=np.int32))
+        triggers = detections.boxes[np.isin(detections.class_ids, self._trigger_ids[1])
+                                    & (detections.confidences >= self.trigger_threshold)]
+        active = ((tiles[:, None, 0] < triggers[None, :, 2]) & (tiles[:, None, 2] > triggers[None, :, 0])
+                  & (tiles[:, None, 1] < triggers[None, :, 3]) & (tiles[:, None, 3] > triggers[None, :, 1])).any(axis=1)
+
+        gate = self.motion.get(stream)
+        if gate is None:
+            gate = self.motion[stream] = MotionGateTool()
+        changed = gate.changed_mask(frame)
+        scale_y, scale_x = changed.shape[0] / frame.shape[0], changed.shape[1] / frame.shape[1]
+        for i, (x0, y0, x1, y1) in enumerate(tiles):
+            if not active[i]:
+                region = changed[int(y0 * scale_y):max(int(y0 * scale_y) + 1, int(y1 * scale_y)),
+                                 int(x0 * scale_x):max(int(x0 * scale_x) + 1, int(x1 * scale_x))]
+                active[i] = region.mean() > gate.area_threshold
+        return active
+
+    def detect(self, frame, raw=False, stream=None, imgsz=None, mock=True):
+        return self.detect_batch([frame], raw, [stream], imgsz, mock)[0]
+
+    def detect_batch(self, frames, raw=False, streams=None, imgsz=None, mock=True):
+        """
+        streams (one per frame) keep the adaptive policy's motion state apart per camera;
+        imgsz resizes the full-frame pass (tiles always run at tile_size).
+        """
+        if not frames:
+            return []
+        self.detector._wait_for_warmup()
+        self.tiler._wait_for_warmup()
+        streams = list(streams) if streams is not None else [None] * len(frames)
+
+        start = time.perf_counter()
+        full = self.detector.detect_batch(frames, raw=True, imgsz=imgsz, mock=mock)
+        elapsed = time.perf_counter() - start
+        self.full_seconds += elapsed
+        self.metrics.observe("tiling_seconds", elapsed, stage="full")
+        self.frames += len(frames)
+
+        crops, origins = [], [] # origins: (frame index, x0, y0) per crop
+        for i, (frame, stream, detections) in enumerate(zip(frames, streams, full)):
+            height, width = frame.shape[:2]
+            if max(height, width) <= self.min_frame_side:
+                continue
+            tiles = self._grid(height, width)
+            active = self._active_tiles(tiles, frame, stream, detections)
+            self.tiles_skipped += len(tiles) - int(active.sum())
+            if active.any():
+                self.frames_tiled += 1
+            for x0, y0, x1, y1 in tiles[active]:
+                crops.append(frame[y0:y1, x0:x1])
+                origins.append((i, x0, y0))
+
+        tiled = [[] for _ in frames]
+        if crops:
+            start = time.perf_counter()
+            for first in range(0, len(crops), self.batch_size):
+                detected = self.tiler.detect_batch(crops[first:first + self.batch_size], raw=True)
+                for (i, x0, y0), detections in zip(origins[first:], detected):
+                    if len(detections):
+                        tiled[i].append(detections.to_source(1.0, (-x0, -y0)))
+            elapsed = time.perf_counter() - start
+            self.tile_seconds += elapsed
+            self.tiles_run += len(crops)
+            self.metrics.observe("tiling_seconds", elapsed, stage="tiles")
+            self.metrics.inc("tiling_tiles", len(crops))
+
+        results = []
+        for detections, parts in zip(full, tiled):
+            if parts:
+                merged = Detections.concat([detections] + parts)
+                keep = nms_indices(merged.boxes, merged.confidences, merged.class_ids, self.merge_threshold, "ios")
+                from_tiles = keep >= len(detections)
+                if not raw:
+                    from_tiles &= merged.confidences[keep] >= self.conf_threshold
+                self.tile_only_detections += int(from_tiles.sum())
+                detections = merged[keep]
+            results.append(detections if raw else detections.above(self.conf_threshold))
+        return results
+
+    def get_stats(self):
+        frames = self.frames
+        possible = self.tiles_run + self.tiles_skipped
+        return {
+            "frames": frames,
+            "frames_tiled": self.frames_tiled,
+            "tiles_per_frame": round(self.tiles_run / frames, 2) if frames else 0.0,
+            "tiles_skipped_ratio": round(self.tiles_skipped / possible, 3) if possible else 0.0,
+            "tile_only_detections": self.tile_only_detections,
+            "full_ms_per_frame": round(1000.0 * self.full_seconds / frames, 1) if frames else 0.0,
+            "tiles_ms_per_frame": round(1000.0 * self.tile_seconds / frames, 1) if frames else 0.0,
+            "ms_per_frame": round(1000.0 * (self.full_seconds + self.tile_seconds) / frames, 1) if frames else 0.0,
+        }
+
+class StubYOLOTool(YOLOTool):
+    """
+    Detector stand-in without a model (no ultralytics/torch import): returns only the
+    synthetic-video "bottle" detections after an optional fixed latency, so benchmarks
+    can measure pipeline overhead separately from inference cost.
+    """
+
+    def __init__(self, latency=0.0, conf_threshold=CONFIDENCE_THRESHOLD):
+        super().__init__(model_path=None, conf_threshold=conf_threshold)
+        self.latency = latency
+        # Nothing to load: have the names and demo class id ready for detect() without a warmup
+        self._load_model()
+
+    def _load_model(self):
+        self._names = {39: "bottle"} # COCO id, so class ids line up with the real model
+        self.mock_class_id = 39
+        self._model = self
+        self.load_time = 0.0
+
+    def warmup(self, shape=(640, 640, 3), background=False):
+        self.model
+        self.warmup_time = 0.0
+        return self.warmup_time
+
+    def detect(self, frame, raw=False, imgsz=None, mock=True):
+        return self.detect_batch([frame], raw, imgsz, mock)[0]
+
+    def detect_batch(self, frames, raw=False, imgsz=None, mock=True):
+        if not frames:
+            return []
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        for frame in frames:
+            detections = self._mock_detections(frame) if mock and self.mock_enabled else None
+            results.append(detections if detections is not None else Detections(names=self.names))
+        return results
@@ -0,0 +1,177 @@
+"""
+Accuracy-vs-speed comparison of the inference backends on our own footage.
+
+    python -m utils.backend_report
+    python -m utils.backend_report --backends torch,onnx,openvino-int8 --frames 100
+
+Every backend runs the same frames through YOLOTool (mock detections off); the torch
+backend is the reference that the others are matched against.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+from tools.yolo_tool import YOLOTool
+from tools.inference_backends import calibration_frames, BACKENDS
+from config import BENCHMARK_DIR, CONFIDENCE_THRESHOLD, INFERENCE_THREADS, YOLO_MODEL_PATH
+
+DEFAULT_BACKENDS = ["torch", "onnx", "onnx-int8", "openvino", "openvino-int8"]
+MATCH_IOU = 0.5
+
+def parse_backend(spec):
+    """'onnx-int8' -> ('onnx', True)."""
+    name, _, suffix = spec.partition("-")
+    if suffix not in ("", "int8"):
+        raise ValueError(f"Unknown backend '{spec}'")
+    # torch only runs the original weights: it has no INT8 variant
+    if name not in BACKENDS and (name != "torch" or suffix):
+        raise ValueError(f"Unknown backend '{spec}'")
+    return name, suffix == "int8"
+
+def box_iou(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes."""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)))
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+def match(reference, detections):
+    """Greedy same-class matching at MATCH_IOU. Returns [(iou, confidence diff)] per matched pair."""
+    iou = box_iou(reference.boxes, detections.boxes)
+    same_class = reference.class_ids[:, None] == detections.class_ids[None, :]
+    iou = np.where(same_class, iou, 0.0)
+    pairs = []
+    while iou.size and iou.max() >= MATCH_IOU:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        pairs.append((float(iou[i, j]), abs(float(reference.confidences[i] - detections.confidences[j]))))
+        iou[i, :] = 0.0
+        iou[:, j] = 0.0
+    return pairs
+
+def evaluate(spec, frames, conf_threshold, threads):
+    name, int8 = parse_backend(spec)
+    tool = YOLOTool(conf_threshold=conf_threshold, backend=name, int8=int8, threads=threads)
+    tool.mock_enabled = False
+
+    start = time.perf_counter()
+    tool.warmup(shape=frames[0].shape)
+    setup_seconds = time.perf_counter() - start
+
+    outputs = []
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        outputs.append(tool.detect(frame))
+        latencies.append(time.perf_counter() - start)
+    latencies = np.asarray(latencies) * 1000.0
+    return {
+        "backend": spec,
+        "setup_seconds": setup_seconds,
+        "fps": len(frames) / (latencies.sum() / 1000.0),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "detections": int(sum(len(output) for output in outputs)),
+    }, outputs
+
+def accuracy(reference_outputs, outputs):
+    """Agreement with the reference backend over all frames."""
+    pairs = []
+    reference_total = detected_total = identical = 0
+    for reference, detections in zip(reference_outputs, outputs):
+        frame_pairs = match(reference, detections)
+        pairs += frame_pairs
+        reference_total += len(reference)
+        detected_total += len(detections)
+        if (len(reference) == len(detections) == len(frame_pairs)
+                and all(iou > 0.99 and diff < 1e-3 for iou, diff in frame_pairs)):
+            identical += 1
+    return {
+        "recall": len(pairs) / reference_total if reference_total else 1.0,
+        "precision": len(pairs) / detected_total if detected_total else 1.0,
+        "mean_iou": float(np.mean([iou for iou, _ in pairs])) if pairs else None,
+        "mean_confidence_diff": float(np.mean([diff for _, diff in pairs])) if pairs else None,
+        "identical_frames": identical / len(outputs) if outputs else 0.0,
+    }
+
+def markdown(report):
+    lines = [
+        f"# Inference backend comparison ({report['created'][:19]})",
+        "",
+        f"Model `{report['model']}`, {report['frames']} frames, confidence >= {report['confidence_threshold']}, "
+        f"reference `{report['results'][0]['backend']}`.",
+        "",
+        "| Backend | FPS | Mean ms | p95 ms | Speedup | Recall | Precision | Mean IoU | Identical frames |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    reference_ms = report["results"][0]["mean_ms"]
+    for result in report["results"]:
+        if "error" in result:
+            lines.append(f"| {result['backend']} | failed: {result['error']} | | | | | | | |")
+            continue
+        acc = result["accuracy"]
+        iou = f"{acc['mean_iou']:.3f}" if acc["mean_iou"] is not None else "-"
+        lines.append(
+            f"| {result['backend']} | {result['fps']:.1f} | {result['mean_ms']:.1f} | {result['p95_ms']:.1f} | "
+            f"{reference_ms / result['mean_ms']:.2f}x | {acc['recall']:.3f} | {acc['precision']:.3f} | {iou} | "
+            f"{acc['identical_frames']:.0%} |"
+        )
+    return "\n".join(lines) + "\n"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare inference backends on our footage")
+    parser.add_argument("--backends", default=",".join(DEFAULT_BACKENDS),
+                        help="comma separated; the first one is the reference")
+    parser.add_argument("--sources", default="", help="comma separated videos (default: the CAMERAS sources)")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--conf", type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument("--threads", type=int, default=INFERENCE_THREADS)
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "backends"))
+    args = parser.parse_args(argv)
+
+    frames = calibration_frames([s for s in args.sources.split(",") if s] or None, args.frames)
+    results = []
+    reference_outputs = None
+    for spec in [s for s in args.backends.split(",") if s]:
+        print(f"[BENCH] Backend {spec} ...", flush=True)
+        try:
+            result, outputs = evaluate(spec, frames, args.conf, args.threads)
+        except Exception as e:
+            print(f"[ERROR] Backend {spec} failed: {e}")
+            if reference_outputs is None:
+                return 1
+            results.append({"backend": spec, "error": str(e)})
+            continue
+        if reference_outputs is None:
+            reference_outputs = outputs
+        result["accuracy"] = accuracy(reference_outputs, outputs)
+        results.append(result)
+        print(f"[BENCH] {spec}: {result['fps']:.1f} fps, p95 {result['p95_ms']:.1f} ms, "
+              f"recall {result['accuracy']['recall']:.3f}")
+
+    report = {
+        "created": datetime.now().isoformat(),
+        "model": YOLO_MODEL_PATH,
+        "frames": len(frames),
+        "frame_shape": list(frames[0].shape),
+        "confidence_threshold": args.conf,
+        "threads": args.threads,
+        "results": results,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, "backend_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(args.output, "backend_report.md"), "w") as f:
+        f.write(markdown(report))
+    print(f"[OK] Backend report written to {args.output}/backend_report.md")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
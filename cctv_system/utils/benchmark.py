@@ -0,0 +1,382 @@
+"""
+Reproducible benchmark over a matrix of synthetic videos.
+
+    python -m utils.benchmark                       # full matrix from config
+    python -m utils.benchmark --resolutions 640,1080p --detectors stub
+    python -m utils.benchmark --compare benchmarks/results/baseline.json
+    python -m utils.benchmark --videos data/lobby_4k.mp4 --detectors yolo,tiled
+
+Each scenario runs extractor -> analyzer -> aggregator in a fresh process (so peak RSS
+and model state are per scenario) and the results are written as JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+import numpy as np
+import cv2
+from utils.video_gen import create_test_video
+from config import (
+    BENCHMARK_DIR, BENCHMARK_RESOLUTIONS, BENCHMARK_DURATIONS, BENCHMARK_DENSITIES,
+    BENCHMARK_MOTION, BENCHMARK_DETECTORS, BENCHMARK_VIDEO_FPS, BENCHMARK_STUB_LATENCY,
+    BENCHMARK_REGRESSION_TOLERANCE, FRAME_RATE, FRAME_SAMPLING, CONFIDENCE_THRESHOLD,
+    YOLO_MODEL_PATH, MOTION_GATE_ENABLED, FRAME_POOL_ENABLED, PREPROCESS_POOLED, VIDEO_DECODER
+)
+
+RESULTS_SCHEMA = 1
+RESOLUTIONS = {
+    "640": (640, 640),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+STAGES = ("decode", "inference", "aggregation")
+
+def scenario_matrix(resolutions=BENCHMARK_RESOLUTIONS, durations=BENCHMARK_DURATIONS,
+                    densities=BENCHMARK_DENSITIES, motions=BENCHMARK_MOTION, detectors=BENCHMARK_DETECTORS):
+    scenarios = []
+    for resolution in resolutions:
+        width, height = RESOLUTIONS[resolution]
+        for duration in durations:
+            for density in densities:
+                for motion in motions:
+                    video = f"{resolution}_{duration:g}s_d{density}_{motion}"
+                    for detector in detectors:
+                        scenarios.append({
+                            "name": f"{video}_{detector}",
+                            "video": video,
+                            "resolution": resolution,
+                            "width": width,
+                            "height": height,
+                            "duration": duration,
+                            "fps": BENCHMARK_VIDEO_FPS,
+                            "density": density,
+                            "motion": motion,
+                            "detector": detector,
+                        })
+    return scenarios
+
+def video_scenarios(paths, detectors=BENCHMARK_DETECTORS):
+    """Scenarios for recorded clips (no ground truth), e.g. real 4K footage for small-object recall."""
+    scenarios = []
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video {path}")
+        width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        video = os.path.splitext(os.path.basename(path))[0]
+        for detector in detectors:
+            scenarios.append({
+                "name": f"{video}_{detector}",
+                "video": video,
+                "path": path,
+                "resolution": f"{width}x{height}",
+                "width": width,
+                "height": height,
+                "duration": None,
+                "fps": fps,
+                "density": None,
+                "motion": None,
+                "detector": detector,
+            })
+    return scenarios
+
+def prepare_video(scenario, video_dir):
+    """Generate (or reuse) the scenario's video. Returns (path, ground truth)."""
+    if scenario.get("path"):
+        return scenario["path"], {}
+    path = os.path.join(video_dir, f"{scenario['video']}.mp4")
+    truth_path = os.path.splitext(path)[0] + ".json"
+    if not (os.path.exists(path) and os.path.exists(truth_path)):
+        create_test_video(
+            path, duration=scenario["duration"], fps=scenario["fps"],
+            width=scenario["width"], height=scenario["height"],
+            density=scenario["density"], motion=scenario["motion"], ground_truth=True
+        )
+    with open(truth_path) as f:
+        return path, json.load(f)
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _stage_stats(durations):
+    if not durations:
+        return {"calls": 0, "fps": 0.0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    values = np.asarray(durations) * 1000.0
+    total = values.sum() / 1000.0
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "calls": len(values),
+        "fps": len(values) / total if total > 0 else 0.0,
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+def run_scenario(scenario, video_path, ground_truth, work_dir):
+    """Run one scenario in the current process (normally a fresh worker process)."""
+    logging.disable(logging.INFO) # Per-frame agent logs would dominate the timings
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Keep benchmark incidents out of the real incident history
+    from utils.memory import SharedMemory
+    SharedMemory.DB_FILE = os.path.join(work_dir, "incident_history.db")
+    SharedMemory.MEMORY_FILE = os.path.join(work_dir, "incident_history.json")
+    from agents.frame_extractor import VideoFrameExtractorAgent
+    from agents.frame_analyzer import FrameAnalyzerAgent
+    from agents.aggregator import ConfidenceAggregatorAgent
+    from tools.yolo_tool import StubYOLOTool
+    anomaly_classes = set(ConfidenceAggregatorAgent.ANOMALY_MAPPING)
+    from utils.frame_pool import FramePool
+
+    memory = SharedMemory()
+    memory.reset_session()
+    extractor = VideoFrameExtractorAgent(video_path, FramePool(2) if FRAME_POOL_ENABLED else None)
+    # "cascade" screens every frame and escalates suspicious ones, "tiled" adds full-resolution
+    # tiles on large frames; both to compare against "yolo"
+    analyzer = FrameAnalyzerAgent(cascade=scenario["detector"] == "cascade", tiling=scenario["detector"] == "tiled")
+    if scenario["detector"] == "stub":
+        analyzer.yolo_tool = StubYOLOTool(latency=BENCHMARK_STUB_LATENCY)
+    aggregator = ConfidenceAggregatorAgent()
+
+    setup_start = time.perf_counter()
+    analyzer.warmup()
+    setup_seconds = time.perf_counter() - setup_start
+
+    timings = {stage: [] for stage in STAGES}
+    frames = extractor.run()
+    confirmed_frame = None
+    time_to_incident = None
+    anomaly_detections = 0
+    anomaly_frames = 0
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        try:
+            frame_count, frame = next(frames)
+        except StopIteration:
+            break
+        t1 = time.perf_counter()
+        detections = analyzer.run(frame)
+        t2 = time.perf_counter()
+        confirmed = aggregator.run(detections, frame_count)
+        t3 = time.perf_counter()
+        extractor.release(frame)
+        timings["decode"].append(t1 - t0)
+        timings["inference"].append(t2 - t1)
+        timings["aggregation"].append(t3 - t2)
+        # Recall proxy for footage without labels: anomaly-class detections the detector returned
+        hits = sum(1 for name in detections.class_names if name in anomaly_classes)
+        anomaly_detections += hits
+        anomaly_frames += hits > 0
+        if confirmed and confirmed_frame is None:
+            # Keep going: throughput is measured over the whole clip
+            confirmed_frame = frame_count
+            time_to_incident = t3 - start
+    wall_seconds = time.perf_counter() - start
+
+    frames_analyzed = len(timings["inference"])
+    incident_start = ground_truth.get("incident_start_frame")
+    return {
+        "scenario": scenario,
+        "frames": frames_analyzed,
+        "frames_skipped": extractor.video_tool.frames_skipped,
+        "wall_seconds": wall_seconds,
+        "fps": frames_analyzed / wall_seconds if wall_seconds > 0 else 0.0,
+        "setup_seconds": setup_seconds,
+        "stages": {stage: _stage_stats(timings[stage]) for stage in STAGES},
+        "peak_rss_mb": _peak_rss_mb(),
+        "incident_start_frame": incident_start,
+        "confirmed_frame": confirmed_frame,
+        "confirmation_delay_frames": confirmed_frame - incident_start if confirmed_frame and incident_start else None,
+        "time_to_incident_seconds": time_to_incident,
+        "anomaly_detections": anomaly_detections,
+        "anomaly_frames": anomaly_frames,
+        "cascade": analyzer.get_cascade_stats(),
+        "tiling": analyzer.get_tiling_stats(),
+    }
+
+def _environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def run_benchmark(scenarios, output=None, keep_work=False):
+    """Run every scenario in its own process and write the JSON results. Returns the results dict."""
+    video_dir = os.path.join(BENCHMARK_DIR, "videos")
+    work_root = os.path.join(BENCHMARK_DIR, "work")
+    results = []
+    # spawn + one task per child: every scenario starts from a clean interpreter
+    context = multiprocessing.get_context("spawn")
+    for scenario in scenarios:
+        video_path, ground_truth = prepare_video(scenario, video_dir)
+        work_dir = os.path.join(work_root, scenario["name"])
+        print(f"[BENCH] {scenario['name']} ...", flush=True)
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_scenario, scenario, video_path, ground_truth, work_dir).result()
+        except Exception as e:
+            print(f"[ERROR] {scenario['name']} failed: {e}")
+            result = {"scenario": scenario, "error": str(e)}
+        finally:
+            if not keep_work:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        results.append(result)
+        if "error" not in result:
+            print(
+                f"[BENCH] {scenario['name']}: {result['fps']:.1f} fps, "
+                f"inference p95 {result['stages']['inference']['p95_ms']:.1f} ms, "
+                f"peak RSS {result['peak_rss_mb'] or 0:.0f} MB, "
+                f"incident at frame {result['confirmed_frame']}"
+            )
+
+    # Tiled runs against the plain detector on the same clip: what the extra tiles cost and find
+    plain = {result["scenario"]["video"]: result for result in results
+             if result["scenario"]["detector"] == "yolo" and "error" not in result}
+    for result in results:
+        base = plain.get(result["scenario"]["video"])
+        if result["scenario"]["detector"] != "tiled" or "error" in result or base is None:
+            continue
+        result["vs_yolo"] = {
+            "fps_ratio": round(result["fps"] / base["fps"], 3) if base["fps"] else None,
+            "anomaly_detections": [base["anomaly_detections"], result["anomaly_detections"]],
+            "anomaly_frames": [base["anomaly_frames"], result["anomaly_frames"]],
+        }
+        print(
+            f"[BENCH] {result['scenario']['video']}: tiled vs yolo {base['fps']:.1f} -> {result['fps']:.1f} fps, "
+            f"anomaly detections {base['anomaly_detections']} -> {result['anomaly_detections']}, "
+            f"frames with anomalies {base['anomaly_frames']} -> {result['anomaly_frames']}"
+        )
+
+    report = {
+        "schema": RESULTS_SCHEMA,
+        "created": datetime.now().isoformat(),
+        "environment": _environment(),
+        "settings": {
+            "frame_rate": FRAME_RATE,
+            "frame_sampling": FRAME_SAMPLING,
+            "confidence_threshold": CONFIDENCE_THRESHOLD,
+            "model": YOLO_MODEL_PATH,
+            "motion_gate": MOTION_GATE_ENABLED,
+            "frame_pool": FRAME_POOL_ENABLED,
+            "pooled_preprocess": PREPROCESS_POOLED,
+            "video_decoder": VIDEO_DECODER,
+            "stub_latency": BENCHMARK_STUB_LATENCY,
+        },
+        "results": results,
+    }
+    if output is None:
+        output = os.path.join(BENCHMARK_DIR, "results", f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[OK] Benchmark results written to {output}")
+    return report
+
+def compare(current, baseline, tolerance=BENCHMARK_REGRESSION_TOLERANCE):
+    """
+    Compare two result dicts scenario by scenario.
+    Returns a list of regression messages (throughput, p95 latency, detection, recall proxy).
+    """
+    previous = {result["scenario"]["name"]: result for result in baseline["results"] if "error" not in result}
+    regressions = []
+    for result in current["results"]:
+        name = result["scenario"]["name"]
+        old = previous.get(name)
+        if old is None:
+            continue
+        if "error" in result:
+            regressions.append(f"{name}: failed ({result['error']})")
+            continue
+        if result["fps"] < old["fps"] * (1 - tolerance):
+            regressions.append(f"{name}: fps {old['fps']:.1f} -> {result['fps']:.1f}")
+        for stage in STAGES:
+            old_p95 = old["stages"][stage]["p95_ms"]
+            new_p95 = result["stages"][stage]["p95_ms"]
+            # Sub-millisecond stages are too noisy to compare relatively
+            if new_p95 > max(old_p95 * (1 + tolerance), old_p95 + 1.0):
+                regressions.append(f"{name}: {stage} p95 {old_p95:.1f} ms -> {new_p95:.1f} ms")
+        if old["confirmed_frame"] is not None and result["confirmed_frame"] is None:
+            regressions.append(f"{name}: incident no longer confirmed")
+        elif (old["confirmation_delay_frames"] is not None and result["confirmation_delay_frames"] is not None
+              and result["confirmation_delay_frames"] > old["confirmation_delay_frames"]):
+            regressions.append(
+                f"{name}: confirmation delay {old['confirmation_delay_frames']} -> "
+                f"{result['confirmation_delay_frames']} frames"
+            )
+        # Results from before the recall proxy have no count to compare against
+        if result["anomaly_frames"] < old.get("anomaly_frames", 0) * (1 - tolerance):
+            regressions.append(f"{name}: frames with anomalies {old['anomaly_frames']} -> {result['anomaly_frames']}")
+    return regressions
+
+def _csv(value):
+    return [item for item in value.split(",") if item]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the frame pipeline on synthetic videos")
+    parser.add_argument("--resolutions", type=_csv, default=BENCHMARK_RESOLUTIONS,
+                        help=f"comma separated, from {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--durations", type=lambda v: [float(d) for d in _csv(v)], default=BENCHMARK_DURATIONS)
+    parser.add_argument("--densities", type=lambda v: [int(d) for d in _csv(v)], default=BENCHMARK_DENSITIES)
+    parser.add_argument("--motion", type=_csv, default=BENCHMARK_MOTION, help="static,high")
+    parser.add_argument("--detectors", type=_csv, default=BENCHMARK_DETECTORS, help="stub,yolo,cascade,tiled")
+    parser.add_argument("--videos", type=_csv, help="comma separated recorded clips to run instead of the synthetic matrix")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/benchmark_<time>.json)")
+    parser.add_argument("--compare", help="baseline results file; exit code 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_REGRESSION_TOLERANCE)
+    parser.add_argument("--keep-work", action="store_true", help="keep per-scenario incident databases and snapshots")
+    args = parser.parse_args(argv)
+
+    unknown = [r for r in args.resolutions if r not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"unknown resolution(s): {', '.join(unknown)}")
+
+    if args.videos:
+        scenarios = video_scenarios(args.videos, args.detectors)
+    else:
+        scenarios = scenario_matrix(args.resolutions, args.durations, args.densities, args.motion, args.detectors)
+    report = run_benchmark(scenarios, args.output, args.keep_work)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for message in regressions:
+            print(f"[WARN] Regression: {message}")
+        if regressions:
+            return 1
+        print("[OK] No regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
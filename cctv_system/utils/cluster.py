@@ -0,0 +1,388 @@
+"""
+Camera sharding across nodes: one coordinator, any number of workers.
+
+    python main.py --role coordinator
+    python main.py --role worker --coordinator 10.0.0.5:7070 --worker-id node-2
+
+The protocol is newline-delimited JSON over TCP. Workers send hello, load (also the
+heartbeat), incident, incident_update and camera_done messages; the coordinator sends
+assign (the complete camera list a worker should serve) and shutdown. Camera sources
+must be reachable from every worker under the same path or URL.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from utils.memory import SharedMemory
+from utils.metrics import Metrics
+from utils.multi_camera import MultiCameraRuntime
+from config import (
+    CAMERAS, CLUSTER_HOST, CLUSTER_PORT, CLUSTER_HEARTBEAT_INTERVAL, CLUSTER_HEARTBEAT_TIMEOUT,
+    CLUSTER_CONNECT_TIMEOUT, CLUSTER_LOAD_LOG_INTERVAL, MULTI_CAMERA_QUEUE_SIZE, MULTI_CAMERA_BATCH_SIZE
+)
+
+def parse_address(address):
+    """'host:port' -> (host, port)."""
+    host, _, port = address.rpartition(":")
+    return host or CLUSTER_HOST, int(port)
+
+class Connection:
+    """A socket carrying one JSON message per line; send() is safe to call from any thread."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("r", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        try:
+            with self.lock:
+                self.sock.sendall(data)
+            return True
+        except OSError:
+            return False
+
+    def messages(self):
+        """Yield messages until the peer disconnects."""
+        try:
+            for line in self.reader:
+                if line.strip():
+                    yield json.loads(line)
+        except (OSError, ValueError):
+            return
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+class WorkerHandle:
+    """Coordinator-side state of one connected worker."""
+
+    def __init__(self, worker_id, connection):
+        self.worker_id = worker_id
+        self.connection = connection
+        self.last_seen = time.monotonic()
+        self.load = {}
+        self.cameras = set() # camera ids assigned to this worker
+
+class ClusterCoordinator:
+    """
+    Assigns CAMERAS to connected workers, rebalancing whenever a worker joins or is lost
+    (disconnect or no heartbeat for heartbeat_timeout), and stores the incidents workers
+    stream back in the central incident store before handing them to on_incident.
+    Cameras that finished (incident confirmed or end of video) are not reassigned.
+    """
+
+    def __init__(self, cameras=CAMERAS, host=CLUSTER_HOST, port=CLUSTER_PORT, on_incident=None,
+                 heartbeat_timeout=CLUSTER_HEARTBEAT_TIMEOUT, load_log_interval=CLUSTER_LOAD_LOG_INTERVAL, logger=None):
+        self.cameras = {camera["camera_id"]: camera for camera in cameras}
+        self.host = host
+        self.port = port
+        self.on_incident = on_incident
+        self.heartbeat_timeout = heartbeat_timeout
+        self.load_log_interval = load_log_interval
+        self.logger = logger
+        self.memory = SharedMemory()
+        self.metrics = Metrics()
+        self.lock = threading.RLock()
+        self.workers = {} # {worker_id: WorkerHandle}
+        self.done = set() # camera ids that finished
+        self.incident_ids = {} # {(worker_id, worker's incident id): central incident id}
+        self.finished = threading.Event()
+        self.closing = False
+        self.server = None
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def start(self):
+        self.server = socket.create_server((self.host, self.port))
+        threading.Thread(target=self._accept_loop, name="cluster-accept", daemon=True).start()
+        print(f"[CLUSTER] Coordinator listening on {self.host}:{self.port} for {len(self.cameras)} camera(s)")
+        return self
+
+    def run(self):
+        """Serve until every camera has finished (or forever for live cameras)."""
+        if self.server is None:
+            self.start()
+        next_load_log = time.monotonic() + self.load_log_interval
+        while not self.finished.wait(timeout=0.5):
+            now = time.monotonic()
+            with self.lock:
+                silent = [handle for handle in self.workers.values() if now - handle.last_seen > self.heartbeat_timeout]
+            for handle in silent:
+                self._log(f"Worker {handle.worker_id} missed its heartbeat; reassigning its cameras", "warning")
+                self._drop(handle)
+            if now >= next_load_log:
+                next_load_log = now + self.load_log_interval
+                for worker_id, load in sorted(self.get_load().items()):
+                    self._log(f"Worker {worker_id}: {load}")
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return # Listener closed
+            threading.Thread(target=self._serve, args=(Connection(sock),), daemon=True).start()
+
+    def _serve(self, connection):
+        handle = None
+        for message in connection.messages():
+            if handle is None:
+                if message.get("type") != "hello":
+                    break
+                handle = self._register(message["worker_id"], connection)
+                continue
+            handle.last_seen = time.monotonic()
+            self._handle(handle, message)
+        connection.close()
+        if handle is not None:
+            self._drop(handle)
+
+    def _register(self, worker_id, connection):
+        handle = WorkerHandle(worker_id, connection)
+        with self.lock:
+            previous = self.workers.get(worker_id)
+            if previous is not None:
+                # A restarted worker reconnecting under the same id replaces its old connection
+                previous.connection.close()
+            self.workers[worker_id] = handle
+        self._log(f"Worker {worker_id} joined")
+        self.rebalance()
+        return handle
+
+    def _drop(self, handle):
+        with self.lock:
+            if self.workers.get(handle.worker_id) is not handle:
+                return
+            del self.workers[handle.worker_id]
+        handle.connection.close()
+        for name in ("cluster_worker_cameras", "cluster_worker_fps"):
+            self.metrics.remove_gauge(name, worker=handle.worker_id)
+        if self.closing:
+            return
+        self._log(f"Worker {handle.worker_id} left", "warning")
+        self.rebalance()
+
+    def _handle(self, handle, message):
+        kind = message.get("type")
+        if kind == "load":
+            handle.load = message
+            self.metrics.set_gauge("cluster_worker_cameras", len(message.get("cameras", [])), worker=handle.worker_id)
+            self.metrics.set_gauge("cluster_worker_fps", message.get("fps", 0.0), worker=handle.worker_id)
+        elif kind == "incident":
+            # Central ids replace the worker's local ones; updates arrive keyed by the local id
+            record = dict(message["record"], id=None, actions=[], worker_id=handle.worker_id)
+            self.memory.add_incident(record)
+            with self.lock:
+                self.incident_ids[(handle.worker_id, message["local_id"])] = record["id"]
+            self._log(f"Incident {record['id']} ({record['type']}) from {record['camera_id']} on worker {handle.worker_id}")
+            if self.on_incident is not None:
+                self.on_incident(record)
+        elif kind == "incident_update":
+            incident_id = self.incident_ids.get((handle.worker_id, message["local_id"]))
+            if incident_id is not None and message.get("fields"):
+                self.memory.update_incident(incident_id, **message["fields"])
+        elif kind == "camera_done":
+            with self.lock:
+                self.done.add(message["camera_id"])
+                handle.cameras.discard(message["camera_id"])
+                all_done = self.done >= set(self.cameras)
+            self._log(f"Camera {message['camera_id']} finished on worker {handle.worker_id}")
+            if all_done:
+                self.finished.set()
+
+    def rebalance(self):
+        """
+        Spread the unfinished cameras evenly (counts differ by at most one), keeping each
+        camera where it is whenever that worker is still within its share.
+        """
+        with self.lock:
+            active = [camera_id for camera_id in self.cameras if camera_id not in self.done]
+            handles = sorted(self.workers.values(), key=lambda h: (-len(h.cameras), h.worker_id))
+            if not handles:
+                if active:
+                    self._log(f"No workers connected; {len(active)} camera(s) waiting", "warning")
+                return
+            base, extra = divmod(len(active), len(handles))
+            quotas = {handle.worker_id: base + (1 if i < extra else 0) for i, handle in enumerate(handles)}
+
+            previous = {handle.worker_id: set(handle.cameras) for handle in handles}
+            assigned = set()
+            for handle in handles:
+                keep = sorted(camera_id for camera_id in handle.cameras if camera_id in active)
+                handle.cameras = set(keep[:quotas[handle.worker_id]])
+                assigned |= handle.cameras
+            for camera_id in active:
+                if camera_id in assigned:
+                    continue
+                handle = min(handles, key=lambda h: (len(h.cameras) - quotas[h.worker_id], len(h.cameras)))
+                handle.cameras.add(camera_id)
+
+            changed = [handle for handle in handles if handle.cameras != previous[handle.worker_id]]
+            for handle in changed:
+                handle.connection.send({
+                    "type": "assign",
+                    "cameras": [self.cameras[camera_id] for camera_id in sorted(handle.cameras)]
+                })
+            layout = ", ".join(f"{h.worker_id}={sorted(h.cameras)}" for h in sorted(handles, key=lambda h: h.worker_id))
+        if changed:
+            print(f"[CLUSTER] Assignment: {layout}")
+
+    def get_load(self):
+        """Last reported load per worker."""
+        with self.lock:
+            return {
+                handle.worker_id: {
+                    "cameras": sorted(handle.cameras),
+                    "fps": handle.load.get("fps", 0.0),
+                    "frames": handle.load.get("frames", 0),
+                    "queued_frames": handle.load.get("queued_frames", 0),
+                }
+                for handle in self.workers.values()
+            }
+
+    def close(self):
+        self.closing = True
+        with self.lock:
+            handles = list(self.workers.values())
+        for handle in handles:
+            handle.connection.send({"type": "shutdown"})
+        if self.server is not None:
+            self.server.close()
+        # Give workers a moment to flush their last messages before the connections go
+        deadline = time.monotonic() + 2 * CLUSTER_HEARTBEAT_INTERVAL
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.workers:
+                    break
+            time.sleep(0.05)
+        for handle in handles:
+            handle.connection.close()
+
+class ClusterWorker:
+    """
+    Serves the cameras the coordinator assigns with a persistent MultiCameraRuntime and
+    streams incidents (and their evidence paths, once written) back. Incidents are also
+    kept in the worker's own incident store as a local journal.
+    """
+
+    def __init__(self, analyzer, worker_id, host=CLUSTER_HOST, port=CLUSTER_PORT, snapshot_dir="data/snapshots",
+                 heartbeat_interval=CLUSTER_HEARTBEAT_INTERVAL, connect_timeout=CLUSTER_CONNECT_TIMEOUT,
+                 logger=None, on_first_frame=None):
+        self.worker_id = worker_id
+        self.host = host
+        self.port = port
+        self.heartbeat_interval = heartbeat_interval
+        self.connect_timeout = connect_timeout
+        self.logger = logger
+        self.memory = SharedMemory()
+        self.runtime = MultiCameraRuntime(
+            [], analyzer, None, None, snapshot_dir,
+            queue_size=MULTI_CAMERA_QUEUE_SIZE, batch_size=MULTI_CAMERA_BATCH_SIZE, logger=logger,
+            on_first_frame=on_first_frame, on_incident=self._forward_incident,
+            on_stream_closed=self._stream_closed, persistent=True
+        )
+        self.connection = None
+        self.incidents = {} # {camera_id: [local incident ids]}
+        self.lock = threading.Lock()
+        self.open_streams = set() # Streams counted by the heartbeat until they are closed
+        self.frames_closed = 0 # Frames processed by streams that have been closed
+        self.shutting_down = False
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=5)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"Coordinator {self.host}:{self.port} unreachable")
+                time.sleep(0.5)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connection = Connection(sock)
+        self.connection.send({"type": "hello", "worker_id": self.worker_id, "pid": os.getpid(),
+                              "host": socket.gethostname()})
+        print(f"[CLUSTER] Worker {self.worker_id} connected to {self.host}:{self.port}")
+
+    def run(self):
+        """Serve assignments until the coordinator shuts us down or goes away."""
+        if self.connection is None:
+            self.connect()
+        threading.Thread(target=self._receive_loop, name="cluster-receive", daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name="cluster-heartbeat", daemon=True).start()
+        try:
+            self.runtime.run()
+        finally:
+            self.shutting_down = True
+            self.connection.close()
+
+    def _receive_loop(self):
+        for message in self.connection.messages():
+            kind = message.get("type")
+            if kind == "assign":
+                cameras = message["cameras"]
+                self._log(f"Assigned {[camera['camera_id'] for camera in cameras]}")
+                self.runtime.set_cameras(cameras)
+            elif kind == "shutdown":
+                self._log("Shutdown requested by the coordinator")
+                self.shutting_down = True
+                break
+        if not self.shutting_down:
+            self._log("Coordinator connection closed; stopping")
+        self.shutting_down = True
+        self.runtime.stop()
+
+    def _heartbeat_loop(self):
+        last_frames, last_time = 0, time.monotonic()
+        while not self.shutting_down:
+            time.sleep(self.heartbeat_interval)
+            streams = self.runtime.streams
+            with self.lock:
+                # A stream moves from open_streams to frames_closed in one step, so the total never drops
+                # (finished streams are not picked up again: they may already have been closed)
+                self.open_streams.update(stream for stream in streams if not stream.finished)
+                frames = self.frames_closed + sum(stream.frames_processed for stream in self.open_streams)
+            now = time.monotonic()
+            fps = (frames - last_frames) / (now - last_time)
+            last_frames, last_time = frames, now
+            self.connection.send({
+                "type": "load",
+                "cameras": [stream.camera_id for stream in streams if not stream.stop_event.is_set()],
+                "frames": frames,
+                "fps": round(fps, 2),
+                "queued_frames": sum(stream.frames.qsize() for stream in streams),
+            })
+
+    def _forward_incident(self, stream, incident):
+        self.incidents.setdefault(stream.camera_id, []).append(incident["id"])
+        self.connection.send({"type": "incident", "local_id": incident["id"], "record": incident})
+
+    def _stream_closed(self, stream):
+        with self.lock:
+            self.open_streams.discard(stream)
+            self.frames_closed += stream.frames_processed
+        # Evidence writes have finished by now, so the stored records carry their final paths
+        for local_id in self.incidents.pop(stream.camera_id, []):
+            record = self.memory.get_incident_by_id(local_id) or {}
+            fields = {field: record[field] for field in ("snapshot_path", "clip_path") if record.get(field)}
+            self.connection.send({"type": "incident_update", "local_id": local_id, "fields": fields})
+        if not stream.removed and not self.shutting_down:
+            self.connection.send({"type": "camera_done", "camera_id": stream.camera_id})
@@ -0,0 +1,246 @@
+"""
+Persistent cache of raw (pre-threshold) detections, so aggregation settings can be tuned
+by replaying archived footage without running the detector again.
+
+    python -m utils.detection_cache                      # cache every camera source
+    python -m utils.detection_cache data/archive/*.mp4
+    python -m utils.detection_cache --list
+
+Set REPLAY_ENABLED = True to have main.py feed the cached detections of VIDEO_SOURCE
+to the aggregator (the cache is built on the first replay if it is missing).
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import numpy as np
+from tools.detections import Detections
+from config import (
+    DETECTION_CACHE_DIR, DETECTION_CACHE_MAX_MB, YOLO_MODEL_PATH, INFERENCE_BACKEND, INFERENCE_INT8,
+    INFERENCE_BATCH_SIZE, MODEL_INPUT_SIZE, VIDEO_DECODER, FFMPEG_SCALE_TO_MODEL, FRAME_RATE,
+    FRAME_SAMPLING, CAMERAS
+)
+
+ARRAYS = ("frames", "offsets", "boxes", "confidences", "class_ids")
+
+def _sha256(path, chunk_size=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DetectionCacheEntry:
+    """
+    One cached run: a directory of .npy columns, memory-mapped on open.
+    frames[i] is the source frame index of the i-th analyzed frame and its detections
+    are rows offsets[i]:offsets[i + 1] of boxes / confidences / class_ids.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        # JSON object keys are strings; Detections expects int class ids
+        self.names = {int(class_id): name for class_id, name in self.meta["names"].items()}
+        # (height, width) the detections' coordinates refer to; entries from older builds lack it
+        self.frame_shape = tuple(self.meta["frame_shape"]) if self.meta.get("frame_shape") else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def detections(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return Detections(self.boxes[start:end], self.confidences[start:end], self.class_ids[start:end], self.names)
+
+    def replay(self, conf_threshold=None):
+        """Yield (frame_count, detections) in frame order, optionally re-thresholded."""
+        for i in range(len(self)):
+            detections = self.detections(i)
+            if conf_threshold is not None:
+                detections = detections.above(conf_threshold)
+            yield int(self.frames[i]), detections
+
+    @staticmethod
+    def write(path, frames, detections, meta):
+        """Write a complete entry atomically (a temporary directory renamed into place)."""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        counts = [len(dets) for dets in detections]
+        columns = {
+            "frames": np.asarray(frames, dtype=np.int64),
+            "offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            "boxes": np.concatenate([dets.boxes for dets in detections]) if detections else np.zeros((0, 4), np.float32),
+            # float32 halves the size; thresholds are nowhere near that precision
+            "confidences": np.concatenate([dets.confidences for dets in detections]).astype(np.float32)
+                           if detections else np.zeros(0, np.float32),
+            "class_ids": np.concatenate([dets.class_ids for dets in detections]) if detections else np.zeros(0, np.int32),
+        }
+        for name, column in columns.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), column)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+class DetectionCache:
+    """
+    Entries are keyed by video content hash, model file hash, inference backend and the
+    settings that decide which frames are analyzed and at what size. index.json remembers
+    file hashes (by path, size and mtime) and each entry's size and last use, and the
+    least recently used entries are evicted once the cache exceeds max_mb.
+    """
+
+    def __init__(self, cache_dir=DETECTION_CACHE_DIR, max_mb=DETECTION_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("files", {})
+        index.setdefault("entries", {})
+        return index
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def file_hash(self, path):
+        """Content hash of a file, recomputed only when its size or mtime changes."""
+        stat = os.stat(path)
+        known = self.index["files"].get(os.path.abspath(path))
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            return known["sha256"]
+        digest = _sha256(path)
+        self.index["files"][os.path.abspath(path)] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest}
+        self._save_index()
+        return digest
+
+    def settings(self, source):
+        """Everything that changes the cached detections."""
+        return {
+            "video_sha256": self.file_hash(source),
+            "model_sha256": self.file_hash(YOLO_MODEL_PATH),
+            "backend": f"{INFERENCE_BACKEND}-int8" if INFERENCE_INT8 and INFERENCE_BACKEND != "torch" else INFERENCE_BACKEND,
+            "input_size": MODEL_INPUT_SIZE,
+            "decoder": "ffmpeg-scaled" if VIDEO_DECODER == "ffmpeg" and FFMPEG_SCALE_TO_MODEL else VIDEO_DECODER,
+            "frame_rate": FRAME_RATE if FRAME_SAMPLING else None,
+        }
+
+    def key(self, source):
+        payload = json.dumps(self.settings(source), sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    def get(self, source):
+        """The cached entry for source under the current settings, or None."""
+        if str(source).isdigit():
+            return None # Live cameras have no content to key on
+        key = self.key(source)
+        path = os.path.join(self.cache_dir, key)
+        if key not in self.index["entries"] or not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        self.index["entries"][key]["last_used"] = time.time()
+        self._save_index()
+        return DetectionCacheEntry(path)
+
+    def build(self, source, yolo_tool=None, batch_size=INFERENCE_BATCH_SIZE):
+        """Run the detector over the whole video and cache its raw detections."""
+        from tools.video_tool import create_video_tool
+        from tools.yolo_tool import YOLOTool
+        settings = self.settings(source)
+        key = self.key(source)
+        yolo_tool = yolo_tool or YOLOTool()
+        video_tool = create_video_tool(source)
+        batch_size = max(1, batch_size)
+
+        print(f"[CACHE] Caching detections for {source}...")
+        start = time.perf_counter()
+        frames, detections, batch = [], [], []
+        frame_shape = None
+        for frame_count, frame in video_tool.stream_frames():
+            frame_shape = frame_shape or list(frame.shape[:2])
+            batch.append((frame_count, frame))
+            if len(batch) >= batch_size:
+                self._detect(yolo_tool, batch, frames, detections)
+                batch = []
+                if len(frames) % 1000 < batch_size:
+                    print(f"[CACHE] {len(frames)} frames cached...")
+        self._detect(yolo_tool, batch, frames, detections)
+
+        meta = dict(settings, source=source, names={str(k): v for k, v in yolo_tool.names.items()},
+                    frames=len(frames), frame_shape=frame_shape, created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    build_seconds=round(time.perf_counter() - start, 3))
+        path = os.path.join(self.cache_dir, key)
+        DetectionCacheEntry.write(path, frames, detections, meta)
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        self.index["entries"][key] = {"source": source, "bytes": size, "last_used": time.time()}
+        self.evict(keep=key)
+        print(f"[CACHE] Cached {len(frames)} frames ({size / 1024:.0f} KiB) in {meta['build_seconds']:.1f}s")
+        return DetectionCacheEntry(path)
+
+    @staticmethod
+    def _detect(yolo_tool, batch, frames, detections):
+        if not batch:
+            return
+        if len(batch) == 1:
+            results = [yolo_tool.detect(batch[0][1], raw=True)]
+        else:
+            results = yolo_tool.detect_batch([frame for _, frame in batch], raw=True)
+        frames.extend(frame_count for frame_count, _ in batch)
+        detections.extend(results)
+
+    def get_or_build(self, source, need_frame_shape=False):
+        """need_frame_shape rebuilds entries cached before the frame shape was recorded."""
+        entry = self.get(source)
+        if entry is None or (need_frame_shape and entry.frame_shape is None):
+            entry = self.build(source)
+        else:
+            print(f"[CACHE] Reusing cached detections for {source} ({len(entry)} frames)")
+        return entry
+
+    def evict(self, keep=None):
+        """Drop least recently used entries until the cache fits max_bytes."""
+        entries = self.index["entries"]
+        total = sum(entry["bytes"] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= entries.pop(key)["bytes"]
+            print(f"[CACHE] Evicted detections cache {key}")
+        self._save_index()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cache raw detections for offline replay")
+    parser.add_argument("sources", nargs="*", help="videos to cache (default: the CAMERAS sources)")
+    parser.add_argument("--list", action="store_true", help="list cached entries")
+    args = parser.parse_args(argv)
+
+    cache = DetectionCache()
+    if args.list:
+        for key, entry in sorted(cache.index["entries"].items(), key=lambda item: item[1]["last_used"]):
+            print(f"{key}  {entry['bytes'] / 1024:10.0f} KiB  {entry['source']}")
+        return 0
+    for source in args.sources or [camera["source"] for camera in CAMERAS]:
+        cache.get_or_build(source)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
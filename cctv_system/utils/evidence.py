@@ -0,0 +1,228 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
+import cv2
+import numpy as np
+from utils.memory import SharedMemory
+from config import (
+    EVIDENCE_BUFFER_FRAMES, EVIDENCE_BUFFER_MAX_MB, EVIDENCE_BUFFER_COMPRESSION,
+    EVIDENCE_JPEG_QUALITY, EVIDENCE_WRITER_WORKERS, EVIDENCE_CLIP_ENABLED,
+    EVIDENCE_CLIP_PRE_SECONDS, EVIDENCE_CLIP_POST_SECONDS, FRAME_RATE
+)
+
+class FrameRingBuffer:
+    """
+    Bounded in-memory history of recent frames. Frames are kept JPEG-compressed in RAM
+    (or as raw copies) and evicted oldest-first once either the frame or byte cap is hit.
+    """
+
+    def __init__(self, max_frames=EVIDENCE_BUFFER_FRAMES, max_mb=EVIDENCE_BUFFER_MAX_MB,
+                 compression=EVIDENCE_BUFFER_COMPRESSION, jpeg_quality=EVIDENCE_JPEG_QUALITY):
+        self.max_frames = max_frames
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.compression = compression
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.frames = deque() # [(frame_count, payload)]
+        self.index = {} # {frame_count: payload}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def compress(self, frame):
+        """Turn a frame into a buffer payload. Safe to call from worker threads."""
+        if self.compression == "jpeg":
+            ok, encoded = cv2.imencode(".jpg", frame, self.jpeg_params)
+            if ok:
+                return ("jpeg", encoded)
+        # Raw payloads are copies so pooled/reused frame buffers can be recycled
+        return ("raw", frame.copy())
+
+    @staticmethod
+    def payload_size(payload):
+        return payload[1].nbytes
+
+    @staticmethod
+    def decode(payload):
+        kind, data = payload
+        if kind == "jpeg":
+            return cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return data
+
+    def add(self, frame_count, frame):
+        self.add_payload(frame_count, self.compress(frame))
+
+    def add_payload(self, frame_count, payload):
+        with self.lock:
+            self.frames.append((frame_count, payload))
+            self.index[frame_count] = payload
+            self.total_bytes += self.payload_size(payload)
+            while self.frames and (len(self.frames) > self.max_frames or self.total_bytes > self.max_bytes):
+                old_count, old_payload = self.frames.popleft()
+                self.index.pop(old_count, None)
+                self.total_bytes -= self.payload_size(old_payload)
+
+    def get(self, frame_count):
+        with self.lock:
+            return self.index.get(frame_count)
+
+    def oldest_of_last(self, n):
+        """frame_count of the oldest of the n most recent frames (None if empty)."""
+        with self.lock:
+            if not self.frames:
+                return None
+            return self.frames[max(0, len(self.frames) - n)][0]
+
+    def window(self, first_frame, last_frame):
+        """Payloads with first_frame <= frame_count <= last_frame, oldest first."""
+        with self.lock:
+            return [(count, payload) for count, payload in self.frames if first_frame <= count <= last_frame]
+
+class EvidenceRecorder:
+    """
+    Selective evidence persistence. Every frame goes into the ring buffer, but only frames
+    flagged as candidate or confirmed incident evidence are written to disk, on a background
+    writer pool. Confirmed incidents can also get a short pre/post-event clip.
+    """
+
+    def __init__(self, snapshot_dir, camera_id=None, executor=None, buffer=None,
+                 clip_enabled=EVIDENCE_CLIP_ENABLED, clip_pre_seconds=EVIDENCE_CLIP_PRE_SECONDS,
+                 clip_post_seconds=EVIDENCE_CLIP_POST_SECONDS, clip_fps=FRAME_RATE):
+        self.snapshot_dir = snapshot_dir
+        self.camera_id = camera_id
+        self.memory = SharedMemory()
+        self.buffer = buffer or FrameRingBuffer()
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=EVIDENCE_WRITER_WORKERS, thread_name_prefix="evidence")
+        self.clip_enabled = clip_enabled
+        self.clip_fps = clip_fps
+        self.clip_pre_frames = int(clip_pre_seconds * clip_fps)
+        self.clip_post_frames = int(clip_post_seconds * clip_fps)
+
+        self.snapshots = {} # {frame_count: Future -> path or None}
+        self._open_clips = [] # incidents still collecting post-event frames
+        self._pending_updates = [] # Futures resolved once an incident record has its written file's path
+        self.snapshots_written = 0
+        self.clips_written = 0
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+    def snapshot_path(self, frame_count):
+        return os.path.join(self.snapshot_dir, f"frame_{frame_count}.jpg")
+
+    def add_frame(self, frame_count, frame=None, payload=None):
+        """Add the current frame (or an already compressed payload) to the ring buffer."""
+        if payload is None:
+            payload = self.buffer.compress(frame)
+        self.buffer.add_payload(frame_count, payload)
+
+        still_open = []
+        for clip in self._open_clips:
+            clip["last_frame"] = frame_count
+            clip["post_frames"] -= 1
+            if clip["post_frames"] <= 0:
+                self._submit_clip(clip)
+            else:
+                still_open.append(clip)
+        self._open_clips = still_open
+
+    def save_snapshot(self, frame_count):
+        """Schedule the buffered frame for writing (once). Returns the path it will be written to."""
+        if frame_count not in self.snapshots:
+            payload = self.buffer.get(frame_count)
+            if payload is None:
+                return None
+            if len(self.snapshots) >= self.buffer.max_frames:
+                self.snapshots = {count: future for count, future in self.snapshots.items() if not future.done()}
+            self.snapshots[frame_count] = self.executor.submit(self._write_snapshot, frame_count, payload)
+        return self.snapshot_path(frame_count)
+
+    def _write_snapshot(self, frame_count, payload):
+        path = self.snapshot_path(frame_count)
+        kind, data = payload
+        try:
+            if kind == "jpeg":
+                # Already JPEG encoded in RAM: persisting it is a plain write
+                with open(path, "wb") as f:
+                    f.write(data.tobytes())
+            elif not cv2.imwrite(path, data):
+                return None
+        except OSError:
+            return None
+        self.snapshots_written += 1
+        return path
+
+    def record_incident(self, incident_record, frame_count):
+        """Persist evidence for a confirmed incident and update the record once it is on disk."""
+        self.save_snapshot(frame_count)
+        snapshot_future = self.snapshots.get(frame_count)
+        if snapshot_future is not None:
+            updated = self._pending_update()
+            snapshot_future.add_done_callback(
+                lambda future: self._update_incident(incident_record, future, "snapshot_path", updated)
+            )
+
+        if self.clip_enabled:
+            clip = {
+                "incident": incident_record,
+                "first_frame": self.buffer.oldest_of_last(self.clip_pre_frames + 1),
+                "last_frame": frame_count,
+                "post_frames": self.clip_post_frames
+            }
+            if clip["post_frames"] <= 0:
+                self._submit_clip(clip)
+            else:
+                self._open_clips.append(clip)
+
+    def _submit_clip(self, clip):
+        frames = self.buffer.window(clip["first_frame"], clip["last_frame"])
+        future = self.executor.submit(self._write_clip, clip["incident"], frames)
+        updated = self._pending_update()
+        future.add_done_callback(
+            lambda f: self._update_incident(clip["incident"], f, "clip_path", updated)
+        )
+
+    def _pending_update(self):
+        self._pending_updates = [future for future in self._pending_updates if not future.done()]
+        updated = Future()
+        self._pending_updates.append(updated)
+        return updated
+
+    def _write_clip(self, incident_record, frames):
+        if not frames:
+            return None
+        path = os.path.join(self.snapshot_dir, f"incident_{incident_record['id']}_clip.mp4")
+        first = self.buffer.decode(frames[0][1])
+        height, width = first.shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), self.clip_fps, (width, height))
+        try:
+            for _, payload in frames:
+                image = self.buffer.decode(payload)
+                if image.shape[:2] != (height, width):
+                    image = cv2.resize(image, (width, height))
+                writer.write(np.ascontiguousarray(image))
+        finally:
+            writer.release()
+        self.clips_written += 1
+        return path
+
+    def _update_incident(self, incident_record, future, field, updated):
+        # Runs on the writer thread once the file is on disk (or failed to write)
+        try:
+            if future.exception() is not None:
+                print(f"[EVIDENCE] Failed to write {field} for incident {incident_record['id']}: {future.exception()}")
+                return
+            path = future.result()
+            if path:
+                self.memory.update_incident(incident_record["id"], **{field: path})
+        finally:
+            updated.set_result(None)
+
+    def close(self, wait=True):
+        """Write clips that are still waiting for post-event frames and stop an owned writer pool."""
+        for clip in self._open_clips:
+            self._submit_clip(clip)
+        self._open_clips = []
+        if self._owns_executor:
+            self.executor.shutdown(wait=wait)
+        if wait:
+            # A shared writer pool keeps running, so wait for this recorder's incident updates only
+            futures_wait(self._pending_updates)
@@ -0,0 +1,155 @@
+import queue
+import threading
+import numpy as np
+from config import FRAME_POOL_WAIT
+
+class FramePool:
+    """
+    Fixed set of reusable frame buffers. The decoder reads into an acquired buffer
+    (cap.retrieve(image=...)) and the last stage that touches the frame releases it,
+    so once the pool is warm decoding allocates nothing per frame.
+    Size it to the number of frames that can be in flight (queues + workers).
+    """
+
+    def __init__(self, size, wait=FRAME_POOL_WAIT):
+        self.size = max(1, size)
+        self.wait = wait
+        self.free = queue.SimpleQueue()
+        self.buffers = {} # {id(buffer): buffer} for every buffer owned by the pool
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.overflows = 0
+
+    def acquire(self):
+        """
+        A free buffer, or None when the caller should let the decoder allocate: while the
+        pool is still filling up, or (counted as an overflow) if nothing was released in time.
+        """
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.buffers) < self.size:
+                return None
+        try:
+            return self.free.get(timeout=self.wait)
+        except queue.Empty:
+            with self.lock:
+                self.overflows += 1
+            return None
+
+    def adopt(self, frame, replaces=None):
+        """
+        Take ownership of an array the decoder allocated itself (the pool is filling up,
+        or the source resolution changed and `replaces` no longer fits).
+        Overflow arrays beyond the pool size are left to the garbage collector.
+        """
+        with self.lock:
+            if replaces is not None:
+                self.buffers.pop(id(replaces), None)
+            if len(self.buffers) < self.size:
+                self.buffers[id(frame)] = frame
+                self.allocations += 1
+
+    def release(self, frame):
+        """Return a frame's buffer to the pool (arrays the pool does not own are ignored)."""
+        if frame is not None and self.buffers.get(id(frame)) is frame:
+            self.free.put(frame)
+
+    def get_stats(self):
+        with self.lock:
+            return {"size": self.size, "allocations": self.allocations, "overflows": self.overflows}
+
+class SharedFrameRing(FramePool):
+    """
+    FramePool whose buffers are fixed slots of one multiprocessing.shared_memory block,
+    so inference worker processes can read a frame from its slot offset instead of
+    receiving a pickled copy. The block is sized from the first frame; frames the decoder
+    allocated itself (pool exhausted, resolution change) are copied into a free slot.
+    """
+
+    def __init__(self, size, wait=FRAME_POOL_WAIT):
+        super().__init__(size, wait)
+        self.shm = None
+        self.slot_bytes = 0
+        self.shape = None
+        self.slots = {} # {id(buffer): slot index}
+        self.views = [] # slot index -> full-slot buffer
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def _allocate(self, frame):
+        from multiprocessing import shared_memory
+        with self.lock:
+            if self.shm is not None:
+                return
+            self.shape = frame.shape
+            self.slot_bytes = frame.nbytes
+            self.shm = shared_memory.SharedMemory(create=True, size=self.size * self.slot_bytes)
+            for slot in range(self.size):
+                view = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+                self.views.append(view)
+                self.buffers[id(view)] = view
+                self.slots[id(view)] = slot
+                self.free.put(view)
+            self.allocations = self.size
+
+    def acquire(self):
+        if self.shm is None:
+            return None
+        try:
+            return self.free.get(timeout=self.wait)
+        except queue.Empty:
+            with self.lock:
+                self.overflows += 1
+            return None
+
+    def adopt(self, frame, replaces=None):
+        # Ring slots never change size: a replaced slot goes back to the free list and the
+        # decoder's own array stays outside the ring (it is copied in when dispatched)
+        if self.shm is None:
+            self._allocate(frame)
+        self.release(replaces)
+
+    def slot(self, frame):
+        """Slot index of a ring-backed frame, or None if the frame lives outside the ring."""
+        if self.buffers.get(id(frame)) is frame:
+            return self.slots[id(frame)]
+        return None
+
+    def copy_in(self, frame, timeout=None):
+        """Copy an outside frame into a free slot. Returns the slot, or None if none freed up in time."""
+        if self.shm is None:
+            self._allocate(frame)
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of shape {frame.shape} does not fit the {self.shape} frame ring")
+        try:
+            view = self.free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        slot = self.slots[id(view)]
+        target = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(target, frame)
+        return slot
+
+    def release_slot(self, slot):
+        self.release(self.views[slot])
+
+    def close(self):
+        if self.shm is None:
+            return
+        # Views must be dropped before the mapping can close; frames still referenced
+        # elsewhere keep it alive until they are collected, unlink() frees it afterwards
+        self.buffers.clear()
+        self.slots.clear()
+        self.views = []
+        self.free = queue.SimpleQueue()
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        self.shm.unlink()
+        self.shm = None
@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+import threading
+
+class IncidentStore:
+    """
+    Long-term incident storage backed by SQLite.
+    Each incident is one row (full record as JSON plus indexed id/type/camera/timestamp
+    columns), so appends and updates touch a single row instead of rewriting the history,
+    and lookups go through indexes instead of scanning everything loaded in RAM.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path, legacy_json_path=None):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL") # Appends go to the write-ahead log
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        if legacy_json_path:
+            self.migrate_json(legacy_json_path)
+
+    def _create_schema(self):
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS incidents (
+                    id INTEGER PRIMARY KEY,
+                    type TEXT,
+                    camera_id TEXT,
+                    timestamp TEXT,
+                    data TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_incidents_type ON incidents(type)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_incidents_camera ON incidents(camera_id, timestamp)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_incidents_timestamp ON incidents(timestamp)")
+
+    def migrate_json(self, json_path):
+        """One-time import of the old incident_history.json list. Returns the number of imported incidents."""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return 0
+        imported = 0
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, "r") as f:
+                    incidents = json.load(f)
+            except Exception as e:
+                print(f"[MEMORY] Error reading legacy memory file {json_path}: {e}")
+                return 0
+            with self.lock, self.conn:
+                for incident in incidents:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO incidents (id, type, camera_id, timestamp, data) VALUES (?, ?, ?, ?, ?)",
+                        (incident.get("id"), incident.get("type"), incident.get("camera_id"),
+                         incident.get("timestamp"), json.dumps(incident))
+                    )
+                    imported += 1
+            print(f"[MEMORY] Migrated {imported} incidents from {json_path} to {self.db_path}")
+        with self.lock, self.conn:
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        return imported
+
+    def add(self, record):
+        """Append a new incident; assigns and returns its id."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO incidents (type, camera_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                (record.get("type"), record.get("camera_id"), record.get("timestamp"), "{}")
+            )
+            record["id"] = cursor.lastrowid
+            self.conn.execute("UPDATE incidents SET data = ? WHERE id = ?", (json.dumps(record), record["id"]))
+        return record["id"]
+
+    def save(self, record):
+        """Rewrite a single incident row from its in-memory record."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE incidents SET type = ?, camera_id = ?, timestamp = ?, data = ? WHERE id = ?",
+                (record.get("type"), record.get("camera_id"), record.get("timestamp"),
+                 json.dumps(record), record["id"])
+            )
+
+    def update(self, incident_id, **fields):
+        """Merge fields into a stored incident. Returns the updated record (None if unknown)."""
+        with self.lock:
+            record = self.get(incident_id)
+            if record is None:
+                return None
+            record.update(fields)
+            self.save(record)
+            return record
+
+    def _query(self, where="", params=()):
+        with self.lock:
+            rows = self.conn.execute(f"SELECT data FROM incidents {where} ORDER BY id", params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, incident_id):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM incidents WHERE id = ?", (incident_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def by_type(self, incident_type):
+        return self._query("WHERE type = ?", (incident_type,))
+
+    def by_camera(self, camera_id):
+        return self._query("WHERE camera_id = ?", (camera_id,))
+
+    def in_range(self, start, end, camera_id=None):
+        """Incidents with start <= timestamp <= end (ISO strings), optionally for one camera."""
+        if camera_id is None:
+            return self._query("WHERE timestamp BETWEEN ? AND ?", (start, end))
+        return self._query("WHERE camera_id = ? AND timestamp BETWEEN ? AND ?", (camera_id, start, end))
+
+    def all(self):
+        return self._query()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+
+    def compact(self):
+        """Fold the write-ahead log into the database file and reclaim free pages."""
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.execute("VACUUM")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,203 @@
+import os
+import queue
+import time
+import multiprocessing as mp
+import numpy as np
+from config import (
+    INFERENCE_WORKERS, INFERENCE_BATCH_SIZE, INFERENCE_THREADS, YOLO_MODEL_PATH, CONFIDENCE_THRESHOLD,
+    PREPROCESS_POOLED, INFERENCE_BACKEND, INFERENCE_INT8, CASCADE_ENABLED, TILING_ENABLED
+)
+
+def _attach(name, attached):
+    # Spawned workers share the parent's resource tracker, which unlinks the block once the parent does
+    from multiprocessing import shared_memory
+    shm = attached.get(name)
+    if shm is None:
+        shm = attached[name] = shared_memory.SharedMemory(name=name)
+    return shm
+
+def _worker_main(worker_id, tasks, results, tool_settings, batch_size, screen_classes=None, tiling=False,
+                 stub_latency=None):
+    """
+    Inference worker process: read (seq, ring name, offset, shape) tasks, run the detector
+    (the model cascade if screen_classes are given, the tiled detector zooming in on
+    them with tiling=True, or the model-free stub if stub_latency is set) on the frame
+    in shared memory and send back compact (boxes, confidences, class_ids) arrays.
+    """
+    from tools.yolo_tool import YOLOTool, CascadeYOLOTool, TiledYOLOTool, StubYOLOTool
+    if stub_latency is not None:
+        tool = StubYOLOTool(latency=stub_latency, conf_threshold=tool_settings["conf_threshold"])
+    elif screen_classes and tiling:
+        tool = TiledYOLOTool(screen_classes, **tool_settings)
+    elif screen_classes:
+        # The cascade picks its own screener and detector weights
+        settings = {key: value for key, value in tool_settings.items() if key != "model_path"}
+        tool = CascadeYOLOTool(screen_classes, **settings)
+    else:
+        tool = YOLOTool(**tool_settings)
+    attached = {}
+    try:
+        tool.warmup()
+        results.put(("ready", worker_id, tool.names))
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            batch = [task]
+            # Greedy micro-batching: take whatever is already queued, never wait for more
+            while len(batch) < batch_size:
+                try:
+                    task = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    tasks.put(None)
+                    break
+                batch.append(task)
+
+            try:
+                frames = []
+                for seq, name, offset, shape in batch:
+                    shm = _attach(name, attached)
+                    frames.append(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset))
+                start = time.perf_counter()
+                detections = tool.detect_batch(frames) if len(frames) > 1 else [tool.detect(frames[0])]
+                elapsed = time.perf_counter() - start
+                del frames
+                results.put(("result", [
+                    (seq, dets.boxes, dets.confidences, dets.class_ids)
+                    for (seq, *_), dets in zip(batch, detections)
+                ], elapsed))
+            except Exception as e:
+                results.put(("error", [seq for seq, *_ in batch], f"{type(e).__name__}: {e}"))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for shm in attached.values():
+            try:
+                shm.close()
+            except BufferError:
+                pass
+
+class InferenceWorkerPool:
+    """
+    N detector processes fed through a SharedFrameRing. submit() puts only the frame's slot
+    offset and shape on a queue; workers return compact detection arrays that
+    get_result() turns back into Detections. Results arrive in completion order.
+    """
+
+    def __init__(self, ring, workers=INFERENCE_WORKERS, batch_size=INFERENCE_BATCH_SIZE, threads=INFERENCE_THREADS,
+                 cascade=CASCADE_ENABLED, tiling=TILING_ENABLED, stub_latency=None):
+        self.ring = ring
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        # Split the cores between workers unless a thread count is configured
+        threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.tool_settings = {
+            "model_path": YOLO_MODEL_PATH,
+            "conf_threshold": CONFIDENCE_THRESHOLD,
+            "pooled_preprocess": PREPROCESS_POOLED,
+            "backend": INFERENCE_BACKEND,
+            "int8": INFERENCE_INT8,
+            "threads": threads,
+        }
+        if cascade and tiling:
+            raise ValueError("CASCADE_ENABLED and TILING_ENABLED cannot be combined")
+        self.tiling = tiling
+        if cascade or tiling:
+            from agents.aggregator import ConfidenceAggregatorAgent
+            self.screen_classes = sorted(ConfidenceAggregatorAgent.ANOMALY_MAPPING)
+        else:
+            self.screen_classes = None
+        # Seconds per call for workers running StubYOLOTool instead of a model (None: real detector)
+        self.stub_latency = stub_latency
+        # spawn: forked copies of a process that already holds torch/OpenMP state can deadlock
+        self.context = mp.get_context("spawn")
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.processes = []
+        self.names = None
+        self.ready = 0
+
+    @property
+    def capacity(self):
+        """Frames that can usefully be in flight: a batch being run and one queued per worker."""
+        return 2 * self.workers * self.batch_size
+
+    def start(self):
+        if self.tool_settings["backend"] != "torch" and self.stub_latency is None:
+            # Export/quantize once here instead of racing in every worker
+            from tools.inference_backends import create_backend
+            create_backend(self.tool_settings["backend"], YOLO_MODEL_PATH, int8=self.tool_settings["int8"]).export()
+        for worker_id in range(self.workers):
+            process = self.context.Process(
+                target=_worker_main, name=f"InferenceWorker-{worker_id}",
+                args=(worker_id, self.tasks, self.results, self.tool_settings, self.batch_size, self.screen_classes,
+                      self.tiling, self.stub_latency),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        print(f"[OK] Started {self.workers} inference worker process(es)")
+        return self
+
+    def alive(self):
+        return any(process.is_alive() for process in self.processes)
+
+    def submit(self, seq, frame, timeout=None):
+        """
+        Queue a frame. Ring-backed frames are sent by slot; others are copied into a free slot
+        first. Returns the slot to free once the result is in (None for ring-backed frames),
+        or False if no slot freed up within timeout.
+        """
+        slot = self.ring.slot(frame)
+        copied = None
+        if slot is None:
+            slot = copied = self.ring.copy_in(frame, timeout=timeout)
+            if slot is None:
+                return False
+        self.tasks.put((seq, self.ring.name, slot * self.ring.slot_bytes, frame.shape))
+        return copied
+
+    def get_result(self, timeout=None):
+        """
+        Next (elapsed, [(seq, Detections)]) batch from any worker, or None on timeout.
+        Raises RuntimeError if a worker failed or every worker has exited.
+        """
+        from tools.detections import Detections
+        while True:
+            try:
+                message = self.results.get(timeout=timeout)
+            except queue.Empty:
+                if not self.alive():
+                    raise RuntimeError("All inference workers have exited")
+                return None
+            kind = message[0]
+            if kind == "ready":
+                self.ready += 1
+                if self.names is None:
+                    # One shared names dict, as with an in-process detector
+                    self.names = message[2]
+                continue
+            if kind == "error":
+                raise RuntimeError(f"Inference worker failed on frames {message[1]}: {message[2]}")
+            _, items, elapsed = message
+            return elapsed, [
+                (seq, Detections(boxes, confidences, class_ids, self.names))
+                for seq, boxes, confidences, class_ids in items
+            ]
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        # Drop unread messages so the queues' feeder threads can exit
+        for q in (self.tasks, self.results):
+            q.cancel_join_thread()
+            q.close()
+        self.ring.close()
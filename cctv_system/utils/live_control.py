@@ -0,0 +1,77 @@
+import time
+from utils.metrics import Metrics
+from config import LIVE_LATENCY_SLO, LIVE_INPUT_SIZES, LIVE_ADJUST_INTERVAL
+
+class LatencyController:
+    """
+    Keeps the end-to-end latency of a live source (capture -> aggregated) under an SLO.
+    The reader already sheds load by always handing out the freshest frame; on top of that
+    the detector input size steps down LIVE_INPUT_SIZES while the smoothed latency is over
+    the SLO, and back up once it has stayed under half of it.
+    """
+
+    SMOOTHING = 0.2 # Weight of the newest frame in the moving average
+
+    def __init__(self, yolo_tools, slo=LIVE_LATENCY_SLO, input_sizes=LIVE_INPUT_SIZES,
+                 adjust_interval=LIVE_ADJUST_INTERVAL):
+        self.yolo_tools = list(yolo_tools)
+        self.slo = slo
+        self.input_sizes = list(input_sizes)
+        self.adjust_interval = adjust_interval
+        self.level = 0
+        self.smoothed = None
+        self.frames_since_change = 0
+        self.frames = 0
+        self.over_slo = 0
+        self.changes = 0
+        self.metrics = Metrics()
+        self.metrics.set_gauge("inference_input_size", self.input_sizes[0])
+
+    @property
+    def input_size(self):
+        return self.input_sizes[self.level]
+
+    def observe(self, captured):
+        """Record one aggregated frame captured at time.monotonic() value `captured`."""
+        if captured is None:
+            return
+        latency = time.monotonic() - captured
+        self.frames += 1
+        self.metrics.observe("e2e_latency_seconds", latency)
+        if latency > self.slo:
+            self.over_slo += 1
+            self.metrics.inc("slo_violations")
+        if self.frames == 1:
+            return # The first frame also waits for the model to load
+        self.smoothed = latency if self.smoothed is None else (
+            (1 - self.SMOOTHING) * self.smoothed + self.SMOOTHING * latency)
+
+        self.frames_since_change += 1
+        if self.frames_since_change < self.adjust_interval or not self.yolo_tools:
+            return
+        if self.smoothed > self.slo and self.level < len(self.input_sizes) - 1:
+            self._set_level(self.level + 1)
+        elif self.smoothed < 0.5 * self.slo and self.level > 0:
+            self._set_level(self.level - 1)
+
+    def _set_level(self, level):
+        previous = self.input_size
+        self.level = level
+        self.frames_since_change = 0
+        self.changes += 1
+        for tool in self.yolo_tools:
+            tool.set_input_size(self.input_size)
+        self.metrics.set_gauge("inference_input_size", self.input_size)
+        print(f"[LIVE] Detector input {previous} -> {self.input_size} "
+              f"(latency {self.smoothed:.2f}s, SLO {self.slo:.2f}s)")
+
+    def get_stats(self):
+        latency = self.metrics.histogram("e2e_latency_seconds").summary()
+        return {
+            "frames": self.frames,
+            "over_slo": self.over_slo,
+            "latency_p50": round(latency["p50"], 3),
+            "latency_p95": round(latency["p95"], 3),
+            "input_size": self.input_size,
+            "input_size_changes": self.changes,
+        }
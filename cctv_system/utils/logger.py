@@ -1,35 +1,142 @@
+import atexit
 import logging
+import logging.handlers
 import json
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+from config import LOG_DIR, LOG_ASYNC, LOG_SINGLE_FILE, LOG_SAMPLE_INTERVAL
+
+_encode_string = json.JSONEncoder().encode
 
 class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line. The timestamp prefix is formatted once per second and the
+    line is assembled directly instead of building and dumping a dict for every record.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._cached_second = None
+        self._cached_prefix = ""
+
+    def _timestamp(self, created):
+        second = int(created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(second))
+        return f"{self._cached_prefix}.{int((created - second) * 1000000):06d}"
+
     def format(self, record):
-        log_record = {
-            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
-            "level": record.levelname,
-            "logger": record.name,
-            "message": record.getMessage(),
-        }
+        line = (
+            f'{{"timestamp": "{self._timestamp(record.created)}", '
+            f'"level": "{record.levelname}", '
+            f'"logger": {_encode_string(record.name)}, '
+            f'"message": {_encode_string(record.getMessage())}'
+        )
         if record.exc_info:
-            log_record["exception"] = self.formatException(record.exc_info)
-        return json.dumps(log_record)
+            line += f', "exception": {_encode_string(self.formatException(record.exc_info))}'
+        return line + "}"
+
+class LogSampler:
+    """Lets each message key through at most once per interval and counts what it dropped."""
+
+    def __init__(self, interval=LOG_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._last = {} # {key: (last_emit_time, suppressed_count)}
+
+    def allow(self, key):
+        """Returns (allowed, suppressed_since_last_allowed)."""
+        if not self.interval:
+            return True, 0
+        now = time.monotonic()
+        last, suppressed = self._last.get(key, (None, 0))
+        if last is not None and now - last < self.interval:
+            self._last[key] = (last, suppressed + 1)
+            return False, suppressed
+        self._last[key] = (now, 0)
+        return True, suppressed
+
+_console_handler = None
+_file_handlers = {} # {path: FileHandler}, shared by every logger writing that file
+_listeners = {} # {path: (queue, QueueListener)}
+_queued_loggers = {} # {logger name: (path, QueueHandler)}
+_handlers_lock = threading.Lock()
+
+def _get_console_handler():
+    global _console_handler
+    if _console_handler is None:
+        _console_handler = logging.StreamHandler()
+        _console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return _console_handler
+
+def _get_file_handler(log_file):
+    handler = _file_handlers.get(log_file)
+    if handler is None:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(JSONFormatter())
+        _file_handlers[log_file] = handler
+    return handler
+
+def _direct_handlers(log_file):
+    handlers = [_get_console_handler()]
+    if log_file:
+        handlers.append(_get_file_handler(log_file))
+    return handlers
+
+def _get_queue_handler(log_file):
+    """Queue handler whose records are formatted and written by a background listener."""
+    entry = _listeners.get(log_file)
+    if entry is None:
+        record_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(record_queue, *_direct_handlers(log_file), respect_handler_level=True)
+        listener.start()
+        entry = _listeners[log_file] = (record_queue, listener)
+    return logging.handlers.QueueHandler(entry[0])
+
+def shutdown_logging():
+    """
+    Flush queued records and stop the background listeners. Loggers fall back to writing
+    directly, so records logged afterwards (e.g. by other atexit hooks) are not lost.
+    """
+    with _handlers_lock:
+        for _, listener in _listeners.values():
+            listener.stop()
+        _listeners.clear()
+        for name, (log_file, queue_handler) in _queued_loggers.items():
+            logger = logging.getLogger(name)
+            logger.removeHandler(queue_handler)
+            for handler in _direct_handlers(log_file):
+                logger.addHandler(handler)
+        _queued_loggers.clear()
+
+atexit.register(shutdown_logging)
 
 def setup_logger(name, log_file=None, level=logging.INFO):
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    
+    # Some libraries (e.g. the quantization toolkits) configure the root logger; don't print twice
+    logger.propagate = False
+
+    if log_file and LOG_SINGLE_FILE:
+        # One shared JSON log instead of one open file per agent
+        log_file = os.path.join(LOG_DIR, "system.log")
+
     if not logger.handlers:
-        # Console Handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-        logger.addHandler(console_handler)
-        
-        # File Handler (JSON)
-        if log_file:
-            os.makedirs(os.path.dirname(log_file), exist_ok=True)
-            file_handler = logging.FileHandler(log_file)
-            file_handler.setFormatter(JSONFormatter())
-            logger.addHandler(file_handler)
-            
+        with _handlers_lock:
+            if LOG_ASYNC:
+                # The calling (frame) thread only enqueues; formatting and I/O happen on the listener
+                handler = _get_queue_handler(log_file)
+                logger.addHandler(handler)
+                _queued_loggers[name] = (log_file, handler)
+            else:
+                # Console Handler
+                logger.addHandler(_get_console_handler())
+
+                # File Handler (JSON)
+                if log_file:
+                    logger.addHandler(_get_file_handler(log_file))
+
     return logger
@@ -1,11 +1,13 @@
-import json
-import os
+import threading
 from collections import deque
 from datetime import datetime
+from utils.incident_store import IncidentStore
+from config import CAMERAS, INCIDENT_DB_FILE
 
 class SharedMemory:
     _instance = None
-    MEMORY_FILE = "data/incident_history.json"
+    MEMORY_FILE = "data/incident_history.json" # Legacy format, migrated into DB_FILE
+    DB_FILE = INCIDENT_DB_FILE
 
     def __new__(cls):
         if cls._instance is None:
@@ -14,40 +16,52 @@ class SharedMemory:
         return cls._instance
 
     def init(self):
+        self.lock = threading.RLock()
         self.short_term_memory = deque(maxlen=3) # Rolling window of last 3 frames
-        self.long_term_memory = self._load_long_term_memory() # Load from file if exists
-        self.session_state = {
-            "camera_id": "CAM-001",
-            "location": "Main Entrance",
-            "frame_count": 0,
-            "incident_confirmed": False,
-            "current_incident": None
-        }
+        self.store = self._open_store() # Indexed long-term memory, nothing loaded up front
+        self.sessions = {} # {camera_id: session_state}
+        for camera in CAMERAS:
+            self.register_camera(camera["camera_id"], camera.get("location", "Unknown"))
+        self.default_camera_id = CAMERAS[0]["camera_id"]
+        # The first configured camera's session, kept for single-stream callers
+        self.session_state = self.sessions[self.default_camera_id]
+
+    def register_camera(self, camera_id, location="Unknown"):
+        """Create the session state for a camera (no-op if it already exists)."""
+        with self.lock:
+            if camera_id not in self.sessions:
+                self.sessions[camera_id] = {
+                    "camera_id": camera_id,
+                    "location": location,
+                    "frame_count": 0,
+                    "incident_confirmed": False,
+                    "current_incident": None
+                }
+            return self.sessions[camera_id]
+
+    def get_session(self, camera_id=None):
+        """Get the session state of a camera (the default camera if None)."""
+        if camera_id is None:
+            camera_id = self.default_camera_id
+        session = self.sessions.get(camera_id)
+        if session is None:
+            session = self.register_camera(camera_id)
+        return session
     
-    def _load_long_term_memory(self):
-        """Load long-term memory from file if it exists."""
-        if os.path.exists(self.MEMORY_FILE):
-            try:
-                with open(self.MEMORY_FILE, "r") as f:
-                    data = json.load(f)
-                    print(f"[MEMORY] Loaded {len(data)} past incidents from {self.MEMORY_FILE}")
-                    return data
-            except Exception as e:
-                print(f"[MEMORY] Error loading memory file: {e}")
-                return []
+    def _open_store(self):
+        """Open the incident store, migrating the old JSON history on first use."""
+        store = IncidentStore(self.DB_FILE, legacy_json_path=self.MEMORY_FILE)
+        count = store.count()
+        if count:
+            print(f"[MEMORY] {count} past incidents available in {self.DB_FILE}")
         else:
-            print(f"[MEMORY] No existing memory file found, starting fresh")
-            return []
-    
-    def _save_long_term_memory(self):
-        """Save long-term memory to file."""
-        try:
-            os.makedirs(os.path.dirname(self.MEMORY_FILE), exist_ok=True)
-            with open(self.MEMORY_FILE, "w") as f:
-                json.dump(self.long_term_memory, f, indent=2)
-            print(f"[MEMORY] Saved {len(self.long_term_memory)} incidents to {self.MEMORY_FILE}")
-        except Exception as e:
-            print(f"[MEMORY] Error saving memory file: {e}")
+            print(f"[MEMORY] No existing incidents found, starting fresh")
+        return store
+
+    @property
+    def long_term_memory(self):
+        """All stored incidents (loaded on demand; prefer the indexed getters)."""
+        return self.store.all()
     
     def add_frame_data(self, frame_data):
         """
@@ -62,56 +76,99 @@ class SharedMemory:
     def get_recent_frames(self):
         return list(self.short_term_memory)
 
-    def confirm_incident(self, incident_type, confidence, snapshot_path):
-        self.session_state["incident_confirmed"] = True
-        incident_record = {
-            "id": len(self.long_term_memory) + 1,
-            "type": incident_type,
-            "confidence": confidence,
-            "timestamp": datetime.now().isoformat(),
-            "camera_id": self.session_state["camera_id"],
-            "location": self.session_state["location"],
-            "snapshot_path": snapshot_path,
-            "actions": []
-        }
-        self.session_state["current_incident"] = incident_record
-        self.long_term_memory.append(incident_record)
-        
-        # Auto-save to file after each incident
-        self._save_long_term_memory()
-        
-        return incident_record
-
-    def log_action(self, action):
-        if self.session_state["current_incident"]:
-            self.session_state["current_incident"]["actions"].append({
-                "action": action,
-                "timestamp": datetime.now().isoformat()
-            })
-            # Update the incident in long-term memory
-            for incident in self.long_term_memory:
-                if incident["id"] == self.session_state["current_incident"]["id"]:
-                    incident["actions"] = self.session_state["current_incident"]["actions"]
-            # Save after action is logged
-            self._save_long_term_memory()
-
-    def reset_session(self):
-        self.session_state["frame_count"] = 0
-        self.session_state["incident_confirmed"] = False
-        self.session_state["current_incident"] = None
+    def confirm_incident(self, incident_type, confidence, snapshot_path, camera_id=None):
+        with self.lock:
+            session = self.get_session(camera_id)
+            session["incident_confirmed"] = True
+            incident_record = {
+                "id": None,
+                "type": incident_type,
+                "confidence": confidence,
+                "timestamp": datetime.now().isoformat(),
+                "camera_id": session["camera_id"],
+                "location": session["location"],
+                "snapshot_path": snapshot_path,
+                "actions": []
+            }
+            session["current_incident"] = incident_record
+
+            # Appending assigns the id; nothing else in the history is rewritten
+            self.store.add(incident_record)
+            print(f"[MEMORY] Saved incident {incident_record['id']} to {self.DB_FILE}")
+            
+            return incident_record
+
+    def add_incident(self, incident_record):
+        """Store an incident confirmed elsewhere (e.g. by a cluster worker); assigns its id."""
+        with self.lock:
+            self.store.add(incident_record)
+            print(f"[MEMORY] Saved incident {incident_record['id']} to {self.DB_FILE}")
+            return incident_record
+
+    def log_action(self, action, camera_id=None):
+        with self.lock:
+            session = self.get_session(camera_id)
+            if session["current_incident"]:
+                session["current_incident"]["actions"].append({
+                    "action": action,
+                    "timestamp": datetime.now().isoformat()
+                })
+                # Rewrite only this incident's row
+                self.store.save(session["current_incident"])
+
+    def log_actions(self, incident_id, actions):
+        """Append several action records ({"action", "timestamp", ...}) to an incident in one write."""
+        with self.lock:
+            for session in self.sessions.values():
+                current = session["current_incident"]
+                if current is not None and current["id"] == incident_id:
+                    current["actions"].extend(actions)
+                    self.store.save(current)
+                    return current
+            record = self.store.get(incident_id)
+            if record is not None:
+                record["actions"].extend(actions)
+                self.store.save(record)
+            return record
+
+    def update_incident(self, incident_id, **fields):
+        """Update fields of a stored incident (e.g. evidence paths written in the background)."""
+        with self.lock:
+            for session in self.sessions.values():
+                current = session["current_incident"]
+                if current is not None and current["id"] == incident_id:
+                    current.update(fields)
+                    self.store.save(current)
+                    return current
+            return self.store.update(incident_id, **fields)
+
+    def reset_session(self, camera_id=None):
+        session = self.get_session(camera_id)
+        session["frame_count"] = 0
+        session["incident_confirmed"] = False
+        session["current_incident"] = None
         self.short_term_memory.clear()
+
+    def reset_all_sessions(self):
+        for camera_id in list(self.sessions):
+            self.reset_session(camera_id)
     
     def get_all_incidents(self):
         """Get all incidents from long-term memory."""
-        return self.long_term_memory
+        return self.store.all()
     
     def get_incident_by_id(self, incident_id):
         """Get a specific incident by ID."""
-        for incident in self.long_term_memory:
-            if incident["id"] == incident_id:
-                return incident
-        return None
+        return self.store.get(incident_id)
     
     def get_incidents_by_type(self, incident_type):
         """Get all incidents of a specific type."""
-        return [inc for inc in self.long_term_memory if inc["type"] == incident_type]
+        return self.store.by_type(incident_type)
+
+    def get_incidents_by_camera(self, camera_id):
+        """Get all incidents recorded by a camera."""
+        return self.store.by_camera(camera_id)
+
+    def get_incidents_between(self, start, end, camera_id=None):
+        """Get incidents between two ISO timestamps (inclusive), optionally for one camera."""
+        return self.store.in_range(start, end, camera_id)
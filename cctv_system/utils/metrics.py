@@ -0,0 +1,281 @@
+import bisect
+import cProfile
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import (
+    METRICS_FILE, METRICS_FLUSH_INTERVAL, METRICS_HTTP_PORT,
+    PROFILE_START_FRAME, PROFILE_FRAMES, PROFILE_OUTPUT
+)
+
+# 0.5 ms .. ~16 s, doubling; anything slower lands in +Inf
+LATENCY_BUCKETS = tuple(0.0005 * 2 ** i for i in range(16))
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Histogram:
+    """Fixed-bucket histogram: observe() is one bisect and a few additions, no samples are kept."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside the bucket that contains it."""
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+class Metrics:
+    """
+    Process-wide metrics registry (singleton): counters, gauges and latency histograms,
+    keyed by name plus labels, rendered in the Prometheus text format.
+    """
+    _instance = None
+    PREFIX = "cctv_"
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(Metrics, cls).__new__(cls)
+            cls._instance.init()
+        return cls._instance
+
+    def init(self):
+        self.lock = threading.Lock()
+        self.counters = {} # {(name, labels): value}
+        self.gauges = {} # {(name, labels): value or callable}
+        # Entries are never replaced: callers (e.g. the agents' run() timers) may keep a Histogram
+        self.histograms = {} # {(name, labels): Histogram}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge; value may be a callable evaluated at export time (e.g. a queue's qsize)."""
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def remove_gauge(self, name, **labels):
+        with self.lock:
+            self.gauges.pop((name, tuple(sorted(labels.items()))), None)
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def timer(self, name, **labels):
+        return _Timer(self.histogram(name, **labels))
+
+    def summary(self, name):
+        """{label_text: {count, mean, p50, p95, p99}} for every histogram with this name."""
+        with self.lock:
+            histograms = [(labels, h) for (n, labels), h in self.histograms.items() if n == name]
+        return {_label_text(labels): histogram.summary() for labels, histogram in histograms}
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items(), key=lambda item: item[0])
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.PREFIX}{name}_total"
+            declare(metric, "counter")
+            lines.append(f"{metric}{_label_text(labels)} {value}")
+
+        for (name, labels), value in gauges:
+            metric = f"{self.PREFIX}{name}"
+            try:
+                value = value() if callable(value) else value
+            except Exception:
+                continue
+            declare(metric, "gauge")
+            lines.append(f"{metric}{_label_text(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            metric = f"{self.PREFIX}{name}"
+            declare(metric, "histogram")
+            with histogram.lock:
+                counts = list(histogram.counts)
+                total, total_sum = histogram.count, histogram.sum
+            cumulative = 0
+            bounds = [f"{bound:g}" for bound in histogram.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_sum{_label_text(labels)} {total_sum}")
+            lines.append(f"{metric}_count{_label_text(labels)} {total}")
+            # Pre-computed percentiles for readers without a Prometheus server
+            for q in ("0.5", "0.95", "0.99"):
+                quantile_metric = f"{metric}_quantile"
+                declare(quantile_metric, "gauge")
+                lines.append(f"{quantile_metric}{_label_text(labels + (('quantile', q),))} {histogram.quantile(float(q)):.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class MetricsExporter:
+    """Flushes the registry to a file every interval and optionally serves /metrics over HTTP."""
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_FLUSH_INTERVAL, http_port=METRICS_HTTP_PORT):
+        self.metrics = Metrics()
+        self.path = path
+        self.interval = interval
+        self.http_port = http_port
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.server = None
+
+    def start(self):
+        if self.path and self.interval:
+            self.thread = threading.Thread(target=self._flush_loop, daemon=True, name="metrics")
+            self.thread.start()
+        if self.http_port:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip("/") not in ("", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.http_port), Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics-http").start()
+        return self
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.metrics.write(self.path)
+            except Exception as e:
+                print(f"[WARN] Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        """Stop the exporter and write the final metrics file."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.path:
+            self.metrics.write(self.path)
+
+class FrameProfiler:
+    """
+    Runs cProfile over a window of frames (calls to on_frame) and dumps the stats:
+    a .prof file for snakeviz/pstats and a text summary next to it.
+    cProfile only sees the thread that calls on_frame.
+    """
+
+    def __init__(self, start_frame=PROFILE_START_FRAME, frames=PROFILE_FRAMES, output=PROFILE_OUTPUT):
+        self.start_frame = start_frame
+        self.end_frame = start_frame + frames
+        self.output = output
+        self.frames_seen = 0
+        self.profiler = None
+        self.done = False
+
+    def on_frame(self):
+        if self.done:
+            return
+        self.frames_seen += 1
+        if self.profiler is None and self.frames_seen >= self.start_frame:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profiler is not None and self.frames_seen >= self.end_frame:
+            self.dump()
+
+    def dump(self):
+        """Stop profiling and write the results (also called at shutdown for a partial window)."""
+        if self.done or self.profiler is None:
+            return None
+        self.profiler.disable()
+        self.done = True
+        os.makedirs(os.path.dirname(self.output) or ".", exist_ok=True)
+        self.profiler.dump_stats(self.output)
+        with open(os.path.splitext(self.output)[0] + ".txt", "w") as f:
+            stats = pstats.Stats(self.profiler, stream=f)
+            stats.sort_stats("cumulative").print_stats(40)
+        return self.output
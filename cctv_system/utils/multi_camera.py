@@ -0,0 +1,291 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from agents.frame_extractor import VideoFrameExtractorAgent
+from agents.aggregator import ConfidenceAggregatorAgent
+from agents.batch_aggregator import BatchAggregatorAgent
+from utils.memory import SharedMemory
+from utils.evidence import EvidenceRecorder
+from utils.metrics import Metrics
+from utils.frame_pool import FramePool
+from config import (
+    EVIDENCE_SELECTIVE, EVIDENCE_WRITER_WORKERS, FRAME_POOL_ENABLED, LIVE_MAX_FRAME_GAP, MULTI_CAMERA_BATCH_AGGREGATION
+)
+
+_END = object()
+
+class CameraStream:
+    """Per-camera state: decoder thread, bounded frame queue, aggregator and session."""
+
+    def __init__(self, camera, queue_size, snapshot_dir, evidence_executor=None):
+        self.camera_id = camera["camera_id"]
+        self.location = camera.get("location", "Unknown")
+        self.source = camera["source"]
+        self.snapshot_dir = os.path.join(snapshot_dir, self.camera_id)
+        # Queued frames, one in the current batch and one being decoded
+        self.frame_pool = FramePool(queue_size + 2) if FRAME_POOL_ENABLED else None
+        self.extractor = VideoFrameExtractorAgent(self.source, self.frame_pool)
+        self.evidence = None
+        if evidence_executor is not None:
+            self.evidence = EvidenceRecorder(self.snapshot_dir, self.camera_id, executor=evidence_executor)
+        self.aggregator = ConfidenceAggregatorAgent(self.camera_id, self.evidence)
+        if self.extractor.is_live():
+            # Live streams skip stale frames, so large frame gaps are expected
+            self.aggregator.max_frame_gap = LIVE_MAX_FRAME_GAP
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.finished = False
+        self.removed = False # Stopped by remove_camera() rather than by an incident or the end of the source
+        self.frames_processed = 0
+        self.thread = None
+
+class MultiCameraRuntime:
+    """
+    Serves many camera sources from one process with a single shared analyzer.
+    Each camera is decoded on its own thread into a small bounded queue; the scheduler
+    builds inference batches round-robin, taking at most one frame per camera per batch,
+    so a fast or busy camera cannot starve the others.
+
+    A persistent runtime keeps serving (cameras can be added and removed while it runs)
+    until stop(); finished cameras are closed as they finish and reported to on_stream_closed.
+    on_incident(stream, incident), if set, replaces the responder/reporter handling.
+    With batch_aggregation, each inference batch is aggregated in one BatchAggregatorAgent
+    tick instead of by every camera's own aggregator.
+    """
+
+    def __init__(self, cameras, analyzer, responder, reporter, snapshot_dir,
+                 queue_size=2, batch_size=8, logger=None, on_first_frame=None,
+                 on_incident=None, on_stream_closed=None, persistent=False,
+                 batch_aggregation=MULTI_CAMERA_BATCH_AGGREGATION):
+        self.memory = SharedMemory()
+        self.analyzer = analyzer
+        self.responder = responder
+        self.reporter = reporter
+        self.snapshot_dir = snapshot_dir
+        self.batch_size = max(1, batch_size)
+        self.logger = logger
+        self.on_first_frame = on_first_frame
+        self.on_incident = on_incident
+        self.on_stream_closed = on_stream_closed
+        self.persistent = persistent
+        self.queue_size = queue_size
+
+        # One writer pool shared by every camera's evidence recorder
+        self.evidence_executor = None
+        if EVIDENCE_SELECTIVE:
+            self.evidence_executor = ThreadPoolExecutor(max_workers=EVIDENCE_WRITER_WORKERS, thread_name_prefix="evidence")
+
+        self.batch_aggregator = BatchAggregatorAgent() if batch_aggregation else None
+
+        self.metrics = Metrics()
+        self.lock = threading.Lock()
+        self.running = False
+        self._stopping = threading.Event()
+        self.streams = [] # Replaced, never mutated in place, so the scheduler can iterate without the lock
+        for camera in cameras:
+            self.add_camera(camera)
+        self._frames_ready = threading.Event()
+        self._next_stream = 0
+
+    def add_camera(self, camera):
+        """Start serving a camera (immediately if the runtime is already running)."""
+        self.memory.register_camera(camera["camera_id"], camera.get("location", "Unknown"))
+        self.analyzer.set_roi(camera["camera_id"], camera.get("roi"))
+        stream = CameraStream(camera, self.queue_size, self.snapshot_dir, self.evidence_executor)
+        with self.lock:
+            if self.batch_aggregator is not None:
+                self.batch_aggregator.add_camera(stream.camera_id, stream.evidence, stream.aggregator.max_frame_gap)
+            self.streams = self.streams + [stream]
+            if self.running:
+                self._start_stream(stream)
+        return stream
+
+    def remove_camera(self, camera_id):
+        """Stop serving a camera; it is closed once its decoder has wound down."""
+        for stream in self.streams:
+            if stream.camera_id == camera_id and not stream.stop_event.is_set():
+                stream.removed = True
+                stream.stop_event.set()
+
+    def set_cameras(self, cameras):
+        """Serve exactly these cameras: add the new ones, remove the ones no longer listed."""
+        wanted = {camera["camera_id"] for camera in cameras}
+        serving = {stream.camera_id for stream in self.streams if not stream.stop_event.is_set()}
+        for camera_id in serving - wanted:
+            self.remove_camera(camera_id)
+        for camera in cameras:
+            if camera["camera_id"] not in serving:
+                self.add_camera(camera)
+
+    def _start_stream(self, stream):
+        os.makedirs(stream.snapshot_dir, exist_ok=True)
+        self.memory.reset_session(stream.camera_id)
+        self.metrics.set_gauge("queue_depth", stream.frames.qsize, queue=stream.camera_id)
+        stream.thread = threading.Thread(target=self._decode, args=(stream,), daemon=True)
+        stream.thread.start()
+
+    def _close_stream(self, stream):
+        # Unblock a decoder that is waiting on a full queue
+        while stream.thread.is_alive():
+            try:
+                stream.frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        stream.thread.join()
+        if stream.evidence is not None:
+            stream.evidence.close()
+        self.metrics.remove_gauge("queue_depth", queue=stream.camera_id)
+        self._log(f"[{stream.camera_id}] Processed {stream.frames_processed} frame(s)")
+        if self.on_stream_closed is not None:
+            self.on_stream_closed(stream)
+
+    def _reap(self):
+        """Close and drop finished streams (persistent mode)."""
+        finished = [stream for stream in self.streams if stream.finished]
+        if not finished:
+            return
+        with self.lock:
+            self.streams = [stream for stream in self.streams if not stream.finished]
+        for stream in finished:
+            self._close_stream(stream)
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def _decode(self, stream):
+        frames = stream.extractor.run()
+        try:
+            for frame_count, frame in frames:
+                # Bounded queue: a camera that is ahead of inference waits here
+                while not stream.stop_event.is_set():
+                    try:
+                        stream.frames.put((frame_count, frame), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                self._frames_ready.set()
+                if stream.stop_event.is_set():
+                    break
+        except Exception as e:
+            self._log(f"[{stream.camera_id}] Decoder failed: {e}", "error")
+        finally:
+            frames.close()
+            stream.frames.put(_END)
+            self._frames_ready.set()
+
+    def _next_batch(self):
+        """Take at most one frame from each camera, starting after the camera served first last time."""
+        batch = []
+        streams = self.streams
+        count = len(streams)
+        for offset in range(count):
+            if len(batch) >= self.batch_size:
+                break
+            stream = streams[(self._next_stream + offset) % count]
+            if stream.finished:
+                continue
+            try:
+                item = stream.frames.get_nowait()
+            except queue.Empty:
+                continue
+            if item is _END:
+                stream.finished = True
+                continue
+            if stream.stop_event.is_set():
+                stream.extractor.release(item[1])
+                continue
+            batch.append((stream, item[0], item[1]))
+        self._next_stream = (self._next_stream + 1) % max(1, count)
+        return batch
+
+    def _record_frame(self, stream, frame_count, frame):
+        """Keep the frame as (potential) evidence and hand it back to the decoder. Returns the snapshot path, if written."""
+        stream.frames_processed += 1
+        with self.metrics.timer("stage_seconds", stage="snapshot"):
+            if stream.evidence is not None:
+                stream.evidence.add_frame(frame_count, frame)
+                snapshot_path = None
+            else:
+                snapshot_path = os.path.join(stream.snapshot_dir, f"frame_{frame_count}.jpg")
+                cv2.imwrite(snapshot_path, frame)
+        stream.extractor.release(frame)
+        return snapshot_path
+
+    def _aggregate(self, ticks):
+        """ticks: [(stream, detections, frame_count, snapshot_path)]. Returns [(stream, incident)]."""
+        if self.batch_aggregator is not None:
+            streams = {stream.camera_id: stream for stream, *_ in ticks}
+            with self.lock:
+                incidents = self.batch_aggregator.run([(stream.camera_id, *rest) for stream, *rest in ticks])
+            return [(streams[incident["camera_id"]], incident) for incident in incidents]
+        confirmed = []
+        for stream, detections, frame_count, snapshot_path in ticks:
+            incidents = stream.aggregator.run(detections, frame_count, snapshot_path)
+            if incidents:
+                confirmed.append((stream, incidents[0]))
+        return confirmed
+
+    def _handle_incident(self, stream, incident):
+        if self.on_incident is not None:
+            self.on_incident(stream, incident)
+            self._log(f"[{stream.camera_id}] Incident {incident['type']} confirmed.")
+        else:
+            dispatched = self.responder.run(incident)
+            self.reporter.submit(incident, after=dispatched)
+            self._log(f"[{stream.camera_id}] Incident {incident['type']} confirmed. Report queued.")
+        # Stop this camera after one incident; the others keep running
+        stream.stop_event.set()
+
+    def _serving(self):
+        if self.persistent and not self._stopping.is_set():
+            return True
+        return not all(stream.finished for stream in self.streams)
+
+    def run(self):
+        with self.lock:
+            self.running = True
+            for stream in self.streams:
+                self._start_stream(stream)
+        self._log(f"Multi-camera runtime serving {len(self.streams)} camera(s)")
+
+        try:
+            while self._serving():
+                if self.persistent:
+                    self._reap()
+                self._frames_ready.clear()
+                batch = self._next_batch()
+                if not batch:
+                    self._frames_ready.wait(timeout=0.1)
+                    continue
+
+                frames = [frame for _, _, frame in batch]
+                streams = [stream.camera_id for stream, _, _ in batch]
+                results = self.analyzer.run_batch(frames, streams)
+                if self.on_first_frame is not None:
+                    self.on_first_frame()
+                    self.on_first_frame = None
+                ticks = []
+                for (stream, frame_count, frame), detections in zip(batch, results):
+                    if not stream.stop_event.is_set():
+                        ticks.append((stream, detections, frame_count, self._record_frame(stream, frame_count, frame)))
+                    else:
+                        stream.extractor.release(frame)
+                for stream, incident in self._aggregate(ticks):
+                    self._handle_incident(stream, incident)
+        finally:
+            self.stop()
+            with self.lock:
+                self.running = False
+                streams = self.streams
+            for stream in streams:
+                self._close_stream(stream)
+            if self.evidence_executor is not None:
+                self.evidence_executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stopping.set()
+        for stream in self.streams:
+            stream.stop_event.set()
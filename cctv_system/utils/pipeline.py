@@ -0,0 +1,318 @@
+import os
+import queue
+import threading
+import cv2
+from tools.detections import Detections
+from utils.metrics import Metrics
+
+_END = object()
+
+class FramePipeline:
+    """
+    Runs decode, inference, snapshot writing (or evidence compression) and aggregation as separate stages
+    joined by bounded queues. Full queues block the upstream stage (backpressure),
+    and the aggregation stage reorders results so frames are aggregated in decode order.
+    With an InferenceWorkerPool, inference runs in worker processes instead of analyzer
+    threads: a dispatch thread hands them frames through the shared-memory ring and a
+    collect thread passes their results on in decode order.
+    """
+
+    def __init__(self, extractor, analyzers, aggregator, snapshot_dir,
+                 queue_size=8, snapshot_workers=2, logger=None, evidence=None, workers=None):
+        self.extractor = extractor
+        self.analyzers = analyzers
+        self.aggregator = aggregator
+        self.snapshot_dir = snapshot_dir
+        self.queue_size = queue_size
+        self.snapshot_workers = snapshot_workers
+        self.logger = logger
+        # With an EvidenceRecorder the snapshot stage only compresses frames for the
+        # ring buffer; the aggregator decides which ones are written to disk.
+        self.evidence = evidence
+        self.workers = workers
+        # Frames handed to the workers, in decode order, for the collect thread
+        self.dispatched = queue.Queue(maxsize=workers.capacity) if workers is not None else None
+
+        self.stop_event = threading.Event()
+        self.analyze_queue = queue.Queue(maxsize=queue_size)
+        self.snapshot_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        self.errors = []
+        self._threads = []
+        self._lock = threading.Lock()
+        self._remaining = {}
+        self.metrics = Metrics()
+
+    def stop(self):
+        """Ask every stage to stop taking new work and drain what is in flight."""
+        self.stop_event.set()
+
+    def _put(self, q, item):
+        # Block while the downstream stage is busy, but never past a stop request
+        # for real work; end markers must always get through.
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.stop_event.is_set() and item is not _END:
+                    return False
+
+    def _forward(self, q, item, frame):
+        # A frame that is dropped during a stop still has to go back to the extractor's pool
+        if not self._put(q, item):
+            self.extractor.release(frame)
+
+    def _finish_stage(self, stage, downstream, downstream_workers):
+        # The last worker of a stage to finish forwards one end marker per downstream worker.
+        with self._lock:
+            self._remaining[stage] -= 1
+            last = self._remaining[stage] == 0
+        if last:
+            for _ in range(downstream_workers):
+                self._put(downstream, _END)
+
+    def _fail(self, stage, error):
+        if self.logger:
+            self.logger.error(f"Pipeline stage '{stage}' failed: {error}", exc_info=True)
+        self.errors.append(error)
+        self.stop_event.set()
+
+    def _decode_stage(self):
+        seq = 0
+        frames = self.extractor.run()
+        try:
+            for frame_count, frame in frames:
+                if self.stop_event.is_set():
+                    break
+                if not self._put(self.analyze_queue, (seq, frame_count, frame)):
+                    self.extractor.release(frame)
+                    break
+                seq += 1
+        except Exception as e:
+            self._fail("decode", e)
+        finally:
+            frames.close()
+            self._finish_stage("decode", self.analyze_queue, 1 if self.workers is not None else len(self.analyzers))
+
+    def _analyze_stage(self, analyzer):
+        if analyzer.batch_size > 1:
+            return self._analyze_batched_stage(analyzer)
+        try:
+            while True:
+                item = self.analyze_queue.get()
+                if item is _END:
+                    break
+                if self.stop_event.is_set():
+                    self.extractor.release(item[2])
+                    continue
+                seq, frame_count, frame = item
+                detections = analyzer.run(frame)
+                self._forward(self.snapshot_queue, (seq, frame_count, frame, detections), frame)
+        except Exception as e:
+            self._fail("analyze", e)
+            self._drain(self.analyze_queue)
+        finally:
+            self._finish_stage("analyze", self.snapshot_queue, self.snapshot_workers)
+
+    def _analyze_batched_stage(self, analyzer):
+        # Collect frames until the analyzer's batch is full or its max-wait deadline passes
+        ended = False
+        try:
+            while True:
+                try:
+                    item = self.analyze_queue.get(timeout=analyzer.time_until_deadline())
+                except queue.Empty:
+                    ready = analyzer.poll()
+                else:
+                    if item is _END:
+                        ended = True
+                        ready = analyzer.flush()
+                    elif self.stop_event.is_set():
+                        self.extractor.release(item[2])
+                        continue
+                    else:
+                        seq, frame_count, frame = item
+                        ready = analyzer.submit((seq, frame_count, frame), frame)
+
+                for (seq, frame_count, frame), detections in ready:
+                    if self.stop_event.is_set():
+                        self.extractor.release(frame)
+                    else:
+                        self._forward(self.snapshot_queue, (seq, frame_count, frame, detections), frame)
+                if ended:
+                    break
+        except Exception as e:
+            self._fail("analyze", e)
+            if not ended:
+                self._drain(self.analyze_queue)
+        finally:
+            self._finish_stage("analyze", self.snapshot_queue, self.snapshot_workers)
+
+    def _dispatch_stage(self):
+        # Motion gating stays in this process; it needs the frames of a stream in order
+        analyzer = self.analyzers[0]
+        try:
+            while True:
+                item = self.analyze_queue.get()
+                if item is _END:
+                    break
+                seq, frame_count, frame = item
+                if self.stop_event.is_set():
+                    self.extractor.release(frame)
+                    continue
+                gated = analyzer._is_gated(frame)
+                copied = None
+                if not gated:
+                    copied = self.workers.submit(seq, frame, timeout=0.1)
+                    # Every ring slot is in use: wait for results/snapshots to free one
+                    while copied is False and not self.stop_event.is_set():
+                        copied = self.workers.submit(seq, frame, timeout=0.1)
+                    if copied is False:
+                        self.extractor.release(frame)
+                        continue
+                if not self._put(self.dispatched, (seq, frame_count, frame, gated, copied)):
+                    self.extractor.release(frame)
+                    if copied is not None:
+                        self.workers.ring.release_slot(copied)
+        except Exception as e:
+            self._fail("dispatch", e)
+            self._drain(self.analyze_queue)
+        finally:
+            self._put(self.dispatched, _END)
+
+    def _collect_stage(self):
+        analyzer = self.analyzers[0]
+        results = {}
+        last_detections = None
+        try:
+            while True:
+                item = self.dispatched.get()
+                if item is _END:
+                    break
+                seq, frame_count, frame, gated, copied = item
+                if self.stop_event.is_set():
+                    self.extractor.release(frame)
+                    continue
+                if gated:
+                    empty = Detections(names=self.workers.names)
+                    detections = (last_detections or empty) if analyzer.reuse_detections else empty
+                else:
+                    while seq not in results and not self.stop_event.is_set():
+                        batch = self.workers.get_result(timeout=0.1)
+                        if batch is None:
+                            continue
+                        elapsed, items = batch
+                        self.metrics.observe("stage_seconds", elapsed, stage="inference")
+                        self.metrics.observe("inference_seconds", elapsed)
+                        self.metrics.inc("inference_calls")
+                        self.metrics.inc("inference_frames", len(items))
+                        results.update(items)
+                    if seq not in results:
+                        self.extractor.release(frame)
+                        continue
+                    # Workers see whole frames, so an ROI only filters their detections
+                    detections = last_detections = analyzer.filter_roi(results.pop(seq), frame.shape)
+                    if copied is not None:
+                        self.workers.ring.release_slot(copied)
+                self._forward(self.snapshot_queue, (seq, frame_count, frame, detections), frame)
+        except Exception as e:
+            self._fail("analyze", e)
+            self._drain(self.dispatched)
+        finally:
+            self._finish_stage("analyze", self.snapshot_queue, self.snapshot_workers)
+
+    def _snapshot_stage(self):
+        try:
+            while True:
+                item = self.snapshot_queue.get()
+                if item is _END:
+                    break
+                if self.stop_event.is_set():
+                    self.extractor.release(item[2])
+                    continue
+                seq, frame_count, frame, detections = item
+                if self.evidence is not None:
+                    with self.metrics.timer("stage_seconds", stage="snapshot"):
+                        payload = self.evidence.buffer.compress(frame)
+                    # This is the frame's last stage: its buffer can be decoded into again
+                    self.extractor.release(frame)
+                    self._put(self.result_queue, (seq, frame_count, detections, payload))
+                    continue
+                snapshot_path = os.path.join(self.snapshot_dir, f"frame_{frame_count}.jpg")
+                with self.metrics.timer("stage_seconds", stage="snapshot"):
+                    cv2.imwrite(snapshot_path, frame)
+                self.extractor.release(frame)
+                self._put(self.result_queue, (seq, frame_count, detections, snapshot_path))
+        except Exception as e:
+            self._fail("snapshot", e)
+            self._drain(self.snapshot_queue)
+        finally:
+            self._finish_stage("snapshot", self.result_queue, 1)
+
+    def _drain(self, q):
+        # Keep consuming after a failure so upstream stages are never blocked forever.
+        while q.get() is not _END:
+            pass
+
+    def _start(self):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._remaining = {
+            "decode": 1,
+            "analyze": 1 if self.workers is not None else len(self.analyzers),
+            "snapshot": self.snapshot_workers,
+        }
+        for name, q in (("analyze", self.analyze_queue), ("snapshot", self.snapshot_queue), ("result", self.result_queue)):
+            self.metrics.set_gauge("queue_depth", q.qsize, queue=name)
+        targets = [(self._decode_stage, ())]
+        if self.workers is not None:
+            targets += [(self._dispatch_stage, ()), (self._collect_stage, ())]
+        else:
+            targets += [(self._analyze_stage, (analyzer,)) for analyzer in self.analyzers]
+        targets += [(self._snapshot_stage, ()) for _ in range(self.snapshot_workers)]
+        for target, args in targets:
+            thread = threading.Thread(target=target, args=args, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def run(self):
+        """
+        Yield (frame_count, confirmed_incidents) in decode order.
+        Closing the generator (or calling stop()) drains the stages and joins the workers.
+        """
+        self._start()
+        pending = {}
+        next_seq = 0
+        item = None
+        try:
+            while True:
+                item = self.result_queue.get()
+                if item is _END:
+                    break
+                if self.stop_event.is_set():
+                    continue
+
+                seq, frame_count, detections, frame_evidence = item
+                pending[seq] = (frame_count, detections, frame_evidence)
+
+                # Aggregate strictly in decode order for the consecutive-frame rule
+                while next_seq in pending and not self.stop_event.is_set():
+                    frame_count, detections, frame_evidence = pending.pop(next_seq)
+                    next_seq += 1
+                    if self.evidence is not None:
+                        # A compressed payload; the aggregator writes it only if it is evidence
+                        self.evidence.add_frame(frame_count, payload=frame_evidence)
+                        snapshot_path = None
+                    else:
+                        snapshot_path = frame_evidence
+                    confirmed = self.aggregator.run(detections, frame_count, snapshot_path)
+                    yield frame_count, confirmed
+        finally:
+            self.stop_event.set()
+            if item is not _END:
+                self._drain(self.result_queue)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+            for name in ("analyze", "snapshot", "result"):
+                self.metrics.remove_gauge("queue_depth", queue=name)
@@ -1,25 +1,69 @@
 import cv2
+import json
 import numpy as np
 import os
 
-def create_test_video(filename="data/sample_video.mp4", duration=5, fps=5):
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
+OBJECT_START_FRAME = 10 # The "bottle" is drawn on frames after this (0-based) index
+
+def _distractors(count, width, height, rng):
+    """Random non-green boxes: (x, y, w, h, dx, dy, color)."""
+    boxes = []
+    for _ in range(count):
+        w = int(rng.integers(width // 40 + 10, width // 8 + 20))
+        h = int(rng.integers(height // 40 + 10, height // 8 + 20))
+        boxes.append((
+            int(rng.integers(0, max(1, width - w))), int(rng.integers(0, max(1, height - h))), w, h,
+            int(rng.integers(-width // 40 - 1, width // 40 + 2)), int(rng.integers(-height // 40 - 1, height // 40 + 2)),
+            (int(rng.integers(0, 256)), int(rng.integers(0, 150)), int(rng.integers(0, 256)))
+        ))
+    return boxes
+
+def _bounce(position, limit):
+    """Reflect a free-running coordinate back into [0, limit]."""
+    if limit <= 0:
+        return 0
+    position %= 2 * limit
+    return position if position <= limit else 2 * limit - position
+
+def create_test_video(filename="data/sample_video.mp4", duration=5, fps=5,
+                      width=640, height=640, density=0, motion="static", seed=0, ground_truth=False):
+    """
+    Write a synthetic clip with the green "bottle" (mapped to smoke) from frame OBJECT_START_FRAME + 1.
+    density adds that many distractor boxes; motion="high" moves them and scrolls a noise
+    background so every frame changes. With ground_truth=True a <filename>.json sidecar
+    records the scene and the first frame (1-based, as counted by VideoTool) showing the bottle.
+    The bottle stays at a fixed position, so width and height must be at least 480.
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
     
-    height, width = 640, 640
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(filename, fourcc, fps, (width, height))
     
-    frames = duration * fps
+    frames = int(duration * fps)
+    rng = np.random.default_rng(seed)
+    distractors = _distractors(density, width, height, rng)
+    background = None
+    if motion == "high":
+        # One dim noise texture, scrolled horizontally frame by frame
+        background = rng.integers(0, 60, size=(height, width, 3), dtype=np.uint8)
     
     for i in range(frames):
         # Create a black background
-        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        if background is None:
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+        else:
+            frame = np.roll(background, i * max(1, width // 100), axis=1)
+
+        for x, y, w, h, dx, dy, color in distractors:
+            if motion == "high":
+                x, y = _bounce(x + dx * i, width - w), _bounce(y + dy * i, height - h)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, -1)
         
         # Add some text/shapes
         cv2.putText(frame, f"Frame {i}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
         
         # Simulate a "person" (which we mapped to theft) appearing after frame 10
-        if i > 10:
+        if i > OBJECT_START_FRAME:
             # Draw a stick figure or just a rectangle that looks like a person to a human, 
             # but for YOLO we need something realistic or we just hope it detects *something*.
             # Actually, drawing a simple shape won't trigger YOLO trained on real images easily.
@@ -46,5 +90,15 @@ def create_test_video(filename="data/sample_video.mp4", duration=5, fps=5):
     out.release()
     print(f"Test video created at {filename}")
 
+    if ground_truth:
+        with open(os.path.splitext(filename)[0] + ".json", "w") as f:
+            json.dump({
+                "width": width, "height": height, "fps": fps, "frames": frames,
+                "density": density, "motion": motion, "seed": seed,
+                "incident_type": "smoke",
+                "incident_start_frame": OBJECT_START_FRAME + 2 if frames > OBJECT_START_FRAME + 1 else None
+            }, f, indent=2)
+    return filename
+
 if __name__ == "__main__":
     create_test_video()